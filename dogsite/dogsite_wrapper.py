@@ -4,7 +4,9 @@ import csv
 from pathlib import Path
 import subprocess
 from tempfile import TemporaryDirectory
+from django.db import transaction
 from proteins_plus import settings
+from proteins_plus.job_handler import Phase, record_phase, run_subprocess
 from molecule_handler.models import ElectronDensityMap, ProteinSite
 
 from .models import DoGSiteInfo
@@ -24,8 +26,10 @@ class DoGSiteWrapper:
         """
         with TemporaryDirectory() as directory:
             dir_path = Path(directory)
-            DoGSiteWrapper.execute_dogsite(job, dir_path)
-            DoGSiteWrapper.load_results(job, dir_path)
+            with record_phase(job, Phase.INPUT_STAGING):
+                DoGSiteWrapper.execute_dogsite(job, dir_path)
+            with record_phase(job, Phase.RESULT_LOADING):
+                DoGSiteWrapper.load_results(job, dir_path)
 
     @staticmethod
     def execute_dogsite(job, dir_path):
@@ -64,8 +68,7 @@ class DoGSiteWrapper:
             if job.ligand_bias:
                 args.append('--useLigandsToAnnotateGrid')
 
-            logger.info('Executing command line call: %s', " ".join(args))
-            subprocess.check_call(args, stdout=subprocess.DEVNULL)
+            run_subprocess(job, args, stdout=subprocess.DEVNULL)
 
     @staticmethod
     def load_results(job, dir_path):
@@ -83,23 +86,25 @@ class DoGSiteWrapper:
             job.save()
             return
         dogsite_info = DoGSiteInfo(info=statistic_dict, parent_dogsite_job=job)
-        dogsite_info.save()
-        job.dogsite_info = dogsite_info
 
         edf_files = DoGSiteWrapper.load_result_pockets(dir_path, nof_dogsite_hits)
         # Put DoGSite results into ProteinSite models.
-        for edf_file_path in edf_files:
-            proteinsite = ProteinSite.from_edf(job.input_protein, Path(edf_file_path))
-            proteinsite.save()
-            job.output_pockets.add(proteinsite)
+        pockets = [ProteinSite.from_edf(job.input_protein, Path(edf_file_path))
+                   for edf_file_path in edf_files]
 
         density_files = DoGSiteWrapper.load_result_pocket_densities(dir_path, nof_dogsite_hits)
-        for density_file_path in density_files:
-            density_map = ElectronDensityMap.from_ccp4(density_file_path)
-            density_map.save()
-            job.output_densities.add(density_map)
-
-        job.save()
+        density_maps = [ElectronDensityMap.from_ccp4(density_file_path)
+                        for density_file_path in density_files]
+
+        # all pockets and densities are inserted with a constant number of queries
+        with transaction.atomic():
+            dogsite_info.save()
+            job.dogsite_info = dogsite_info
+            ProteinSite.bulk_create(pockets)
+            ElectronDensityMap.bulk_create(density_maps)
+            job.output_pockets.add(*pockets)
+            job.output_densities.add(*density_maps)
+            job.save()
 
     @staticmethod
     def load_result_pockets(pocket_dir, nof_results):
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dogsite', '0003_job_timings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dogsitejob',
+            index=models.Index(fields=['date_created', 'id'], name='dogsite_dog_date_cr_3da3e7_idx'),
+        ),
+    ]
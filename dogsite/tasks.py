@@ -13,7 +13,7 @@ def dogsite_task(job_id):
     :param job_id: id of the job to execute
     :type job_id: uuid
     """
-    execute_job(dogsite, job_id, DoGSiteJob, 'DoGSite')
+    execute_job(dogsite, job_id, DoGSiteJob, 'DoGSite', binary='dogsite')
 
 
 def dogsite(job):
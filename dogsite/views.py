@@ -1,14 +1,15 @@
 """DoGSite Views"""
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema
 
 from proteins_plus.serializers import ProteinsPlusJobResponseSerializer
 from proteins_plus.job_handler import submit_task
+from proteins_plus.views import ProteinsPlusReadOnlyViewSet
 from molecule_handler.models import Ligand, Protein
+from molecule_handler.serializers import ElectronDensityMapSerializer, ProteinSiteSerializer
 
 from .serializers import DoGSiteJobSerializer, DoGSiteJobSubmitSerializer, \
     DoGSiteInfoSerializer
@@ -112,13 +113,20 @@ class DoGSiteView(APIView):
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class DoGSiteJobViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class DoGSiteJobViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list of DoGSite jobs"""
     queryset = DoGSiteJob.objects.all()
     serializer_class = DoGSiteJobSerializer
+    expandable_fields = {
+        'dogsite_info': (DoGSiteInfoSerializer, ['dogsite_info']),
+        'output_pockets': (ProteinSiteSerializer, ['output_pockets']),
+        'output_densities': (ElectronDensityMapSerializer, ['output_densities']),
+    }
 
 
-class DoGSiteInfoViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class DoGSiteInfoViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list of DoGSite result info objects"""
     queryset = DoGSiteInfo.objects.all()
     serializer_class = DoGSiteInfoSerializer
+    etag_fields = ['id']
+    immutable = True
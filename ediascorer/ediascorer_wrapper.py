@@ -6,6 +6,8 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 
 from django.conf import settings
+from django.db import transaction
+from proteins_plus.job_handler import Phase, record_phase, run_subprocess
 from molecule_handler.utils import load_processed_ligands
 from molecule_handler.models import ElectronDensityMap, Protein
 from ediascorer.models import EdiaScores
@@ -26,8 +28,10 @@ class EdiascorerWrapper:
         """
         with TemporaryDirectory() as directory:
             dir_path = Path(directory)
-            EdiascorerWrapper.execute_ediascorer(job, dir_path)
-            EdiascorerWrapper.load_results(job, dir_path)
+            with record_phase(job, Phase.INPUT_STAGING):
+                EdiascorerWrapper.execute_ediascorer(job, dir_path)
+            with record_phase(job, Phase.RESULT_LOADING):
+                EdiascorerWrapper.load_results(job, dir_path)
 
     @staticmethod
     def execute_ediascorer(job, directory):
@@ -40,7 +44,9 @@ class EdiascorerWrapper:
         :raises CalledProcessError: If an error occurs during Ediascorer execution
         """
         if job.electron_density_map is None and job.density_file_pdb_code is not None:
-            job.electron_density_map = ElectronDensityMap.from_pdb_code(job.density_file_pdb_code)
+            with record_phase(job, Phase.EXTERNAL_FETCH):
+                job.electron_density_map = ElectronDensityMap.from_pdb_code(
+                    job.density_file_pdb_code)
             job.save()
         if not job.electron_density_map:
             raise RuntimeError(f"No electron density input available")
@@ -59,8 +65,7 @@ class EdiascorerWrapper:
             args.extend(['--ligand', ligand_file.name])
 
         try:
-            logger.info('Executing command line call: %s', " ".join(args))
-            subprocess.check_call(args)
+            run_subprocess(job, args)
         except subprocess.CalledProcessError as error:
             # Diese beiden exit codes werden vom Ediascorer zurückgegeben, je nach dem
             # ob man das Programm mit oder ohne Liganden startet. In beiden Fällen
@@ -104,10 +109,11 @@ class EdiascorerWrapper:
         :param path: Path to the output directory
         :type path: Path
         """
-        EdiascorerWrapper.load_scored_protein(job, path)
-        EdiascorerWrapper.load_edia_scores(job, path)
-        load_processed_ligands(path, job.output_protein)
-        job.save()
+        with transaction.atomic():
+            EdiascorerWrapper.load_scored_protein(job, path)
+            EdiascorerWrapper.load_edia_scores(job, path)
+            load_processed_ligands(path, job.output_protein)
+            job.save()
 
     @staticmethod
     def load_scored_protein(job, path):
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.7 on 2026-10-17 16:10
+
+from django.db import migrations, models
+import proteins_plus.fields
+
+APP_LABEL = 'ediascorer'
+FIELDS = [
+    ('ediascores', 'atom_scores'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ediascorer', '0002_job_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ediascores',
+            name='atom_scores_compressed',
+            field=proteins_plus.fields.CompressedJSONField(null=True),
+        ),
+        proteins_plus.fields.compress_field_values(APP_LABEL, FIELDS),
+        # the defaults allow to add the plain fields again when migrating backwards
+        migrations.AlterField(
+            model_name='ediascores',
+            name='atom_scores',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RemoveField(
+            model_name='ediascores',
+            name='atom_scores',
+        ),
+        migrations.RenameField(
+            model_name='ediascores',
+            old_name='atom_scores_compressed',
+            new_name='atom_scores',
+        ),
+        migrations.AlterField(
+            model_name='ediascores',
+            name='atom_scores',
+            field=proteins_plus.fields.CompressedJSONField(),
+        ),
+    ]
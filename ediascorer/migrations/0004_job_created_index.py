@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ediascorer', '0003_compressed_atom_scores'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ediajob',
+            index=models.Index(fields=['date_created', 'id'], name='ediascorer__date_cr_1e38d1_idx'),
+        ),
+    ]
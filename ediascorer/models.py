@@ -1,6 +1,7 @@
 """Ediascorer database models"""
 from django.db import models
 
+from proteins_plus.fields import CompressedJSONField
 from proteins_plus.models import ProteinsPlusJob, ProteinsPlusBaseModel
 from molecule_handler.models import Protein, ElectronDensityMap, Ligand
 
@@ -8,7 +9,7 @@ from molecule_handler.models import Protein, ElectronDensityMap, Ligand
 class EdiaScores(ProteinsPlusBaseModel):
     """Django Model for storing atom scores as json strings"""
     parent_edia_job = models.OneToOneField('EdiaJob', on_delete=models.CASCADE)
-    atom_scores = models.JSONField()
+    atom_scores = CompressedJSONField()
     structure_scores = models.JSONField()
 
 
@@ -13,7 +13,7 @@ def ediascore_protein_task(job_id):
     :param job_id: Database id of the job object to be executed
     :type job_id: int
     """
-    execute_job(ediascore_protein, job_id, EdiaJob, 'EDIAscorer')
+    execute_job(ediascore_protein, job_id, EdiaJob, 'EDIAscorer', binary='ediascorer')
 
 
 
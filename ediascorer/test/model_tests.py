@@ -1,4 +1,6 @@
 """tests for ediascorer database models"""
+from hashlib import blake2b
+
 from proteins_plus.test.utils import PPlusTestCase
 from molecule_handler.models import Protein
 from molecule_handler.test.utils import create_test_ligand
@@ -40,6 +42,32 @@ class ModelTests(PPlusTestCase):
         cached_ligand_job = job5.retrieve_job_from_cache()
         self.assertIsNotNone(cached_ligand_job)
 
+    def test_streamed_hash_value(self):
+        """Test the streamed hash equals the hash of the joined hashable substrings"""
+        job = create_test_edia_job()
+        hashable_string = b'_'.join([
+            job.input_protein.content_hash.encode('utf-8'),
+            b'None',
+            job.density_file_pdb_code.encode('utf-8'),
+            job.electron_density_map.content_hash.encode('utf-8')
+        ])
+        self.assertEqual(job.generate_hashable_string(), hashable_string)
+
+        job.set_hash_value()
+        self.assertEqual(job.hash_value, blake2b(hashable_string).hexdigest())
+
+    def test_density_map_content_hash(self):
+        """Test the content hash of a density map is streamed from its file"""
+        job = create_test_edia_job()
+        with open(TestConfig.density_file, 'rb') as density_file:
+            density_bytes = density_file.read()
+        self.assertEqual(
+            job.electron_density_map.content_hash, blake2b(density_bytes).hexdigest())
+        # file fields are re-read from the start on every hash
+        job.electron_density_map.set_content_hash()
+        self.assertEqual(
+            job.electron_density_map.content_hash, blake2b(density_bytes).hexdigest())
+
     def test_different_ligand_caching(self):
         """Test caching behavior with different ligands"""
         job = create_test_edia_job()
@@ -1,14 +1,15 @@
 """ediascorer api views"""
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema
 
 from proteins_plus.serializers import ProteinsPlusJobResponseSerializer
 from proteins_plus.job_handler import submit_task
+from proteins_plus.views import ProteinsPlusReadOnlyViewSet
 from molecule_handler.models import Protein, Ligand, ElectronDensityMap
+from molecule_handler.serializers import ProteinSerializer
 
 from .models import EdiaScores, EdiaJob
 from .tasks import ediascore_protein_task
@@ -87,13 +88,21 @@ class EdiascorerView(APIView):
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class EdiaJobViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class EdiaJobViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all EDIAscorer jobs"""
     queryset = EdiaJob.objects.all()
     serializer_class = EdiaJobSerializer
+    expandable_fields = {
+        'edia_scores': (EdiaScoresSerializer, ['edia_scores']),
+        'output_protein': (
+            ProteinSerializer, ['output_protein__file_blob', 'output_protein__ligand_set']),
+    }
 
 
-class EdiaScoresViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class EdiaScoresViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all EDIA scores objects"""
     queryset = EdiaScores.objects.all()
     serializer_class = EdiaScoresSerializer
+    heavy_fields = {'atom_scores': ['atom_scores']}
+    etag_fields = ['id']
+    immutable = True
@@ -3,9 +3,9 @@ import os
 import json
 import logging
 from pathlib import Path
-import subprocess
 from tempfile import TemporaryDirectory
 from proteins_plus import settings
+from proteins_plus.job_handler import Phase, record_phase, run_subprocess
 
 from .models import GeoMineInfo
 from .settings import GeoMineSettings
@@ -25,8 +25,10 @@ class GeoMineWrapper:
         """
         with TemporaryDirectory() as directory:
             dir_path = Path(directory)
-            geomine_result_path = GeoMineWrapper.execute_geomine(job, dir_path)
-            GeoMineWrapper.load_results(job, geomine_result_path)
+            with record_phase(job, Phase.INPUT_STAGING):
+                geomine_result_path = GeoMineWrapper.execute_geomine(job, dir_path)
+            with record_phase(job, Phase.RESULT_LOADING):
+                GeoMineWrapper.load_results(job, geomine_result_path)
 
     @staticmethod
     def execute_geomine(job, dir_path):
@@ -52,8 +54,7 @@ class GeoMineWrapper:
             '--query', f'{job.filter_file}',
             '--webserverOutput', str(geomine_result_path)
         ]
-        logger.info('Executing command line call: %s', " ".join(args))
-        subprocess.check_call(args)
+        run_subprocess(job, args)
         return geomine_result_path
 
     @staticmethod
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geomine', '0002_job_timings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='geominejob',
+            index=models.Index(fields=['date_created', 'id'], name='geomine_geo_date_cr_c2f674_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.7 on 2026-10-17 19:10
+
+from datetime import datetime, time
+
+from django.db import migrations, models
+import django.utils.timezone
+
+APP_LABEL = 'geomine'
+MODEL_NAME = 'geominejob'
+
+
+def copy_creation_dates(apps, schema_editor):
+    """Set the creation time of existing jobs to the start of their creation date"""
+    model = apps.get_model(APP_LABEL, MODEL_NAME)
+    for day in model.objects.values_list('date_created', flat=True).distinct():
+        model.objects.filter(date_created=day).update(
+            time_created=datetime.combine(day, time.min, tzinfo=django.utils.timezone.utc))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geomine', '0003_job_created_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='geominejob',
+            name='geomine_geo_date_cr_c2f674_idx',
+        ),
+        migrations.AddField(
+            model_name='geominejob',
+            name='time_created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_creation_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='geominejob',
+            index=models.Index(fields=['time_created', 'id'], name='geomine_geo_time_cr_7c3043_idx'),
+        ),
+    ]
@@ -13,7 +13,7 @@ def geomine_task(job_id):
     :param job_id: id of the job to execute
     :type job_id: uuid
     """
-    execute_job(geomine, job_id, GeoMineJob, 'GeoMine')
+    execute_job(geomine, job_id, GeoMineJob, 'GeoMine', binary='geomine')
 
 
 def geomine(job):
@@ -1,13 +1,13 @@
 """GeoMine Views"""
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema
 
 from proteins_plus.serializers import ProteinsPlusJobResponseSerializer
 from proteins_plus.job_handler import submit_task
+from proteins_plus.views import ProteinsPlusReadOnlyViewSet
 
 from .serializers import GeoMineJobSerializer, GeoMineJobSubmitSerializer, GeoMineInfoSerializer
 from .models import GeoMineJob, GeoMineInfo
@@ -41,13 +41,18 @@ class GeoMineView(APIView):
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class GeoMineJobViewSet(ReadOnlyModelViewSet):
+class GeoMineJobViewSet(ProteinsPlusReadOnlyViewSet):
     """GeoMine job views"""
     queryset = GeoMineJob.objects.all()
     serializer_class = GeoMineJobSerializer
+    expandable_fields = {
+        'geomine_info': (GeoMineInfoSerializer, ['geomine_info']),
+    }
 
 
-class GeoMineInfoViewSet(ReadOnlyModelViewSet):
+class GeoMineInfoViewSet(ProteinsPlusReadOnlyViewSet):
     """GeoMine info views"""
     queryset = GeoMineInfo.objects.all()
     serializer_class = GeoMineInfoSerializer
+    etag_fields = ['id']
+    immutable = True
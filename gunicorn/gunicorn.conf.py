@@ -44,6 +44,13 @@ backlog = 2048
 #       can be seen at
 #       http://docs.gunicorn.org/en/latest/settings.html#worker-class
 #
+#   threads - For the gthread worker class the number of threads
+#       handling requests in each worker. Clients waiting on the job
+#       status endpoints block a thread instead of a whole worker.
+#       At most JOB_STATUS_MAX_WAITERS threads of a worker wait, the
+#       other clients get the current status right away, so keep it
+#       below this number. Every thread may hold a database connection.
+#
 #   worker_connections - For the eventlet and gevent worker classes
 #       this limits the maximum number of simultaneous clients that
 #       a single process can handle.
@@ -67,7 +74,8 @@ backlog = 2048
 #
 
 workers = 4  # modified
-worker_class = 'sync'
+worker_class = 'gthread'  # modified
+threads = 16  # modified
 worker_connections = 1000
 timeout = 30
 keepalive = 2
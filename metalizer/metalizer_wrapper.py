@@ -2,9 +2,9 @@
 import json
 import logging
 from pathlib import Path
-import subprocess
 from tempfile import TemporaryDirectory
 from proteins_plus import settings
+from proteins_plus.job_handler import Phase, record_phase, run_subprocess
 from molecule_handler.models import Protein
 
 from .models import MetalizerInfo
@@ -24,9 +24,11 @@ class MetalizerWrapper:
         """
         with TemporaryDirectory() as directory:
             dir_path = Path(directory)
-            metalized_protein_path, metalizer_result_path = \
-                MetalizerWrapper.execute_metalizer(job, dir_path)
-            MetalizerWrapper.load_results(job, metalized_protein_path, metalizer_result_path)
+            with record_phase(job, Phase.INPUT_STAGING):
+                metalized_protein_path, metalizer_result_path = \
+                    MetalizerWrapper.execute_metalizer(job, dir_path)
+            with record_phase(job, Phase.RESULT_LOADING):
+                MetalizerWrapper.load_results(job, metalized_protein_path, metalizer_result_path)
 
     @staticmethod
     def execute_metalizer(job, dir_path):
@@ -53,8 +55,7 @@ class MetalizerWrapper:
                     '--max_free_sites', str(0.25),
                     '--output', str(metalized_protein_path)
                 ]
-                logger.info('Executing command line call: %s', " ".join(args))
-                subprocess.check_call(args, stdout=metalizer_result_file)
+                run_subprocess(job, args, stdout=metalizer_result_file)
         return metalized_protein_path, metalizer_result_path
 
     @staticmethod
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metalizer', '0002_job_timings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='metalizerjob',
+            index=models.Index(fields=['date_created', 'id'], name='metalizer_m_date_cr_4840e1_idx'),
+        ),
+    ]
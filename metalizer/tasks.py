@@ -13,7 +13,7 @@ def metalize_task(job_id):
     :param job_id: id of the job to execute
     :type job_id: uuid
     """
-    execute_job(metalize, job_id, MetalizerJob, 'Metalizer')
+    execute_job(metalize, job_id, MetalizerJob, 'Metalizer', binary='metalizer')
 
 
 def metalize(job):
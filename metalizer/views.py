@@ -1,14 +1,15 @@
 """Metalizer Views"""
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema
 
 from proteins_plus.serializers import ProteinsPlusJobResponseSerializer
 from proteins_plus.job_handler import submit_task
+from proteins_plus.views import ProteinsPlusReadOnlyViewSet
 from molecule_handler.models import Protein
+from molecule_handler.serializers import ProteinSerializer
 
 from .serializers import MetalizerJobSerializer, MetalizerJobSubmitSerializer, \
     MetalizerInfoSerializer
@@ -72,13 +73,20 @@ class MetalizerView(APIView):
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class MetalizerJobViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class MetalizerJobViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Metalizer job views"""
     queryset = MetalizerJob.objects.all()
     serializer_class = MetalizerJobSerializer
+    expandable_fields = {
+        'metalizer_info': (MetalizerInfoSerializer, ['metalizer_info']),
+        'output_protein': (
+            ProteinSerializer, ['output_protein__file_blob', 'output_protein__ligand_set']),
+    }
 
 
-class MetalizerInfoViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class MetalizerInfoViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Metalizer info views"""
     queryset = MetalizerInfo.objects.all()
     serializer_class = MetalizerInfoSerializer
+    etag_fields = ['id']
+    immutable = True
@@ -1,15 +1,27 @@
 """molecule_handler admin site configuration"""
 from django.contrib import admin
 
-from .models import Protein, Ligand, ElectronDensityMap, PreprocessorJob
+from .models import Protein, Ligand, ElectronDensityMap, PreprocessorJob, StructureBlob
 
 
 class ProteinAdmin(admin.ModelAdmin):
     """Protein model for visualization on admin site"""
-    readonly_fields = ('date_created', 'date_last_accessed')
+    # a select over all blobs would load and decompress every structure file
+    readonly_fields = ('date_created', 'date_last_accessed', 'file_blob')
+
+
+class StructureBlobAdmin(admin.ModelAdmin):
+    """Structure file contents for visualization on admin site without loading the contents"""
+    list_display = ('id', 'content_hash', 'size')
+    exclude = ('content',)
+    readonly_fields = ('content_hash', 'size')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('content')
 
 
 admin.site.register(Protein, ProteinAdmin)
+admin.site.register(StructureBlob, StructureBlobAdmin)
 admin.site.register(Ligand)
 admin.site.register(ElectronDensityMap)
 admin.site.register(PreprocessorJob)
@@ -1,9 +1,79 @@
 """Handle request to local and external resources"""
+from contextlib import nullcontext
 import gzip
+from hashlib import blake2b
+import io
+import os
+import random
+import shutil
 from abc import ABC, abstractmethod
 from django.conf import settings
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from proteins_plus.metrics import EXTERNAL_FETCH_DURATION
+from .fetch_cache import CHUNK_SIZE, FetchCache
+
+
+class ResourceNotFoundError(RuntimeError):
+    """The requested entry does not exist at the external resource"""
+
+
+def _request_error(status_code, message):
+    """Build the error of a failed request
+
+    :param status_code: http status code of the response
+    :type status_code: int
+    :param message: error message
+    :type message: str
+    :return: ResourceNotFoundError if the entry does not exist, otherwise RuntimeError
+    :rtype: RuntimeError
+    """
+    if status_code == 404:
+        return ResourceNotFoundError(message)
+    return RuntimeError(message)
+
+
+class JitteredRetry(Retry):
+    """Retry with an exponential backoff randomized between zero and its full value
+
+    The randomization spreads the retries of many workers that hit the same failing server.
+    """
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+
+class _DigestingWriter:
+    """File object wrapper computing the blake2b digest of all data written through it"""
+
+    def __init__(self, file):
+        self.file = file
+        self.hasher = blake2b()
+
+    def write(self, data):
+        """Write data to the wrapped file and add it to the digest
+
+        :param data: written data
+        :type data: bytes
+        :return: number of written bytes
+        :rtype: int
+        """
+        self.hasher.update(data)
+        return self.file.write(data)
+
+    def hexdigest(self):
+        """Get the digest of the data written so far
+
+        :return: blake2b hex digest
+        :rtype: str
+        """
+        return self.hasher.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
 
 
 class Resource(ABC):
@@ -12,23 +82,199 @@ class Resource(ABC):
     We mainly use this class to enforce a common interface for handling local and external
     fetching universally and enable external requests mocking for testing while keeping high
     coverage.
+
+    All resources share one HTTP session per process. Its connections are kept alive and reused
+    for all requests to the same host.
     """
+    _session = None
+    _session_pid = None
+    # whether fetched contents are bytes instead of text
+    binary = False
 
     @classmethod
     def fetch(cls, *args, **kwargs):
         """Interface method to fetch from a resource.
 
-        It is first tried to fetch locally. If this fails an external fetch is attempted.
+        It is first tried to fetch locally, then from the disk cache of previous external fetches.
+        If both fail an external fetch is attempted and its result is cached. Identical fetches of
+        other processes on this node wait for the external fetch and read its result from the
+        cache. Fetches of missing entries are not repeated within the failure ttl of the cache,
+        transient failures like timeouts or server errors are.
 
         :param args: positional arguments
         :param kwargs: named arguments
+        :raises RuntimeError: If the fetch failed or failed recently
         :return: request result
         """
-        req = cls._local_fetch(*args, **kwargs)
-        if not req:
+        key = cls._cache_key(*args, **kwargs)
+        with EXTERNAL_FETCH_DURATION.time(
+                resource=cls.__name__, source='local', outcome='failure') as labels:
+            req = cls._local_fetch(*args, **kwargs)
+            if not req:
+                labels['source'] = 'cache'
+                with nullcontext() if key is None else FetchCache(cls.__name__).lock(key):
+                    req = cls._cache_fetch(key)
+                    if not req:
+                        labels['source'] = 'external'
+                        req = cls._cached_external_fetch(key, *args, **kwargs)
+            labels['outcome'] = 'success'
+        return req
+
+    @classmethod
+    def fetch_to_file(cls, file, *args, **kwargs):
+        """Interface method to fetch from a resource into a file.
+
+        Works like fetch, but resources reading large files copy and download them chunk by chunk,
+        so their content never has to fit into memory.
+
+        :param file: readable and writable binary file, the content is written at its position
+        :type file: file object
+        :param args: positional arguments
+        :param kwargs: named arguments
+        :raises RuntimeError: If the fetch failed or failed recently
+        :return: blake2b hex digest of the written content
+        :rtype: str
+        """
+        key = cls._cache_key(*args, **kwargs)
+        writer = _DigestingWriter(file)
+        with EXTERNAL_FETCH_DURATION.time(
+                resource=cls.__name__, source='local', outcome='failure') as labels:
+            if not cls._local_fetch_to_file(writer, *args, **kwargs):
+                labels['source'] = 'cache'
+                with nullcontext() if key is None else FetchCache(cls.__name__).lock(key):
+                    if not cls._cache_fetch_to_file(key, writer):
+                        labels['source'] = 'external'
+                        # a corrupted cache entry may have been written and truncated again
+                        writer = _DigestingWriter(file)
+                        cls._cached_external_fetch_to_file(key, writer, *args, **kwargs)
+            labels['outcome'] = 'success'
+        return writer.hexdigest()
+
+    @classmethod
+    def _cache_key(cls, *args, **kwargs):
+        """Build the key of a fetch in the disk cache. Codes are not case sensitive.
+
+        :param args: positional arguments
+        :param kwargs: named arguments
+        :return: cache key or None if the fetch cannot be cached
+        :rtype: str or None
+        """
+        values = list(args) + [kwargs[name] for name in sorted(kwargs)]
+        if not values or any(value is None for value in values):
+            return None
+        return '_'.join(str(value).lower() for value in values)
+
+    @classmethod
+    def _cache_fetch(cls, key):
+        """Tries to read the result of a previous external fetch from the disk cache.
+
+        :param key: cache key or None if the fetch cannot be cached
+        :type key: str or None
+        :raises ResourceNotFoundError: If the entry was missing within the failure ttl
+        :return: cached result or None on failure
+        """
+        buffer = io.BytesIO()
+        if not cls._cache_fetch_to_file(key, buffer):
+            return None
+        content = buffer.getvalue()
+        return bytearray(content) if cls.binary else content.decode('utf-8')
+
+    @classmethod
+    def _cache_fetch_to_file(cls, key, file):
+        """Tries to copy the result of a previous external fetch from the disk cache into a file.
+
+        :param key: cache key or None if the fetch cannot be cached
+        :type key: str or None
+        :param file: binary file to write to
+        :type file: file object
+        :raises ResourceNotFoundError: If the entry was missing within the failure ttl
+        :return: Whether the result was copied
+        :rtype: bool
+        """
+        if key is None:
+            return False
+        cache = FetchCache(cls.__name__)
+        failure = cache.get_failure(key)
+        if failure is not None:
+            raise ResourceNotFoundError(
+                f'{failure}\nThe fetch failed recently and is not retried yet.')
+        return cache.copy_to(key, file)
+
+    @classmethod
+    def _cached_external_fetch(cls, key, *args, **kwargs):
+        """Fetch externally and store the result or a missing entry in the disk cache.
+
+        :param key: cache key or None if the fetch cannot be cached
+        :type key: str or None
+        :param args: positional arguments
+        :param kwargs: named arguments
+        :return: request result
+        """
+        try:
             req = cls._external_fetch(*args, **kwargs)
+        except ResourceNotFoundError as error:
+            if key is not None:
+                FetchCache(cls.__name__).put_failure(key, str(error))
+            raise
+        if key is not None and req:
+            FetchCache(cls.__name__).put(key, bytes(req) if cls.binary else req.encode('utf-8'))
         return req
 
+    @classmethod
+    def _cached_external_fetch_to_file(cls, key, file, *args, **kwargs):
+        """Fetch externally into a file and store the result or a missing entry in the disk cache.
+
+        :param key: cache key or None if the fetch cannot be cached
+        :type key: str or None
+        :param file: readable and writable binary file
+        :type file: file object
+        :param args: positional arguments
+        :param kwargs: named arguments
+        """
+        start = file.tell()
+        try:
+            cls._external_fetch_to_file(file, *args, **kwargs)
+        except ResourceNotFoundError as error:
+            if key is not None:
+                FetchCache(cls.__name__).put_failure(key, str(error))
+            raise
+        if key is not None and file.tell() > start:
+            file.seek(start)
+            FetchCache(cls.__name__).put_file(key, file)
+
+    @classmethod
+    def _local_fetch_to_file(cls, file, *args, **kwargs):
+        """Write the result of a local fetch into a file.
+
+        Resources reading large files override this to copy them chunk by chunk.
+
+        :param file: binary file to write to
+        :type file: file object
+        :param args: positional arguments
+        :param kwargs: named arguments
+        :return: Whether the local fetch succeeded
+        :rtype: bool
+        """
+        req = cls._local_fetch(*args, **kwargs)
+        if not req:
+            return False
+        file.write(req if cls.binary else req.encode('utf-8'))
+        return True
+
+    @classmethod
+    def _external_fetch_to_file(cls, file, *args, **kwargs):
+        """Write the result of an external fetch into a file.
+
+        Resources downloading large files override this to stream them chunk by chunk.
+
+        :param file: binary file to write to
+        :type file: file object
+        :param args: positional arguments
+        :param kwargs: named arguments
+        """
+        req = cls._external_fetch(*args, **kwargs)
+        file.write(req if cls.binary else req.encode('utf-8'))
+
     @classmethod
     @abstractmethod
     def _local_fetch(cls, *args, **kwargs):
@@ -54,17 +300,61 @@ class Resource(ABC):
         pass
 
     @classmethod
-    @abstractmethod
-    def _external_request(cls, *args, **kwargs):
-        """Abstract method that should perform the actual external request. This is explicitly
-        a separate method so external request can be mocked during testing. In this way we can
-        keep a high test coverage.
+    def _external_request(cls, url, stream=False):
+        """Makes a get request to url with the shared session and returns the result.
 
-        :param args: positional arguments
-        :param kwargs: named arguments
-        :return: request result
+        This is explicitly a separate method so external request can be mocked during testing. In
+        this way we can keep a high test coverage. Server errors, connection errors and timeouts
+        are retried as configured in settings.EXTERNAL_REQUESTS. The response of the last attempt
+        is returned if the server keeps failing.
+
+        :param url: The URL.
+        :param stream: Whether the body is read on demand with iter_content instead of at once.
+            Streamed responses have to be closed.
+        :return: The response.
         """
-        pass
+        timeout = (settings.EXTERNAL_REQUESTS['connect_timeout'],
+                   settings.EXTERNAL_REQUESTS['read_timeout'])
+        return Resource.get_session().get(url, timeout=timeout, stream=stream)
+
+    @staticmethod
+    def get_session():
+        """Get the HTTP session of this process, creating it on first use
+
+        Forked processes like celery workers create their own session, so pooled connections are
+        never shared between processes.
+
+        :return: HTTP session
+        :rtype: requests.Session
+        """
+        if Resource._session is None or Resource._session_pid != os.getpid():
+            config = settings.EXTERNAL_REQUESTS
+            retry = JitteredRetry(
+                total=config['retries'],
+                backoff_factor=config['backoff_factor'],
+                status_forcelist=range(500, 600),
+                allowed_methods=frozenset(['GET', 'HEAD']),
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(
+                pool_connections=config['pool_connections'],
+                pool_maxsize=config['pool_maxsize'],
+                max_retries=retry
+            )
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            Resource._session = session
+            Resource._session_pid = os.getpid()
+        return Resource._session
+
+    @staticmethod
+    def close_session():
+        """Close the HTTP session of this process, the next request creates a new one"""
+        if Resource._session is not None and Resource._session_pid == os.getpid():
+            Resource._session.close()
+        Resource._session = None
+        Resource._session_pid = None
 
 
 class PDBResource(Resource):
@@ -100,22 +390,14 @@ class PDBResource(Resource):
         url = f'{settings.URLS["pdb_files"]}{pdb_code}.{file_type}'
         req = cls._external_request(url)
         if req.status_code != 200:
-            raise RuntimeError(
+            raise _request_error(
+                req.status_code,
                 f"Error while retrieving pdb file with pdb code {pdb_code}\n" +
                 f"Request: GET {url}\n" +
                 f"Response: \n{req.text}")
         file_string = req.text
         return file_string
 
-    @classmethod
-    def _external_request(cls, url):
-        """Makes a get request to url and returns the result.
-
-        :param url: The URL.
-        :return: The response.
-        """
-        return requests.get(url)
-
 
 class AlphaFoldResource(Resource):
     """Handles fetching AlphaFoldDB entries"""
@@ -153,7 +435,8 @@ class AlphaFoldResource(Resource):
         url = f'{settings.URLS["alphafold_files"]}{uniprot_code.upper()}'
         req = cls._external_request(url)
         if req.status_code != 200:
-            raise RuntimeError(
+            raise _request_error(
+                req.status_code,
                 "Error while retrieving AF-PDB prediction info file with uniprot code"
                 f" {uniprot_code}\n" +
                 f"Request: GET {url}\n" +
@@ -169,43 +452,70 @@ class AlphaFoldResource(Resource):
         structure_url = prediction_data[0]['pdbUrl']
         req2 = cls._external_request(structure_url)
         if req2.status_code != 200:
-            raise RuntimeError(
+            raise _request_error(
+                req2.status_code,
                 f"Error while retrieving AF-PDB file with uniprot code {uniprot_code}\n" +
                 f"Request: GET {url}\n" +
                 f"Response: \n{req2.text}")
         file_string = req2.text
         return file_string
 
-    @classmethod
-    def _external_request(cls, url):
-        """Makes a get request to url and returns the result.
-
-        :param url: The URL.
-        :return: The response.
-        """
-        return requests.get(url)
-
 
 class DensityResource(Resource):
-    """Handles fetching density files"""
+    """Handles fetching density files
+
+    Density maps can be several hundred MB large. Use fetch_to_file to copy and download them
+    chunk by chunk instead of loading them into memory.
+    """
+    binary = True
 
     @classmethod
-    def _local_fetch(cls, pdb_code):
-        """Tries to read the density file corresponding to pdb_code from disk.
+    def _local_path(cls, pdb_code):
+        """Get the path of the density file corresponding to pdb_code in the local mirror.
 
         :param pdb_code: The PDB-code.
-        :return: The file string of the PDB file or None on failure.
+        :return: The file path or None if the file is not mirrored.
+        :rtype: pathlib.Path or None
         """
         if pdb_code is None:
             return None
         local_path = settings.LOCAL_DENSITY_MIRROR_DIR / f'{pdb_code.lower()}.ccp4'
         if not local_path.is_file():
             return None
+        return local_path
+
+    @classmethod
+    def _local_fetch(cls, pdb_code):
+        """Tries to read the density file corresponding to pdb_code from disk.
+
+        :param pdb_code: The PDB-code.
+        :return: The file string of the PDB file or None on failure.
+        """
+        local_path = cls._local_path(pdb_code)
+        if local_path is None:
+            return None
         # read density file from local mirror
         with open(local_path, 'rb') as density_file:
             file_bytes = density_file.read()
         return file_bytes
 
+    @classmethod
+    def _local_fetch_to_file(cls, file, pdb_code):
+        """Tries to copy the density file corresponding to pdb_code from disk chunk by chunk.
+
+        :param file: binary file to write to
+        :type file: file object
+        :param pdb_code: The PDB-code.
+        :return: Whether the file is mirrored locally
+        :rtype: bool
+        """
+        local_path = cls._local_path(pdb_code)
+        if local_path is None:
+            return False
+        with open(local_path, 'rb') as density_file:
+            shutil.copyfileobj(density_file, file, CHUNK_SIZE)
+        return True
+
     @classmethod
     def _external_fetch(cls, pdb_code):
         """Fetch electron density file from server and return it as bytearray.
@@ -215,20 +525,40 @@ class DensityResource(Resource):
         :return: Density in ccp4 format as bytearray or None.
         :rtype: bytearray or None if failure
         """
-        url = f'{settings.URLS["density_files"]}{pdb_code}.ccp4'
-        req = cls._external_request(url)
-        if req.status_code != 200:
-            raise RuntimeError(
-                f"Error while retrieving ccp4 file with pdb code {pdb_code}\n" +
-                f"Request: GET {url}\n" +
-                f"Response: \n{req.text}")
-        return bytearray(req.content)
+        buffer = io.BytesIO()
+        cls._external_fetch_to_file(buffer, pdb_code)
+        return bytearray(buffer.getvalue())
 
     @classmethod
-    def _external_request(cls, url):
-        """Makes a get request to url and returns the result.
+    def _external_fetch_to_file(cls, file, pdb_code):
+        """Download electron density file from server chunk by chunk into a file.
 
-        :param url: The URL.
-        :return: The response.
+        :param file: binary file to write to
+        :type file: file object
+        :param pdb_code: pdb code of protein
+        :type pdb_code: str
+        :raises: RuntimeError if request fails or the download is incomplete.
         """
-        return requests.get(url)
+        url = f'{settings.URLS["density_files"]}{pdb_code}.ccp4'
+        req = cls._external_request(url, stream=True)
+        try:
+            if req.status_code != 200:
+                raise _request_error(
+                    req.status_code,
+                    f"Error while retrieving ccp4 file with pdb code {pdb_code}\n" +
+                    f"Request: GET {url}\n" +
+                    f"Response: \n{req.text}")
+            size = 0
+            for chunk in req.iter_content(CHUNK_SIZE):
+                file.write(chunk)
+                size += len(chunk)
+            # the content length of encoded responses is the size before decoding
+            expected_size = req.headers.get('Content-Length')
+            if expected_size is not None and 'Content-Encoding' not in req.headers \
+                    and int(expected_size) != size:
+                raise RuntimeError(
+                    f"Incomplete ccp4 file with pdb code {pdb_code}: " +
+                    f"received {size} of {expected_size} bytes\n" +
+                    f"Request: GET {url}")
+        finally:
+            req.close()
@@ -0,0 +1,443 @@
+"""Size bounded disk cache of files fetched from external resources
+
+Every worker node keeps its own cache in settings.FETCH_CACHE['directory']. Entries are written to
+a temporary file first and moved into place, so processes sharing the cache never read partial
+entries. Every entry ends with the digest of its content, corrupted entries are detected and
+dropped. Entries are read and written in chunks, so large files never have to fit into memory.
+The least recently used entries are evicted when the cache grows beyond its maximum size. Writers
+add to an estimate of the cache size shared by all processes, so the cache directory is only
+scanned when the estimate exceeds the maximum size or has not been checked for SIZE_SCAN_INTERVAL.
+
+Definitive misses are remembered for settings.FETCH_CACHE['failure_ttl'] seconds. Processes
+fetching the same key hold a lock file of that key, so only one of them downloads it and the others
+read the result. Fetches of different keys never wait for each other.
+"""
+from contextlib import contextmanager
+import fcntl
+from hashlib import blake2b
+import io
+import logging
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+import time
+from django.conf import settings
+
+from proteins_plus.metrics import FETCH_CACHE_EVICTIONS, FETCH_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 32
+CHUNK_SIZE = 1024 * 1024
+ENTRY_SUFFIX = '.entry'
+FAILURE_SUFFIX = '.failed'
+TEMP_SUFFIX = '.tmp'
+LOCK_SUFFIX = '.lock'
+# holds the estimated size of all entries and the time of the last scan of the cache directory
+SIZE_FILE = '.size'
+SIZE_SCAN_INTERVAL = 3600  # seconds
+LOCK_POLL_INTERVAL = 0.1  # seconds
+# temporary files of writers that did not finish are removed after this time
+STALE_TEMP_AGE = 3600  # seconds
+
+
+def _digested_chunks(file):
+    """Read a file chunk by chunk followed by the digest of its content
+
+    :param file: readable binary file
+    :type file: file object
+    :return: chunks of the entry
+    :rtype: generator
+    """
+    hasher = blake2b(digest_size=DIGEST_SIZE)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        hasher.update(chunk)
+        yield chunk
+    yield hasher.digest()
+
+
+def _remove(path):
+    """Remove a file that may have been removed concurrently
+
+    :param path: file path
+    :type path: Path
+    :return: Whether the file was removed by this call
+    :rtype: bool
+    """
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _write_atomic(path, chunks):
+    """Write a file through a temporary file, so readers never see partial data
+
+    Failing writes, e.g. on a full disk, are logged and do not raise.
+
+    :param path: file path
+    :type path: Path
+    :param chunks: chunks of the file content
+    :type chunks: iterable of bytes
+    :return: Whether the file was written
+    :rtype: bool
+    """
+    temp_path = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(dir=path.parent, prefix='.', suffix=TEMP_SUFFIX,
+                                delete=False) as temp_file:
+            temp_path = Path(temp_file.name)
+            for chunk in chunks:
+                temp_file.write(chunk)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except OSError as error:
+        logger.warning('Could not write fetch cache file %s: %s', path, error)
+        if temp_path is not None:
+            _remove(temp_path)
+        return False
+    return True
+
+
+@contextmanager
+def _locked_size_file():
+    """Open and exclusively lock the file holding the size estimate of the cache
+
+    :raises OSError: If the file cannot be opened
+    :return: the size file opened for reading and writing
+    :rtype: file object
+    """
+    directory = FetchCache.get_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    size_file = os.fdopen(os.open(directory / SIZE_FILE, os.O_RDWR | os.O_CREAT, 0o666), 'r+')
+    with size_file:
+        fcntl.flock(size_file, fcntl.LOCK_EX)
+        yield size_file
+
+
+def _write_size(size_file, size, scanned):
+    """Replace the size estimate of the cache in the locked size file
+
+    :param size_file: the size file opened by _locked_size_file
+    :type size_file: file object
+    :param size: estimated total size of all entries in bytes
+    :type size: int
+    :param scanned: time of the last scan of all entries in seconds since the epoch
+    :type scanned: float
+    """
+    size_file.seek(0)
+    size_file.truncate()
+    size_file.write(f'{size} {scanned}')
+
+
+def _acquire_lock(path, deadline):
+    """Exclusively lock a lock file that is removed by its holder when it is released
+
+    The holder removes the lock file before releasing it. A waiter that locked a removed file
+    afterwards opens the new file and tries again.
+
+    :param path: lock file path
+    :type path: Path
+    :param deadline: monotonic time after which to give up waiting
+    :type deadline: float
+    :return: locked file or None if it could not be locked
+    :rtype: file object or None
+    """
+    while True:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            lock_file = path.open('a')  # pylint: disable=consider-using-with
+        except OSError as error:
+            logger.warning('Could not open fetch cache lock %s: %s', path, error)
+            return None
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    logger.warning('Timeout waiting for fetch cache lock %s', path)
+                    lock_file.close()
+                    return None
+                time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            if os.path.samestat(os.fstat(lock_file.fileno()), path.stat()):
+                return lock_file
+        except FileNotFoundError:
+            pass
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+class FetchCache:
+    """Disk cache of the files fetched from one resource"""
+
+    def __init__(self, namespace):
+        """Construct a new cache
+
+        :param namespace: name of the resource, entries of different resources never collide
+        :type namespace: str
+        """
+        self.namespace = namespace
+
+    @staticmethod
+    def is_enabled():
+        """Check whether the cache is enabled by a positive maximum size
+
+        :return: Whether the cache is enabled
+        :rtype: bool
+        """
+        return settings.FETCH_CACHE['max_size'] > 0
+
+    @staticmethod
+    def get_directory():
+        """Get the directory of the cache
+
+        :return: cache directory
+        :rtype: Path
+        """
+        return Path(settings.FETCH_CACHE['directory'])
+
+    def get_path(self, key, suffix=ENTRY_SUFFIX):
+        """Get the path of the entry of a key
+
+        :param key: cache key
+        :type key: str
+        :param suffix: ENTRY_SUFFIX for the content, FAILURE_SUFFIX for the failure or LOCK_SUFFIX
+            for the lock file of the key
+        :type suffix: str
+        :return: entry path
+        :rtype: Path
+        """
+        name = blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        return self.get_directory() / self.namespace / f'{name}{suffix}'
+
+    @contextmanager
+    def lock(self, key):
+        """Hold the lock of a key while fetching it
+
+        Waits at most settings.FETCH_CACHE['lock_timeout'] seconds for the lock and continues
+        without it afterwards, so a stuck process cannot block all others. Nothing is locked if
+        neither results nor failures are cached.
+
+        :param key: cache key
+        :type key: str
+        """
+        if not self.is_enabled() and settings.FETCH_CACHE['failure_ttl'] <= 0:
+            yield
+            return
+        path = self.get_path(key, LOCK_SUFFIX)
+        lock_file = _acquire_lock(path, time.monotonic() + settings.FETCH_CACHE['lock_timeout'])
+        try:
+            yield
+        finally:
+            if lock_file is not None:
+                # waiters notice that the file was removed and lock a new one
+                _remove(path)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def get(self, key):
+        """Read the content of a key and mark it as recently used
+
+        :param key: cache key
+        :type key: str
+        :return: cached content or None if the key is not cached or its entry is corrupted
+        :rtype: bytes or None
+        """
+        buffer = io.BytesIO()
+        if not self.copy_to(key, buffer):
+            return None
+        return buffer.getvalue()
+
+    def copy_to(self, key, file):
+        """Copy the content of a key chunk by chunk into a file and mark it as recently used
+
+        The content is verified while it is copied. If the entry is corrupted, the file is
+        truncated to its previous position again.
+
+        :param key: cache key
+        :type key: str
+        :param file: binary file to write to
+        :type file: file object
+        :return: Whether the content was copied
+        :rtype: bool
+        """
+        if not self.is_enabled():
+            return False
+        path = self.get_path(key)
+        try:
+            entry_file = path.open('rb')  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            FETCH_CACHE_LOOKUPS.inc(resource=self.namespace, result='miss')
+            return False
+        start = file.tell()
+        hasher = blake2b(digest_size=DIGEST_SIZE)
+        with entry_file:
+            remaining = os.fstat(entry_file.fileno()).st_size - DIGEST_SIZE
+            while remaining > 0:
+                chunk = entry_file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                file.write(chunk)
+                remaining -= len(chunk)
+            digest = entry_file.read(DIGEST_SIZE)
+        if remaining != 0 or hasher.digest() != digest:
+            logger.warning('Removing corrupted fetch cache entry %s', path)
+            _remove(path)
+            file.seek(start)
+            file.truncate()
+            FETCH_CACHE_LOOKUPS.inc(resource=self.namespace, result='invalid')
+            return False
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted concurrently, the content is still valid
+            pass
+        FETCH_CACHE_LOOKUPS.inc(resource=self.namespace, result='hit')
+        return True
+
+    def put(self, key, content):
+        """Store the content of a key and evict the least recently used entries if necessary
+
+        Contents larger than the whole cache are not stored. Failing writes, e.g. on a full disk,
+        are logged and do not raise.
+
+        :param key: cache key
+        :type key: str
+        :param content: content to cache
+        :type content: bytes
+        """
+        self.put_file(key, io.BytesIO(content))
+
+    def put_file(self, key, file):
+        """Store the content of a file from its current position to its end chunk by chunk
+
+        See put for details.
+
+        :param key: cache key
+        :type key: str
+        :param file: readable binary file
+        :type file: file object
+        """
+        if not self.is_enabled():
+            return
+        start = file.tell()
+        size = file.seek(0, io.SEEK_END) - start
+        file.seek(start)
+        if DIGEST_SIZE + size > settings.FETCH_CACHE['max_size']:
+            return
+        path = self.get_path(key)
+        try:
+            replaced_size = path.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        if _write_atomic(path, _digested_chunks(file)):
+            _remove(self.get_path(key, FAILURE_SUFFIX))
+            if FetchCache.add_size(DIGEST_SIZE + size - replaced_size):
+                FetchCache.evict()
+
+    def get_failure(self, key):
+        """Get the error of a recent definitive miss of a key
+
+        :param key: cache key
+        :type key: str
+        :return: error message or None if the key did not fail within the failure ttl
+        :rtype: str or None
+        """
+        failure_ttl = settings.FETCH_CACHE['failure_ttl']
+        if failure_ttl <= 0:
+            return None
+        path = self.get_path(key, FAILURE_SUFFIX)
+        try:
+            modified = path.stat().st_mtime
+            message = path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        if modified < time.time() - failure_ttl:
+            _remove(path)
+            return None
+        FETCH_CACHE_LOOKUPS.inc(resource=self.namespace, result='failure')
+        return message
+
+    def put_failure(self, key, message):
+        """Remember the definitive miss of a key for the failure ttl
+
+        Only remember fetches that will fail again, like missing entries, and not transient
+        errors like timeouts.
+
+        :param key: cache key
+        :type key: str
+        :param message: error message
+        :type message: str
+        """
+        if settings.FETCH_CACHE['failure_ttl'] > 0:
+            _write_atomic(self.get_path(key, FAILURE_SUFFIX), [message.encode('utf-8')])
+
+    @staticmethod
+    def add_size(size):
+        """Add the size of a new entry to the size estimate shared by all processes
+
+        The estimate is not reduced when entries are removed outside of evict, so it errs on the
+        side of evicting too early. Each scan of evict resets it to the actual size.
+
+        :param size: added bytes
+        :type size: int
+        :return: Whether the cache has to be scanned by evict, because the estimate exceeds the
+            maximum size, is outdated or is not available
+        :rtype: bool
+        """
+        try:
+            with _locked_size_file() as size_file:
+                try:
+                    total_size, scanned = size_file.read().split()
+                    total_size, scanned = int(total_size) + size, float(scanned)
+                except ValueError:
+                    return True
+                _write_size(size_file, total_size, scanned)
+        except OSError as error:
+            logger.warning('Could not update the fetch cache size: %s', error)
+            return True
+        return total_size > settings.FETCH_CACHE['max_size'] \
+            or scanned < time.time() - SIZE_SCAN_INTERVAL
+
+    @staticmethod
+    def evict():
+        """Remove the least recently used entries of all resources until the cache fits its
+        maximum size
+
+        Scans the whole cache directory and resets the size estimate of add_size.
+        """
+        max_size = settings.FETCH_CACHE['max_size']
+        scanned = time.time()
+        entries = []
+        total_size = 0
+        for path in FetchCache.get_directory().glob('*/*'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.name.endswith(LOCK_SUFFIX):
+                continue
+            if path.name.endswith(TEMP_SUFFIX):
+                if stat.st_mtime < time.time() - STALE_TEMP_AGE:
+                    _remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+        if total_size > max_size:
+            for _, size, path in sorted(entries):
+                if total_size <= max_size:
+                    break
+                if _remove(path):
+                    FETCH_CACHE_EVICTIONS.inc(resource=path.parent.name)
+                total_size -= size
+        try:
+            with _locked_size_file() as size_file:
+                _write_size(size_file, total_size, scanned)
+        except OSError as error:
+            logger.warning('Could not update the fetch cache size: %s', error)
@@ -1,15 +1,26 @@
 """Clean molecule handler data"""
 import logging
 from django.core.management.base import BaseCommand
-from proteins_plus.utils import clean_up_models
-from molecule_handler.models import Protein, ElectronDensityMap
+from django.db.models import Exists, OuterRef
+from proteins_plus.utils import clean_up_models, delete_in_batches
+from molecule_handler.models import Protein, ElectronDensityMap, StructureBlob
 
 
 class Command(BaseCommand):
     """Clean molecule handler data"""
     help = 'Cleans up molecule handler models if no non-stale jobs depend on them'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', type=int, default=1000,
+                            help='Maximum number of objects to delete at once')
+
     def handle(self, *args, **options):
         logging.info('Start molecule handler clean up')
-        clean_up_models(Protein)
-        clean_up_models(ElectronDensityMap)
+        for model_type in (Protein, ElectronDensityMap):
+            removed = clean_up_models(model_type, batch_size=options['batch_size'])
+            logging.info('Removed %d %s objects', removed, model_type.__name__)
+
+        unused_blobs = StructureBlob.objects.filter(
+            ~Exists(Protein.objects.filter(file_blob=OuterRef('pk'))))
+        removed = delete_in_batches(StructureBlob, unused_blobs, options['batch_size'])
+        logging.info('Removed %d StructureBlob objects', removed)
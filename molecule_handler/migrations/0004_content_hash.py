@@ -0,0 +1,33 @@
+# Generated by Django 3.2.7 on 2026-10-17 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molecule_handler', '0003_auto_20220818_0936'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electrondensitymap',
+            name='content_hash',
+            field=models.CharField(db_index=True, default=None, editable=False, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='ligand',
+            name='content_hash',
+            field=models.CharField(db_index=True, default=None, editable=False, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='protein',
+            name='content_hash',
+            field=models.CharField(db_index=True, default=None, editable=False, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='proteinsite',
+            name='content_hash',
+            field=models.CharField(db_index=True, default=None, editable=False, max_length=128, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.7 on 2026-10-17 15:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molecule_handler', '0005_job_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StructureBlob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('content_hash', models.CharField(max_length=128, unique=True)),
+                ('content', models.TextField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='protein',
+            name='file_blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='molecule_handler.structureblob'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.7 on 2026-10-17 15:20
+
+from hashlib import blake2b
+
+from django.db import migrations
+
+
+def move_file_strings_to_blobs(apps, schema_editor):
+    """Store the structure file of every protein once in a shared blob"""
+    Protein = apps.get_model('molecule_handler', 'Protein')
+    StructureBlob = apps.get_model('molecule_handler', 'StructureBlob')
+    blob_ids = {}
+    proteins = Protein.objects.filter(file_blob__isnull=True).only('id', 'file_string')
+    for protein in proteins.iterator(chunk_size=100):
+        content_hash = blake2b(protein.file_string.encode('utf-8')).hexdigest()
+        if content_hash not in blob_ids:
+            blob_ids[content_hash] = StructureBlob.objects.create(
+                content_hash=content_hash, content=protein.file_string).id
+        Protein.objects.filter(id=protein.id).update(file_blob_id=blob_ids[content_hash])
+
+
+def move_blobs_to_file_strings(apps, schema_editor):
+    """Copy the shared structure files back into every protein"""
+    Protein = apps.get_model('molecule_handler', 'Protein')
+    StructureBlob = apps.get_model('molecule_handler', 'StructureBlob')
+    for blob in StructureBlob.objects.iterator(chunk_size=100):
+        Protein.objects.filter(file_blob_id=blob.id).update(file_string=blob.content)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molecule_handler', '0006_structure_blob'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_file_strings_to_blobs, move_blobs_to_file_strings),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.7 on 2026-10-17 15:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molecule_handler', '0007_protein_file_blob_data'),
+    ]
+
+    operations = [
+        # the default allows to add the field again when migrating backwards
+        migrations.AlterField(
+            model_name='protein',
+            name='file_string',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='protein',
+            name='file_string',
+        ),
+        migrations.AlterField(
+            model_name='protein',
+            name='file_blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='molecule_handler.structureblob'),
+        ),
+    ]
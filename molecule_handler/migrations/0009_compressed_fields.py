@@ -0,0 +1,100 @@
+# Generated by Django 3.2.7 on 2026-10-17 16:10
+
+from django.db import migrations, models
+import proteins_plus.fields
+
+APP_LABEL = 'molecule_handler'
+FIELDS = [
+    ('structureblob', 'content'),
+    ('ligand', 'file_string'),
+    ('preprocessorjobdata', 'input_protein_string'),
+    ('preprocessorjobdata', 'input_ligand_string'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molecule_handler', '0008_remove_protein_file_string'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='structureblob',
+            name='content_compressed',
+            field=proteins_plus.fields.CompressedTextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ligand',
+            name='file_string_compressed',
+            field=proteins_plus.fields.CompressedTextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='preprocessorjobdata',
+            name='input_protein_string_compressed',
+            field=proteins_plus.fields.CompressedTextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='preprocessorjobdata',
+            name='input_ligand_string_compressed',
+            field=proteins_plus.fields.CompressedTextField(null=True),
+        ),
+        proteins_plus.fields.compress_field_values(APP_LABEL, FIELDS),
+        # the defaults allow to add the plain fields again when migrating backwards
+        migrations.AlterField(
+            model_name='structureblob',
+            name='content',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='ligand',
+            name='file_string',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='structureblob',
+            name='content',
+        ),
+        migrations.RemoveField(
+            model_name='ligand',
+            name='file_string',
+        ),
+        migrations.RemoveField(
+            model_name='preprocessorjobdata',
+            name='input_protein_string',
+        ),
+        migrations.RemoveField(
+            model_name='preprocessorjobdata',
+            name='input_ligand_string',
+        ),
+        migrations.RenameField(
+            model_name='structureblob',
+            old_name='content_compressed',
+            new_name='content',
+        ),
+        migrations.RenameField(
+            model_name='ligand',
+            old_name='file_string_compressed',
+            new_name='file_string',
+        ),
+        migrations.RenameField(
+            model_name='preprocessorjobdata',
+            old_name='input_protein_string_compressed',
+            new_name='input_protein_string',
+        ),
+        migrations.RenameField(
+            model_name='preprocessorjobdata',
+            old_name='input_ligand_string_compressed',
+            new_name='input_ligand_string',
+        ),
+        migrations.AlterField(
+            model_name='structureblob',
+            name='content',
+            field=proteins_plus.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='ligand',
+            name='file_string',
+            field=proteins_plus.fields.CompressedTextField(),
+        ),
+    ]
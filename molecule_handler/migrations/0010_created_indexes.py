@@ -0,0 +1,25 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molecule_handler', '0009_compressed_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='electrondensitymap',
+            index=models.Index(fields=['date_created', 'id'], name='molecule_ha_date_cr_8af83b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='preprocessorjob',
+            index=models.Index(fields=['date_created', 'id'], name='molecule_ha_date_cr_056bc0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='protein',
+            index=models.Index(fields=['date_created', 'id'], name='molecule_ha_date_cr_9c5185_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.7 on 2026-10-17 19:40
+
+from django.db import migrations, models
+
+BATCH_SIZE = 100
+
+
+def set_sizes(apps, schema_editor):
+    """Store the size of the content of existing blobs in batches"""
+    model = apps.get_model('molecule_handler', 'StructureBlob')
+    batch = []
+    for blob in model.objects.filter(size=None).only('id', 'content').iterator(
+            chunk_size=BATCH_SIZE):
+        blob.size = len(blob.content.encode('utf-8'))
+        batch.append(blob)
+        if len(batch) == BATCH_SIZE:
+            model.objects.bulk_update(batch, ['size'])
+            batch = []
+    model.objects.bulk_update(batch, ['size'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molecule_handler', '0011_job_time_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='structureblob',
+            name='size',
+            field=models.PositiveBigIntegerField(default=None, null=True),
+        ),
+        migrations.RunPython(set_sizes, migrations.RunPython.noop),
+    ]
@@ -1,31 +1,176 @@
 """molecule_handler database models"""
+from hashlib import blake2b
 import os
-from tempfile import NamedTemporaryFile, TemporaryFile
+from pathlib import Path
+from tempfile import NamedTemporaryFile
 
 from django.core.files import File
-from django.db import models
+from django.db import IntegrityError, models, transaction
 
 # Receive the pre_delete signal and delete the file associated with the model instance.
 from django.db.models.signals import pre_delete
 from django.dispatch.dispatcher import receiver
 from django.conf import settings
 
-from proteins_plus.models import ProteinsPlusJob, ProteinsPlusHashableModel
+from proteins_plus.fields import CompressedTextField
+from proteins_plus.models import ProteinsPlusJob, ProteinsPlusBaseModel, \
+    ProteinsPlusHashableModel, ProteinsPlusContentHashedModel
 from .protein_site_handler import ProteinSiteHandler
 from .external import AlphaFoldResource, PDBResource, DensityResource
 
 
-class Protein(ProteinsPlusHashableModel):
-    """Django model for Protein objects"""
+class _DownloadedFile(File):
+    """Closed file on disk that file system storages move into place instead of copying it"""
+
+    def __init__(self, path):
+        super().__init__(None, name=path)
+
+    def temporary_file_path(self):
+        """Get the path of the file, storages detect movable files by this method
+
+        :return: file path
+        :rtype: str
+        """
+        return self.name
+
+
+class StructureBlob(ProteinsPlusBaseModel):
+    """Django model for structure file contents
+
+    Every content is stored once and shared by all proteins with the same structure file.
+    """
+    content_hash = models.CharField(max_length=128, unique=True)
+    content = CompressedTextField()
+    # size of the encoded content in bytes, downloads need it without decompressing the content
+    size = models.PositiveBigIntegerField(null=True, default=None)
+
+    @staticmethod
+    def hash_content(content):
+        """Generate the hash identifying a content
+
+        :param content: structure file content
+        :type content: str
+        :return: content hash
+        :rtype: str
+        """
+        return blake2b(content.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_or_create(content):
+        """Get the blob of a content, the content is only written if it is not stored yet
+
+        :param content: structure file content
+        :type content: str
+        :return: blob without its content loaded
+        :rtype: StructureBlob
+        """
+        content_hash = StructureBlob.hash_content(content)
+        blobs = StructureBlob.objects.only('id', 'content_hash')
+        blob = blobs.filter(content_hash=content_hash).first()
+        if blob is None:
+            try:
+                with transaction.atomic():
+                    blob = StructureBlob.objects.create(
+                        content_hash=content_hash, content=content,
+                        size=len(content.encode('utf-8')))
+            except IntegrityError:
+                # the same content was stored concurrently
+                blob = blobs.get(content_hash=content_hash)
+        return blob
+
+    @staticmethod
+    def get_or_create_many(contents):
+        """Get the blobs of many contents with a constant number of queries
+
+        Only contents that are not stored yet are written.
+
+        :param contents: structure file contents
+        :type contents: list[str]
+        :return: blobs without their content loaded in the order of the contents
+        :rtype: list[StructureBlob]
+        """
+        content_hashes = [StructureBlob.hash_content(content) for content in contents]
+        blobs = StructureBlob.objects.only('id', 'content_hash')
+        existing = set(blobs.filter(content_hash__in=content_hashes).values_list(
+            'content_hash', flat=True))
+        missing = {}
+        for content_hash, content in zip(content_hashes, contents):
+            if content_hash not in existing:
+                missing[content_hash] = StructureBlob(
+                    content_hash=content_hash, content=content, size=len(content.encode('utf-8')))
+        # contents stored concurrently are skipped and loaded with the others
+        StructureBlob.objects.bulk_create(missing.values(), ignore_conflicts=True)
+        stored = {blob.content_hash: blob for blob in blobs.filter(content_hash__in=content_hashes)}
+        return [stored[content_hash] for content_hash in content_hashes]
+
+
+class Protein(ProteinsPlusContentHashedModel):
+    """Django model for Protein objects
+
+    The structure file is stored in a shared StructureBlob. It is available as file_string, which
+    is loaded on first access and can be set like a regular field.
+    """
+
+    class Meta:
+        indexes = [models.Index(fields=['date_created', 'id'])]
+
     name = models.CharField(max_length=255)
     pdb_code = models.CharField(max_length=4, null=True)
     uniprot_code = models.CharField(max_length=10, null=True)
     file_type = models.CharField(max_length=3, default='pdb')
-    file_string = models.TextField()
+    file_blob = models.ForeignKey(StructureBlob, on_delete=models.PROTECT)
     date_created = models.DateTimeField(auto_now_add=True)
     date_last_accessed = models.DateTimeField(auto_now=True)
 
     hash_attributes = ['pdb_code', 'uniprot_code', 'file_type', 'file_string']
+    hashed_fields = ['pdb_code', 'uniprot_code', 'file_type', 'file_blob']
+
+    _file_string = None
+    _file_string_changed = False
+
+    @property
+    def file_string(self):
+        """Content of the structure file
+
+        :return: structure file content
+        :rtype: str
+        """
+        if self._file_string is None and self.file_blob_id is not None:
+            self._file_string = self.file_blob.content
+        return self._file_string
+
+    @file_string.setter
+    def file_string(self, value):
+        self._file_string = value
+        self._file_string_changed = True
+
+    def save(self, *args, **kwargs):  # pylint: disable=signature-differs
+        """Store a new or changed structure file in its shared blob before saving"""
+        if self._file_string_changed or self.file_blob_id is None:
+            self.file_blob = StructureBlob.get_or_create(self.file_string or '')
+            self._file_string_changed = False
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def bulk_create(cls, objects):
+        """Insert many new proteins with a constant number of queries
+
+        The structure files are stored in their shared blobs first.
+
+        :param objects: new proteins
+        :type objects: iterable
+        :return: inserted proteins
+        :rtype: list[Protein]
+        """
+        objects = list(objects)
+        unstored = [protein for protein in objects
+                    if protein._file_string_changed or protein.file_blob_id is None]
+        blobs = StructureBlob.get_or_create_many(
+            [protein.file_string or '' for protein in unstored])
+        for protein, blob in zip(unstored, blobs):
+            protein.file_blob = blob
+            protein._file_string_changed = False
+        return super().bulk_create(objects)
 
     @staticmethod
     def from_file(protein_file, pdb_code=None, uniprot_code=None, file_type='pdb'):
@@ -126,12 +271,12 @@ class Protein(ProteinsPlusHashableModel):
         return temp_file
 
 
-class Ligand(ProteinsPlusHashableModel):
+class Ligand(ProteinsPlusContentHashedModel):
     """Django model for Ligand objects. Always associated with a Protein object"""
     protein = models.ForeignKey(Protein, on_delete=models.CASCADE, blank=True, null=True)
     name = models.CharField(max_length=255)
     file_type = models.CharField(max_length=3, default='sdf')
-    file_string = models.TextField()
+    file_string = CompressedTextField()
     image = models.ImageField(upload_to=settings.MEDIA_DIRECTORIES['ligands'],
                               blank=True, null=True)
 
@@ -177,7 +322,7 @@ class Ligand(ProteinsPlusHashableModel):
         return temp_file
 
 
-class ProteinSite(ProteinsPlusHashableModel):
+class ProteinSite(ProteinsPlusContentHashedModel):
     """Django model for ProteinSite objects.
 
     Always associated with a Protein object. This model describes a part of a protein
@@ -225,8 +370,12 @@ class ProteinSite(ProteinsPlusHashableModel):
         return temp_file
 
 
-class ElectronDensityMap(ProteinsPlusHashableModel):
+class ElectronDensityMap(ProteinsPlusContentHashedModel):
     """Django Model for electron density map files"""
+
+    class Meta:
+        indexes = [models.Index(fields=['date_created', 'id'])]
+
     file = models.FileField(upload_to=settings.MEDIA_DIRECTORIES['density_files'])
     date_created = models.DateTimeField(auto_now_add=True)
     date_last_accessed = models.DateTimeField(auto_now=True)
@@ -245,26 +394,41 @@ class ElectronDensityMap(ProteinsPlusHashableModel):
         density_map = ElectronDensityMap()
         with ccp4_path.open(mode='rb') as density_file:
             density_file_container = File(density_file, name=ccp4_path.name)
-            density_map.file.save(ccp4_path.name, density_file_container)
+            density_map.file.save(ccp4_path.name, density_file_container, save=False)
         return density_map
 
     @staticmethod
     def from_pdb_code(pdb_code):
         """Fetch electron density file from server and save it in an ElectronDensityMap instance
 
+        The file is fetched chunk by chunk into a temporary file next to its final location in the
+        media storage and moved into place, so the map is never held in memory. The digest of the
+        fetched content is the content hash of the map, so the stored file is not read again.
+
         :param pdb_code: pdb code of protein in question
         :type pdb_code: str
+        :raises RuntimeError: If the fetch failed
         :return: A new ElectronDensityMap
         :rtype: ElectronDensityMap instance or NONE if failure
         """
-        content_as_bytes = DensityResource.fetch(pdb_code)
         density_map = ElectronDensityMap()
-        with TemporaryFile() as tmpfile:
-            tmpfile.write(content_as_bytes)
-            tmpfile.seek(0)
-            density_map.file.save(f'{pdb_code}.ccp4', File(tmpfile))
-            density_map.save()
-
+        directory = Path(density_map.file.storage.path(
+            settings.MEDIA_DIRECTORIES['density_files']))
+        directory.mkdir(parents=True, exist_ok=True)
+        download = NamedTemporaryFile(  # pylint: disable=consider-using-with
+            dir=directory, prefix='.', suffix='.ccp4.part', delete=False)
+        try:
+            with download:
+                digest = DensityResource.fetch_to_file(download, pdb_code)
+            density_map.file.save(
+                f'{pdb_code}.ccp4', _DownloadedFile(download.name), save=False)
+        finally:
+            # the download is gone if it was moved into place
+            if os.path.exists(download.name):
+                os.remove(download.name)
+        # the content hash of a density map is the digest of its file
+        density_map.set_content_hash(digest)
+        density_map.save()
         return density_map
 
 
@@ -277,9 +441,9 @@ class PreprocessorJobData(ProteinsPlusHashableModel):
     of performance.
     """
     parent_preprocessor_job = models.OneToOneField('PreprocessorJob', on_delete=models.CASCADE)
-    input_protein_string = models.TextField(null=True)
+    input_protein_string = CompressedTextField(null=True)
     input_protein_file_type = models.CharField(max_length=3, default='pdb')
-    input_ligand_string = models.TextField(null=True)
+    input_ligand_string = CompressedTextField(null=True)
     input_ligand_file_type = models.CharField(max_length=3, default='sdf')
 
     hash_attributes = ['input_protein_string', 'input_protein_file_type', 'input_ligand_string',
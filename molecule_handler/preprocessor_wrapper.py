@@ -1,6 +1,5 @@
 """A django model friendly wrapper around the preprocessor binary"""
 import logging
-import subprocess
 import tempfile
 from contextlib import nullcontext
 from pathlib import Path
@@ -8,6 +7,7 @@ from tempfile import TemporaryDirectory
 
 from django.conf import settings
 from django.core.files import File
+from proteins_plus.job_handler import Phase, record_phase, run_subprocess
 
 from .external import AlphaFoldResource, PDBResource
 from .models import Protein, Ligand
@@ -28,8 +28,10 @@ class PreprocessorWrapper:
         """
         with TemporaryDirectory() as directory:
             dir_path = Path(directory)
-            PreprocessorWrapper.execute_preprocessing(job, dir_path)
-            PreprocessorWrapper.load_results(job, dir_path)
+            with record_phase(job, Phase.INPUT_STAGING):
+                PreprocessorWrapper.execute_preprocessing(job, dir_path)
+            with record_phase(job, Phase.RESULT_LOADING):
+                PreprocessorWrapper.load_results(job, dir_path)
 
     @staticmethod
     def execute_preprocessing(job, directory):
@@ -55,8 +57,7 @@ class PreprocessorWrapper:
                 # use custom ligand if one was given
                 args.extend(['--ligand', ligand_file.name])
 
-            logger.info('Executing command line call: %s', " ".join(args))
-            subprocess.check_call(args)
+            run_subprocess(job, args)
 
     @staticmethod
     def prepare_input(job):
@@ -72,9 +73,11 @@ class PreprocessorWrapper:
         if job.input_data is not None and job.input_data.input_protein_string:
             protein_string = job.input_data.input_protein_string
         elif job.pdb_code:
-            protein_string = PDBResource.fetch(job.pdb_code)
+            with record_phase(job, Phase.EXTERNAL_FETCH):
+                protein_string = PDBResource.fetch(job.pdb_code)
         elif job.uniprot_code:
-            protein_string = AlphaFoldResource.fetch(job.uniprot_code)
+            with record_phase(job, Phase.EXTERNAL_FETCH):
+                protein_string = AlphaFoldResource.fetch(job.uniprot_code)
         else:
             raise RuntimeError(f'Could not prepare protein for job: {job.id}')
 
@@ -99,3 +99,31 @@ class UploadSerializer(ProteinsPlusJobSubmitSerializer):  # pylint: disable=abst
 
         validator.has_valid_ligand_file()
         return data
+
+
+class BatchUploadSerializer(ProteinsPlusJobSubmitSerializer):  # pylint: disable=abstract-method
+    """Batch upload data"""
+    pdb_codes = serializers.ListField(
+        child=serializers.CharField(min_length=4, max_length=4), default=list, max_length=1000)
+    uniprot_codes = serializers.ListField(
+        child=serializers.CharField(min_length=6, max_length=10), default=list, max_length=1000)
+    protein_files = serializers.ListField(
+        child=serializers.FileField(), default=list, max_length=1000)
+
+    def validate(self, data):  # pylint: disable=arguments-renamed
+        """Data validation
+
+        :param data: Batch upload data
+        :raises serializers.ValidationError: If no structure or an invalid structure was provided
+        :return: Validated data
+        """
+        if not data['pdb_codes'] and not data['uniprot_codes'] and not data['protein_files']:
+            raise serializers.ValidationError(
+                'Neither pdb codes, uniprot codes nor pdb files were provided.')
+        for pdb_code in data['pdb_codes']:
+            MoleculeInputValidator({'pdb_code': pdb_code}).has_valid_pdb_code()
+        for uniprot_code in data['uniprot_codes']:
+            MoleculeInputValidator({'uniprot_code': uniprot_code}).has_valid_uniprot_code()
+        for protein_file in data['protein_files']:
+            MoleculeInputValidator({'protein_file': protein_file}).has_valid_protein_file()
+        return data
@@ -12,7 +12,7 @@ def preprocess_molecule_task(job_id):
     :param job_id: Database id of the job object to be executed
     :type job_id: int
     """
-    execute_job(preprocess_molecule, job_id, PreprocessorJob, 'Preprocessor')
+    execute_job(preprocess_molecule, job_id, PreprocessorJob, 'Preprocessor', binary='preprocessor')
 
 
 def preprocess_molecule(job):
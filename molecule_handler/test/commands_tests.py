@@ -1,7 +1,8 @@
 """Test for custom molecule handler commands"""
 from django.core.management import call_command, CommandError
 from proteins_plus.test.utils import PPlusTestCase
-from ..models import PreprocessorJob, Protein, Ligand, ProteinSite, ElectronDensityMap
+from ..models import PreprocessorJob, Protein, Ligand, ProteinSite, ElectronDensityMap, \
+    StructureBlob
 from .utils import create_successful_preprocessor_job, create_test_proteinsite,\
     create_test_electrondensitymap
 
@@ -23,6 +24,7 @@ class CommandsTests(PPlusTestCase):
         self.assertFalse(Ligand.objects.filter(id=ligand.id).exists())
         self.assertFalse(ProteinSite.objects.filter(id=protein_site.id).exists())
         self.assertFalse(ElectronDensityMap.objects.filter(id=density_map.id).exists())
+        self.assertFalse(StructureBlob.objects.filter(id=protein.file_blob_id).exists())
 
     def test_download_pdb(self):
         """Test download_pdb command"""
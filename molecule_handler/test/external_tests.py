@@ -1,11 +1,23 @@
 """tests for external resources"""
 import gzip
+from hashlib import blake2b
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
 from pathlib import Path
+from tempfile import TemporaryDirectory, TemporaryFile
+import threading
+import time
 
+from django.conf import settings
 from django.test import override_settings
 from unittest.mock import patch, MagicMock
+import requests
 
-from molecule_handler.external import AlphaFoldResource, DensityResource, PDBResource
+from molecule_handler.external import AlphaFoldResource, DensityResource, PDBResource, \
+    Resource, ResourceNotFoundError
+from molecule_handler.fetch_cache import FAILURE_SUFFIX, LOCK_SUFFIX, SIZE_FILE, \
+    SIZE_SCAN_INTERVAL, FetchCache
 from molecule_handler.test.config import TestConfig
 from proteins_plus.test.utils import PPlusTestCase
 
@@ -13,7 +25,7 @@ from proteins_plus.test.utils import PPlusTestCase
 class MockRequest:
     """Simple object to mock an external request"""
 
-    def __init__(self, status_code,  text='', content=b''):
+    def __init__(self, status_code,  text='', content=b'', headers=None):
         """Construct a new object
 
         :param status_code: The http code.
@@ -22,10 +34,27 @@ class MockRequest:
         :type text: str.
         :param content: byte content of the mock request.
         :type content: bytes
+        :param headers: response headers of the mock request.
+        :type headers: dict
         """
         self.status_code = status_code
         self.text = text
         self.content = content
+        self.headers = {} if headers is None else headers
+
+    def iter_content(self, chunk_size=1):
+        """Iterate over the byte content in chunks like a streamed response.
+
+        :param chunk_size: maximum chunk size in bytes
+        :type chunk_size: int
+        :return: chunks of the byte content
+        :rtype: generator
+        """
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        """Release the connection of a streamed response, nothing to do for mocks"""
 
     @classmethod
     def get_successful_pdb_mock_request(*args, **kwargs):
@@ -69,10 +98,104 @@ class MockRequest:
         """
         return MockRequest(status_code=400)
 
+    @classmethod
+    def get_not_found_mock_request(*args, **kwargs):
+        """Get a new mock for a request of a missing entry.
+
+        :param args: positional arguments
+        :param kwargs: named arguments
+        :return: The new MockRequest.
+        :rtype: MockRequest
+        """
+        return MockRequest(status_code=404)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answer GET requests with the queued responses of the stub server"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        """Count the connections opened by clients"""
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Send the next queued response"""
+        self.server.paths.append(self.path)
+        status, body, delay = self.server.responses.pop(0)
+        time.sleep(delay)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting
+            self.close_connection = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Do not log requests"""
+
+
+class StubServer:
+    """Local HTTP server for testing external requests"""
+
+    def __init__(self, responses):
+        """Construct a new server
+
+        :param responses: status, body and delay in seconds of the responses in order
+        :type responses: list[tuple(int, str or bytes, float)]
+        """
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.responses = list(responses)
+        self.server.paths = []
+        self.server.connections = 0
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self.server
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
 
 class ExternalTests(PPlusTestCase):
     """External resources tests"""
 
+    def setUp(self):
+        """Use an empty fetch cache that is disabled unless a test enables it"""
+        self.cache_directory = TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.cache_settings = override_settings(FETCH_CACHE=dict(
+            settings.FETCH_CACHE, directory=Path(self.cache_directory.name), max_size=0,
+            failure_ttl=0))
+        self.cache_settings.enable()
+
+    def tearDown(self):
+        """Remove the fetch cache"""
+        super().tearDown()
+        self.cache_settings.disable()
+        self.cache_directory.cleanup()
+
+    def enable_cache(self, max_size=16 * 1024 ** 2, failure_ttl=0):
+        """Enable the fetch cache for the rest of the test
+
+        :param max_size: maximum cache size in bytes
+        :type max_size: int
+        :param failure_ttl: time to remember failed fetches in seconds
+        :type failure_ttl: int
+        """
+        cache_settings = override_settings(FETCH_CACHE=dict(
+            settings.FETCH_CACHE, directory=Path(self.cache_directory.name), max_size=max_size,
+            failure_ttl=failure_ttl))
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+
     @override_settings(LOCAL_PDB_MIRROR_DIR=Path('test_files'))
     def test_fetch_by_pdb_code(self):
         """Test fetching structure by PDB code"""
@@ -126,3 +249,241 @@ class ExternalTests(PPlusTestCase):
         with patch.object(DensityResource, '_external_request',
                           MockRequest.get_failed_mock_request):
             self.assertRaises(RuntimeError, DensityResource.fetch, 'nonsense')
+
+    def test_shared_session(self):
+        """Test all resources reuse the connections of one session"""
+        Resource.close_session()
+        stub = StubServer([])
+        stub.server.responses = [
+            (200, 'pdb 1', 0),
+            (200, 'pdb 2', 0),
+            (200, json.dumps([{'pdbUrl': f'{stub.url}/af/file.pdb'}]), 0),
+            (200, 'af', 0),
+        ]
+        urls = dict(settings.URLS, pdb_files=f'{stub.url}/pdb/', alphafold_files=f'{stub.url}/af/')
+        with stub as server, override_settings(URLS=urls):
+            self.assertEqual(PDBResource.fetch('nonsense1'), 'pdb 1')
+            self.assertEqual(PDBResource.fetch('nonsense2'), 'pdb 2')
+            self.assertEqual(AlphaFoldResource.fetch('nonsense'), 'af')
+            self.assertEqual(server.paths, [
+                '/pdb/nonsense1.pdb', '/pdb/nonsense2.pdb', '/af/NONSENSE', '/af/file.pdb'])
+            self.assertEqual(server.connections, 1)
+        self.assertIs(PDBResource.get_session(), DensityResource.get_session())
+        Resource.close_session()
+
+    def test_retry_server_errors(self):
+        """Test server errors are retried and reported after the last retry"""
+        Resource.close_session()
+        config = dict(settings.EXTERNAL_REQUESTS, retries=2, backoff_factor=0)
+        stub = StubServer([(503, '', 0), (502, '', 0), (200, 'pdb', 0)] + [(500, 'error', 0)] * 3)
+        urls = dict(settings.URLS, pdb_files=f'{stub.url}/')
+        with stub as server, override_settings(URLS=urls, EXTERNAL_REQUESTS=config):
+            self.assertEqual(PDBResource.fetch('nonsense'), 'pdb')
+            self.assertEqual(len(server.paths), 3)
+            with self.assertRaisesRegex(RuntimeError, 'error'):
+                PDBResource.fetch('nonsense')
+            self.assertEqual(len(server.paths), 6)
+        Resource.close_session()
+
+    def test_request_timeout(self):
+        """Test slow servers exceeding the read timeout"""
+        Resource.close_session()
+        config = dict(settings.EXTERNAL_REQUESTS, retries=0, read_timeout=0.2)
+        stub = StubServer([(200, 'pdb', 0.5)])
+        urls = dict(settings.URLS, pdb_files=f'{stub.url}/')
+        with stub, override_settings(URLS=urls, EXTERNAL_REQUESTS=config):
+            with self.assertRaises(requests.exceptions.RequestException):
+                PDBResource.fetch('nonsense')
+        Resource.close_session()
+
+    def test_fetch_cache(self):
+        """Test external fetches are served from the fetch cache on repeated requests"""
+        self.enable_cache()
+        pdb_mock = MagicMock(side_effect=MockRequest.get_successful_pdb_mock_request)
+        with patch.object(PDBResource, '_external_request', pdb_mock):
+            pdb_text = PDBResource.fetch('NONSENSE')
+            self.assertEqual(PDBResource.fetch('nonsense'), pdb_text)
+        self.assertEqual(pdb_mock.call_count, 1)
+
+        density_mock = MagicMock(side_effect=MockRequest.get_successful_density_mock_request)
+        with patch.object(DensityResource, '_external_request', density_mock):
+            density = DensityResource.fetch('nonsense')
+            cached = DensityResource.fetch('nonsense')
+        self.assertEqual(density_mock.call_count, 1)
+        self.assertIsInstance(cached, bytearray)
+        self.assertEqual(cached, density)
+
+        # corrupted entries are fetched again
+        path = FetchCache('PDBResource').get_path('nonsense')
+        path.write_bytes(path.read_bytes()[:-1])
+        with patch.object(PDBResource, '_external_request', pdb_mock):
+            self.assertEqual(PDBResource.fetch('nonsense'), pdb_text)
+        self.assertEqual(pdb_mock.call_count, 2)
+        self.assertEqual(FetchCache('PDBResource').get('nonsense').decode(), pdb_text)
+
+        # failed fetches are not cached
+        with patch.object(PDBResource, '_external_request', MockRequest.get_failed_mock_request):
+            self.assertRaises(RuntimeError, PDBResource.fetch, 'other')
+        self.assertIsNone(FetchCache('PDBResource').get('other'))
+
+    def test_fetch_density_to_file(self):
+        """Test density files are streamed into files and cached chunk by chunk"""
+        Resource.close_session()
+        self.enable_cache()
+        with open(TestConfig.density_file, 'rb') as density_file:
+            density_bytes = density_file.read()
+        digest = blake2b(density_bytes).hexdigest()
+        stub = StubServer([(200, density_bytes, 0)])
+        urls = dict(settings.URLS, density_files=f'{stub.url}/')
+        with stub as server, override_settings(URLS=urls), TemporaryFile() as file:
+            self.assertEqual(DensityResource.fetch_to_file(file, 'nonsense'), digest)
+            self.assertEqual(server.paths, ['/nonsense.ccp4'])
+            file.seek(0)
+            self.assertEqual(file.read(), density_bytes)
+        Resource.close_session()
+
+        # repeated fetches are copied from the cache
+        with TemporaryFile() as file:
+            self.assertEqual(DensityResource.fetch_to_file(file, 'NONSENSE'), digest)
+            file.seek(0)
+            self.assertEqual(file.read(), density_bytes)
+
+        # corrupted entries are downloaded again
+        path = FetchCache('DensityResource').get_path('nonsense')
+        path.write_bytes(path.read_bytes()[1:])
+        density_mock = MagicMock(side_effect=MockRequest.get_successful_density_mock_request)
+        with patch.object(DensityResource, '_external_request', density_mock), \
+                TemporaryFile() as file:
+            self.assertEqual(DensityResource.fetch_to_file(file, 'nonsense'), digest)
+            file.seek(0)
+            self.assertEqual(file.read(), density_bytes)
+        self.assertEqual(density_mock.call_count, 1)
+
+        # incomplete downloads fail and are not cached
+        truncated = MockRequest(status_code=200, content=density_bytes[:100],
+                                headers={'Content-Length': str(len(density_bytes))})
+        with patch.object(DensityResource, '_external_request', return_value=truncated), \
+                TemporaryFile() as file:
+            with self.assertRaisesRegex(RuntimeError, 'Incomplete'):
+                DensityResource.fetch_to_file(file, 'truncated')
+        self.assertIsNone(FetchCache('DensityResource').get('truncated'))
+
+    def test_fetch_cache_eviction(self):
+        """Test the least recently used entries are evicted from a full fetch cache"""
+        entry_size = 32 + 100
+        self.enable_cache(max_size=2 * entry_size)
+        cache = FetchCache('Resource')
+        cache.put('a', b'a' * 100)
+        cache.put('b', b'b' * 100)
+        os.utime(cache.get_path('a'), (1000, 1000))
+        os.utime(cache.get_path('b'), (2000, 2000))
+        # reading marks an entry as recently used
+        self.assertEqual(cache.get('a'), b'a' * 100)
+
+        cache.put('c', b'c' * 100)
+        self.assertEqual(cache.get('a'), b'a' * 100)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), b'c' * 100)
+
+        # contents larger than the cache are not stored
+        cache.put('d', b'd' * 2 * entry_size)
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(cache.get('a'), b'a' * 100)
+        self.assertEqual(sorted(path.name for path in cache.get_path('a').parent.iterdir()),
+                         sorted([cache.get_path('a').name, cache.get_path('c').name]))
+
+    def test_fetch_cache_size_estimate(self):
+        """Test the fetch cache is only scanned if its estimated size exceeds the maximum"""
+        entry_size = 32 + 100
+        self.enable_cache(max_size=3 * entry_size)
+        cache = FetchCache('Resource')
+        with patch.object(FetchCache, 'evict', wraps=FetchCache.evict) as evict_mock:
+            # the first write has no estimate yet
+            cache.put('a', b'a' * 100)
+            self.assertEqual(evict_mock.call_count, 1)
+            cache.put('b', b'b' * 100)
+            cache.put('b', b'b' * 100)
+            cache.put('c', b'c' * 100)
+            self.assertEqual(evict_mock.call_count, 1)
+            cache.put('d', b'd' * 100)
+            self.assertEqual(evict_mock.call_count, 2)
+            self.assertIsNone(cache.get('a'))
+
+            # outdated estimates are checked by a scan
+            size_path = FetchCache.get_directory() / SIZE_FILE
+            size = size_path.read_text().split()[0]
+            size_path.write_text(f'{size} {time.time() - 2 * SIZE_SCAN_INTERVAL}')
+            cache.put('b', b'b' * 100)
+            self.assertEqual(evict_mock.call_count, 3)
+        self.assertEqual(size_path.read_text().split()[0], str(3 * entry_size))
+
+    def test_failed_fetches_are_remembered(self):
+        """Test fetches of missing entries are not repeated within the failure ttl"""
+        self.enable_cache(failure_ttl=60)
+        failed_mock = MagicMock(side_effect=MockRequest.get_not_found_mock_request)
+        with patch.object(PDBResource, '_external_request', failed_mock):
+            self.assertRaises(ResourceNotFoundError, PDBResource.fetch, 'obsolete')
+            with self.assertRaisesRegex(ResourceNotFoundError, 'failed recently'):
+                PDBResource.fetch('OBSOLETE')
+        self.assertEqual(failed_mock.call_count, 1)
+
+        # transient failures are retried right away
+        for side_effect in (MockRequest.get_failed_mock_request,
+                            lambda *args, **kwargs: MockRequest(status_code=503),
+                            requests.ConnectionError('connection reset')):
+            failed_mock = MagicMock(side_effect=side_effect)
+            with patch.object(PDBResource, '_external_request', failed_mock):
+                self.assertRaises((RuntimeError, requests.RequestException),
+                                  PDBResource.fetch, 'busy')
+                self.assertRaises((RuntimeError, requests.RequestException),
+                                  PDBResource.fetch, 'busy')
+            self.assertEqual(failed_mock.call_count, 2)
+        self.assertFalse(FetchCache('PDBResource').get_path('busy', FAILURE_SUFFIX).exists())
+
+        # expired failures are fetched again
+        path = FetchCache('PDBResource').get_path('obsolete', FAILURE_SUFFIX)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        with patch.object(PDBResource, '_external_request',
+                          MockRequest.get_successful_pdb_mock_request):
+            self.assertEqual(PDBResource.fetch('obsolete'),
+                             MockRequest.get_successful_pdb_mock_request().text)
+        self.assertFalse(path.exists())
+
+    def test_coalesce_concurrent_fetches(self):
+        """Test identical concurrent fetches download the file once"""
+        self.enable_cache()
+
+        def slow_request(*args, **kwargs):
+            time.sleep(0.3)
+            return MockRequest.get_successful_pdb_mock_request()
+
+        request_mock = MagicMock(side_effect=slow_request)
+        results = []
+
+        def fetch():
+            results.append(PDBResource.fetch('popular'))
+
+        with patch.object(PDBResource, '_external_request', request_mock):
+            threads = [threading.Thread(target=fetch) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(request_mock.call_count, 1)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(set(results)), 1)
+
+    def test_fetch_cache_locks_keys(self):
+        """Test fetches of different keys do not wait for each other"""
+        self.enable_cache()
+        cache = FetchCache('PDBResource')
+        with self.settings(FETCH_CACHE=dict(settings.FETCH_CACHE, lock_timeout=0.2)):
+            with cache.lock('first'):
+                self.assertTrue(cache.get_path('first', LOCK_SUFFIX).exists())
+                start = time.monotonic()
+                with cache.lock('second'):
+                    pass
+                self.assertLess(time.monotonic() - start, 0.2)
+        # lock files are removed when they are released
+        self.assertFalse(cache.get_path('first', LOCK_SUFFIX).exists())
+        self.assertFalse(cache.get_path('second', LOCK_SUFFIX).exists())
@@ -1,6 +1,9 @@
 """tests for molecule_handler database models"""
 import os
 from pathlib import Path
+from unittest.mock import patch
+import zlib
+from django.db import connection
 from django.test import override_settings
 
 from proteins_plus.test.utils import PPlusTestCase
@@ -8,7 +11,8 @@ from .config import TestConfig
 from .utils import create_test_preprocessor_job, create_successful_preprocessor_job, \
     create_test_protein, create_test_ligand, create_test_proteinsite
 from ..tasks import preprocess_molecule_task
-from ..models import PreprocessorJob, Protein, Ligand, ProteinSite, ElectronDensityMap
+from ..models import PreprocessorJob, Protein, Ligand, ProteinSite, ElectronDensityMap, \
+    StructureBlob
 
 
 class ModelTests(PPlusTestCase):
@@ -42,6 +46,137 @@ class ModelTests(PPlusTestCase):
         cached_job = job3.retrieve_job_from_cache()
         self.assertIsNone(cached_job)
 
+    def test_content_hash(self):
+        """Test content hashes are stored on save and combined by referencing objects"""
+        protein = create_test_protein()
+        self.assertIsNotNone(protein.content_hash)
+        self.assertEqual(Protein.objects.get(id=protein.id).content_hash, protein.content_hash)
+        other_protein = create_test_protein(protein_name='other_name')
+        # the name is not part of the content
+        self.assertEqual(other_protein.content_hash, protein.content_hash)
+        empty_protein = create_test_protein(empty=True)
+        self.assertNotEqual(empty_protein.content_hash, protein.content_hash)
+
+        # ligands and sites hash the digest of their protein
+        ligand = create_test_ligand(protein)
+        other_ligand = create_test_ligand(other_protein)
+        empty_ligand = create_test_ligand(empty_protein)
+        self.assertEqual(ligand.content_hash, other_ligand.content_hash)
+        self.assertNotEqual(ligand.content_hash, empty_ligand.content_hash)
+        self.assertIn(protein.content_hash.encode('utf-8'), ligand.generate_hashable_string())
+        site = create_test_proteinsite(protein)
+        other_site = create_test_proteinsite(other_protein)
+        self.assertEqual(site.content_hash, other_site.content_hash)
+
+        # copies of a protein get their content hash recomputed
+        protein_content_hash = protein.content_hash
+        protein.id = None
+        protein.file_string = ''
+        protein.save()
+        self.assertEqual(protein.content_hash, empty_protein.content_hash)
+
+        # missing content hashes are generated and stored on first use
+        Protein.objects.filter(id=other_protein.id).update(content_hash=None)
+        other_protein = Protein.objects.get(id=other_protein.id)
+        self.assertEqual(other_protein.get_content_hash(), protein_content_hash)
+        self.assertEqual(
+            Protein.objects.get(id=other_protein.id).content_hash, protein_content_hash)
+
+    def test_content_hash_of_edited_objects(self):
+        """Test content hashes follow changes of existing objects"""
+        protein = create_test_protein()
+        empty_protein = create_test_protein(empty=True)
+        ligand = create_test_ligand(protein)
+        site = create_test_proteinsite(protein)
+
+        protein = Protein.objects.get(id=protein.id)
+        with patch.object(Protein, 'update_hasher', autospec=True,
+                          side_effect=Protein.update_hasher) as update_hasher:
+            # other fields do not change the content
+            protein.name = 'renamed'
+            protein.save()
+            update_hasher.assert_not_called()
+            protein.file_string = ''
+            protein.save()
+            update_hasher.assert_called_once()
+        self.assertEqual(protein.content_hash, empty_protein.content_hash)
+        self.assertEqual(Protein.objects.get(id=protein.id).content_hash,
+                         empty_protein.content_hash)
+
+        ligand = Ligand.objects.get(id=ligand.id)
+        ligand_content_hash = ligand.content_hash
+        ligand.file_string = 'changed'
+        ligand.save()
+        self.assertNotEqual(Ligand.objects.get(id=ligand.id).content_hash, ligand_content_hash)
+
+        site = ProteinSite.objects.get(id=site.id)
+        site_content_hash = site.content_hash
+        # changes of JSON fields in place are detected as well
+        site.site_description['residue_ids'].pop()
+        site.save()
+        self.assertNotEqual(ProteinSite.objects.get(id=site.id).content_hash, site_content_hash)
+
+        site.protein = create_test_protein(pdb_code='1abc')
+        site_content_hash = site.content_hash
+        site.save()
+        self.assertNotEqual(site.content_hash, site_content_hash)
+
+    def test_protein_blob_deduplication(self):
+        """Test identical structure files are stored once"""
+        protein = create_test_protein()
+        other_protein = create_test_protein()
+        self.assertEqual(protein.file_blob_id, other_protein.file_blob_id)
+        self.assertEqual(StructureBlob.objects.count(), 1)
+
+        # copies share the structure file
+        copy = Protein.objects.get(id=protein.id)
+        copy.id = None
+        copy.save()
+        self.assertEqual(copy.file_blob_id, protein.file_blob_id)
+        self.assertEqual(StructureBlob.objects.count(), 1)
+
+        # changed structure files are stored separately
+        copy.file_string = 'changed'
+        copy.save()
+        self.assertNotEqual(copy.file_blob_id, protein.file_blob_id)
+        self.assertEqual(StructureBlob.objects.count(), 2)
+        self.assertEqual(Protein.objects.get(id=copy.id).file_string, 'changed')
+        self.assertEqual(Protein.objects.get(id=protein.id).file_string, protein.file_string)
+
+    def test_protein_bulk_create(self):
+        """Test inserting many proteins with shared and new structure files at once"""
+        stored = create_test_protein()
+        proteins = [Protein(name=f'protein_{index}', file_string=f'structure {index % 2}')
+                    for index in range(4)]
+        proteins.append(Protein(name='stored', pdb_code=stored.pdb_code,
+                                uniprot_code=stored.uniprot_code, file_string=stored.file_string))
+        with self.assertNumQueries(4):
+            Protein.bulk_create(proteins)
+
+        self.assertEqual(StructureBlob.objects.count(), 3)
+        self.assertEqual(proteins[0].file_blob_id, proteins[2].file_blob_id)
+        self.assertNotEqual(proteins[0].file_blob_id, proteins[1].file_blob_id)
+        self.assertEqual(proteins[4].file_blob_id, stored.file_blob_id)
+        for protein in proteins:
+            loaded = Protein.objects.get(id=protein.id)
+            self.assertEqual(loaded.file_string, protein.file_string)
+            self.assertEqual(loaded.content_hash, protein.content_hash)
+        # same content hash as a protein saved one by one
+        self.assertEqual(proteins[4].content_hash, stored.content_hash)
+
+    def test_compressed_fields(self):
+        """Test structure files are stored compressed and read back unchanged"""
+        ligand = create_test_ligand(create_test_protein())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT file_string FROM molecule_handler_ligand WHERE id = %s',
+                [Ligand._meta.pk.get_db_prep_value(ligand.id, connection)])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertLess(len(stored), len(ligand.file_string.encode('utf-8')))
+        self.assertEqual(zlib.decompress(stored).decode('utf-8'), ligand.file_string)
+        self.assertEqual(Ligand.objects.get(id=ligand.id).file_string, ligand.file_string)
+        self.assertTrue(Ligand.objects.filter(file_string=ligand.file_string).exists())
+
     def test_job_delete_cascade(self):
         """Test cascading deletion behavior of the preprocessor job"""
         job = create_successful_preprocessor_job()
@@ -134,6 +269,24 @@ class ModelTests(PPlusTestCase):
         with open(TestConfig.density_file, 'rb') as density_file:
             self.assertEqual(density_file.read(), density_map.file.read())
 
+    @override_settings(LOCAL_DENSITY_MIRROR_DIR=Path('test_files'))
+    def test_electrondensitymap_from_pdb_code(self):
+        """Test fetching an ElectronDensityMap into the media storage"""
+        # the digest of the fetch is reused instead of reading the stored file again
+        with patch.object(ElectronDensityMap, 'update_hasher') as update_hasher:
+            density_map = ElectronDensityMap.from_pdb_code(TestConfig.protein)
+        update_hasher.assert_not_called()
+        with open(TestConfig.density_file, 'rb') as density_file:
+            self.assertEqual(density_file.read(), density_map.file.read())
+        density_map.file.close()
+        stored_map = ElectronDensityMap.objects.get(pk=density_map.pk)
+        self.assertEqual(stored_map.content_hash, density_map.content_hash)
+        stored_map.content_hash = None
+        self.assertEqual(stored_map.get_content_hash(), density_map.content_hash)
+        # the temporary download was moved into place
+        directory = Path(density_map.file.path).parent
+        self.assertEqual([path.name for path in directory.iterdir() if path.suffix == '.part'], [])
+
     def test_protein_write_ligands_temp(self):
         """Test writing all Ligand models of a Protein model a temporary file"""
         # no ligand
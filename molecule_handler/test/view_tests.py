@@ -1,13 +1,15 @@
 """tests for molecule_handler views"""
+import gzip
 import tempfile
+from unittest.mock import MagicMock, patch
 
 from django.core.files import File
 
 from proteins_plus.test.utils import PPlusTestCase, call_api
 
-from ..views import ProteinUploadView, ProteinViewSet, LigandViewSet, PreprocessorJobViewSet, \
+from ..views import ProteinUploadView, ProteinBatchUploadView, ProteinViewSet, LigandViewSet, PreprocessorJobViewSet, \
     ProteinSiteViewSet, ElectronDensityMapViewSet, PreprocessorJobDataViewSet
-from ..models import PreprocessorJob
+from ..models import PreprocessorJob, PreprocessorJobData
 
 from .config import TestConfig
 from .utils import create_test_protein, create_multiple_test_ligands, \
@@ -152,6 +154,109 @@ class ViewTests(PPlusTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['count'], 2)
 
+    def test_sparse_fieldsets(self):
+        """Test selecting the fields of retrieve and list responses"""
+        protein = create_test_protein()
+        create_multiple_test_ligands(protein)
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'list'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('file_string', response.data['results'][0])
+        self.assertIn('name', response.data['results'][0])
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'list'},
+                            query_params={'fields': 'id,file_string'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'file_string'})
+        self.assertEqual(response.data['results'][0]['file_string'], protein.file_string)
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'retrieve'},
+                            query_params={'omit': 'file_string,ligand_set'}, pk=protein.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('file_string', response.data)
+        self.assertNotIn('ligand_set', response.data)
+        self.assertIn('name', response.data)
+
+        response = call_api(LigandViewSet, 'get', viewset_actions={'get': 'list'},
+                            query_params={'fields': 'name'})
+        self.assertEqual(response.data['count'], 2)
+        for ligand in response.data['results']:
+            self.assertEqual(set(ligand), {'name'})
+
+        response = call_api(LigandViewSet, 'get', viewset_actions={'get': 'list'},
+                            query_params={'fields': 'name,unknown'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_retrieve(self):
+        """Test answering repeated retrieve requests with 304"""
+        protein = create_test_protein()
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'retrieve'},
+                            pk=protein.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'retrieve'},
+                            headers={'HTTP_IF_NONE_MATCH': etag}, pk=protein.id)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIsNone(response.data)
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'retrieve'},
+                            query_params={'fields': 'id'},
+                            headers={'HTTP_IF_NONE_MATCH': etag}, pk=protein.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        job = create_test_preprocessor_job()
+        response = call_api(PreprocessorJobDataViewSet, 'get',
+                            viewset_actions={'get': 'retrieve'}, pk=job.input_data.id)
+        self.assertIn('immutable', response['Cache-Control'])
+        response = call_api(PreprocessorJobDataViewSet, 'get',
+                            viewset_actions={'get': 'retrieve'},
+                            headers={'HTTP_IF_NONE_MATCH': f'"other", W/{response["ETag"]}'},
+                            pk=job.input_data.id)
+        self.assertEqual(response.status_code, 304)
+        response = call_api(PreprocessorJobDataViewSet, 'get',
+                            viewset_actions={'get': 'retrieve'},
+                            headers={'HTTP_IF_NONE_MATCH': '*'}, pk=job.input_data.id)
+        self.assertEqual(response.status_code, 304)
+
+    def test_download_files(self):
+        """Test streaming structure files of proteins and ligands"""
+        protein = create_test_protein()
+        ligand, _ = create_multiple_test_ligands(protein)
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'download_file'},
+                            pk=protein.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'chemical/x-pdb')
+        self.assertEqual(b''.join(response.streaming_content).decode(), protein.file_string)
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'download_file'},
+                            headers={'HTTP_ACCEPT_ENCODING': 'gzip, deflate'}, pk=protein.id)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(),
+                         protein.file_string)
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'download_file'},
+                            headers={'HTTP_RANGE': 'bytes=10-19'}, pk=protein.id)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'],
+                         f'bytes 10-19/{len(protein.file_string.encode())}')
+        self.assertEqual(b''.join(response.streaming_content).decode(), protein.file_string[10:20])
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'download_file'},
+                            headers={'HTTP_RANGE': 'bytes=100000000-'}, pk=protein.id)
+        self.assertEqual(response.status_code, 416)
+
+        response = call_api(LigandViewSet, 'get', viewset_actions={'get': 'download_file'},
+                            pk=ligand.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'chemical/x-mdl-sdfile')
+        self.assertIn(f'filename="{ligand.name}.sdf"', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content).decode(), ligand.file_string)
+
     def test_retrieve_ligand(self):
         """Test retrieve and list Ligand behavior"""
         protein = create_test_protein()
@@ -252,6 +357,7 @@ class ViewTests(PPlusTestCase):
         job = create_test_preprocessor_job()
         job.set_hash_value()
         job.save()
+        nof_job_data = PreprocessorJobData.objects.count()
 
         with open(TestConfig.protein_file, 'rb') as protein_file, \
                 open(TestConfig.ligand_file, 'rb') as ligand_file:
@@ -262,6 +368,9 @@ class ViewTests(PPlusTestCase):
 
         self.assertTrue(response.data['retrieved_from_cache'])
         self.assertEqual(response.data['job_id'], str(job.id))
+        # the job the view saved to reference its input data is deleted again
+        self.assertEqual(PreprocessorJob.objects.count(), 1)
+        self.assertEqual(PreprocessorJobData.objects.count(), nof_job_data)
 
         data = {'pdb_code': TestConfig.protein}
         response = call_api(ProteinUploadView, 'post', data)
@@ -281,3 +390,88 @@ class ViewTests(PPlusTestCase):
         self.assertNotEqual(response.data['job_id'], str(job.id))
         job2 = PreprocessorJob.objects.get(id=response.data['job_id'])
         self.assertIsNone(job2.hash_value)
+
+    def test_batch_upload(self):
+        """Test uploading many proteins at once"""
+        cached_job = create_test_preprocessor_job(pdb_code='4agn', ligand_filepath=None)
+        cached_job.set_hash_value()
+        cached_job.save()
+
+        with open(TestConfig.protein_file, 'rb') as protein_file:
+            data = {'pdb_codes': [TestConfig.protein, '4agn', TestConfig.protein],
+                    'uniprot_codes': [TestConfig.af_protein],
+                    'protein_files': [File(protein_file)]}
+            response = call_api(ProteinBatchUploadView, 'post', data)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(response.data), 5)
+        job_ids = [entry['job_id'] for entry in response.data]
+        retrieved = [entry['retrieved_from_cache'] for entry in response.data]
+        self.assertEqual(job_ids[1], str(cached_job.id))
+        self.assertEqual(retrieved, [False, True, False, False, False])
+        # identical structures in one batch share a job
+        self.assertEqual(job_ids[0], job_ids[2])
+        self.assertEqual(len(set(job_ids)), 4)
+
+        for job_id in set(job_ids) - {str(cached_job.id)}:
+            job = PreprocessorJob.objects.get(id=job_id)
+            self.assertIsNotNone(job.hash_value)
+            self.assertEqual(job.input_data.parent_preprocessor_job, job)
+        self.assertEqual(PreprocessorJob.objects.get(id=job_ids[3]).uniprot_code,
+                         TestConfig.af_protein)
+        self.assertIsNotNone(PreprocessorJob.objects.get(
+            id=job_ids[4]).input_data.input_protein_string)
+
+        # batch and single uploads share the cache
+        response = call_api(ProteinUploadView, 'post', {'pdb_code': TestConfig.protein})
+        self.assertTrue(response.data['retrieved_from_cache'])
+        self.assertEqual(response.data['job_id'], job_ids[0])
+
+        # without cache every structure gets its own job
+        nof_job_data = PreprocessorJobData.objects.count()
+        data = {'pdb_codes': [TestConfig.protein, TestConfig.protein], 'use_cache': False}
+        response = call_api(ProteinBatchUploadView, 'post', data)
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.data[0]['job_id'], response.data[1]['job_id'])
+        self.assertFalse(response.data[0]['retrieved_from_cache'])
+        self.assertEqual(PreprocessorJobData.objects.count(), nof_job_data + 2)
+
+    def test_batch_upload_concurrent_duplicates(self):
+        """Test batch uploads attach to identical jobs saved after the cache lookup"""
+        concurrent_job = create_test_preprocessor_job(
+            pdb_code=TestConfig.protein, ligand_filepath=None)
+        concurrent_job.set_hash_value()
+        concurrent_job.save()
+        nof_job_data = PreprocessorJobData.objects.count()
+
+        task = MagicMock()
+        data = {'pdb_codes': [TestConfig.protein, '4agn']}
+        # simulate the identical job being saved right after the cache lookup
+        with patch.object(PreprocessorJob.objects, 'in_bulk', return_value={}), \
+                patch('molecule_handler.views.preprocess_molecule_task', task):
+            response = call_api(ProteinBatchUploadView, 'post', data)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data[0]['job_id'], str(concurrent_job.id))
+        self.assertTrue(response.data[0]['retrieved_from_cache'])
+        self.assertFalse(response.data[1]['retrieved_from_cache'])
+        task.delay.assert_called_once_with(PreprocessorJob.objects.get(pdb_code='4agn').id)
+        # the job saved for the duplicate is not left behind
+        self.assertEqual(PreprocessorJob.objects.count(), 2)
+        self.assertEqual(PreprocessorJobData.objects.count(), nof_job_data + 1)
+
+    def test_batch_upload_invalid(self):
+        """Test batch upload with invalid data"""
+        response = call_api(ProteinBatchUploadView, 'post')
+        self.assertEqual(response.status_code, 400)
+
+        data = {'pdb_codes': [TestConfig.protein, 'i111']}
+        response = call_api(ProteinBatchUploadView, 'post', data)
+        self.assertEqual(response.status_code, 400)
+
+        wrong_filetype_path = TestConfig.testdir / (TestConfig.protein + '.txt')
+        with open(wrong_filetype_path, 'rb') as protein_file:
+            data = {'protein_files': [File(protein_file)]}
+            response = call_api(ProteinBatchUploadView, 'post', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PreprocessorJob.objects.exists())
@@ -4,7 +4,8 @@ from rest_framework.routers import DefaultRouter
 from molecule_handler import views
 
 urlpatterns = [
-    path('upload/', views.ProteinUploadView.as_view())
+    path('upload/', views.ProteinUploadView.as_view()),
+    path('upload/batch/', views.ProteinBatchUploadView.as_view()),
 ]
 
 router = DefaultRouter()
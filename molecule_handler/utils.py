@@ -18,15 +18,16 @@ def load_processed_ligands(path, output_protein):
         with sd_files[0].open() as ligand_file:
             multi_ligand_string = ligand_file.read()
         ligand_strings = multi_ligand_string.split('$$$$\n')
+        ligands = []
         for ligand_string in ligand_strings:
             if ligand_string == '' or ligand_string.isspace():
                 continue
             ligand_name = ligand_string.split('\n')[0]
 
-            ligand = Ligand(
+            ligands.append(Ligand(
                 name=ligand_name,
                 file_type='sdf',
                 file_string=ligand_string + '$$$$',
                 protein=output_protein
-            )
-            ligand.save()
+            ))
+        Ligand.bulk_create(ligands)
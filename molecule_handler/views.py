@@ -1,18 +1,26 @@
 """molecule_handler api views"""
+from celery import group
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import extend_schema, OpenApiTypes
 
 from proteins_plus.serializers import ProteinsPlusJobResponseSerializer
 from proteins_plus.job_handler import submit_task
+from proteins_plus.downloads import CompressedContent, annotate_compressed_sizes, \
+    compressed_file_response, get_content_type
+from proteins_plus.views import ProteinsPlusReadOnlyViewSet
+from proteins_plus.metrics import JOB_SUBMISSIONS
 from .models import Protein, Ligand, ProteinSite, ElectronDensityMap, PreprocessorJob, \
     PreprocessorJobData
 from .serializers import ProteinSerializer, LigandSerializer, ProteinSiteSerializer, \
     ElectronDensityMapSerializer, PreprocessorJobSerializer, UploadSerializer, \
-    PreprocessorJobDataSerializer
+    PreprocessorJobDataSerializer, BatchUploadSerializer
 from .tasks import preprocess_molecule_task
 
 
@@ -66,37 +74,197 @@ class ProteinUploadView(APIView):
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class ProteinViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class ProteinBatchUploadView(APIView):
+    """View for uploading many proteins at once"""
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+
+    @extend_schema(
+        request=BatchUploadSerializer,
+        responses=ProteinsPlusJobResponseSerializer(many=True),
+    )
+    def post(self, request):
+        """Upload many proteins at once.
+
+        Every structure is preprocessed like a single upload. Jobs are created in bulk, looked up
+        in the cache with a single query and all uncached jobs are submitted together. The
+        response lists one job per structure in the order "pdb_codes", "uniprot_codes",
+        "protein_files".
+
+        Required:
+         - at least one of "pdb_codes", "uniprot_codes" (for AlphaFold predicted structures) or
+           "protein_files"
+        """
+        serializer = BatchUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        request_data = serializer.validated_data
+
+        jobs = [PreprocessorJob(pdb_code=pdb_code) for pdb_code in request_data['pdb_codes']]
+        jobs.extend(PreprocessorJob(uniprot_code=uniprot_code)
+                    for uniprot_code in request_data['uniprot_codes'])
+        protein_strings = [None] * len(jobs)
+        for protein_file in request_data['protein_files']:
+            jobs.append(PreprocessorJob())
+            protein_strings.append(protein_file.file.read().decode('utf8'))
+        for job, protein_string in zip(jobs, protein_strings):
+            job.input_data = PreprocessorJobData(
+                parent_preprocessor_job=job, input_protein_string=protein_string)
+
+        responses = self.submit_jobs(jobs, request_data['use_cache'])
+        serializer = ProteinsPlusJobResponseSerializer([
+            {'job_id': job_id, 'retrieved_from_cache': retrieved}
+            for job_id, retrieved in responses
+        ], many=True)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @staticmethod
+    def submit_jobs(jobs, use_cache):
+        """Retrieve jobs from cache or create and start them in bulk
+
+        :param jobs: unsaved jobs with unsaved input data
+        :type jobs: list[PreprocessorJob]
+        :param use_cache: Indicates whether caching should be used
+        :type use_cache: bool
+        :return: the job id and whether the job was retrieved from cache for every job
+        :rtype: list[tuple(job_id, retrieved)]
+        """
+        submitted = {}
+        if use_cache:
+            for job in jobs:
+                job.set_hash_value()
+            keys = [job.hash_value for job in jobs]
+            cached_jobs = PreprocessorJob.objects.in_bulk(set(keys), field_name='hash_value')
+            for hash_value, cached_job in cached_jobs.items():
+                submitted[hash_value] = (cached_job.id, True)
+        else:
+            keys = [job.id for job in jobs]
+
+        nof_cached = sum(1 for key in keys if key in submitted)
+        JOB_SUBMISSIONS.inc(nof_cached, tool=PreprocessorJob._meta.app_label, retrieved='true')
+
+        # identical structures within the batch share one job
+        new_jobs = {}
+        for key, job in zip(keys, jobs):
+            if key not in submitted:
+                new_jobs.setdefault(key, job)
+        try:
+            ProteinBatchUploadView.create_jobs(new_jobs.values())
+        except IntegrityError:
+            # identical jobs were submitted concurrently, fall back to single submissions. The
+            # input data needs a saved job, so every job is saved first and deleted again by
+            # submit_task if an identical job is returned instead.
+            for key, job in new_jobs.items():
+                job.hash_value = None
+                ProteinBatchUploadView.create_jobs([job])
+                submitted[key] = submit_task(job, preprocess_molecule_task, use_cache)
+        else:
+            group(preprocess_molecule_task.s(job.id) for job in new_jobs.values()).apply_async()
+            JOB_SUBMISSIONS.inc(len(keys) - nof_cached, tool=PreprocessorJob._meta.app_label,
+                                retrieved='false')
+            for key, job in new_jobs.items():
+                submitted[key] = (job.id, False)
+        return [submitted[key] for key in keys]
+
+    @staticmethod
+    def create_jobs(jobs):
+        """Save jobs and their input data with a constant number of queries
+
+        :param jobs: unsaved jobs with unsaved input data
+        :type jobs: iterable of PreprocessorJob
+        """
+        jobs = list(jobs)
+        date_submitted = timezone.now()
+        for job in jobs:
+            job.date_submitted = date_submitted
+        with transaction.atomic():
+            # the job to input data reference is only checked on commit
+            PreprocessorJob.objects.bulk_create(jobs)
+            PreprocessorJobData.objects.bulk_create([job.input_data for job in jobs])
+
+
+class ProteinViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all proteins"""
     queryset = Protein.objects.all()
     serializer_class = ProteinSerializer
+    # the structure file is stored in the file blob
+    heavy_fields = {'file_string': []}
+    etag_fields = ['id', 'content_hash', 'date_last_accessed']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'file_string' in self.selected_fields:
+            queryset = queryset.select_related('file_blob')
+        return queryset
 
-class LigandViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+    @extend_schema(responses={(200, 'chemical/x-pdb'): OpenApiTypes.BINARY})
+    @action(detail=True, url_path='file')
+    def download_file(self, request, pk=None):
+        """Download the structure file of a protein.
+
+        The file is streamed, gzip encoded if the client accepts it and single byte ranges are
+        supported.
+        """
+        protein = get_object_or_404(annotate_compressed_sizes(
+            Protein.objects.only('id', 'name', 'file_type'), 'file_blob__content',
+            'file_blob__size'), pk=pk)
+        return compressed_file_response(
+            request, CompressedContent.from_object(protein, 'file_blob__content'),
+            f'{protein.name}.{protein.file_type}', get_content_type(protein.file_type))
+
+
+class LigandViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all ligands"""
     queryset = Ligand.objects.all()
     serializer_class = LigandSerializer
+    heavy_fields = {'file_string': ['file_string']}
+    etag_fields = ['id', 'content_hash']
+
+    @extend_schema(responses={(200, 'chemical/x-mdl-sdfile'): OpenApiTypes.BINARY})
+    @action(detail=True, url_path='file')
+    def download_file(self, request, pk=None):
+        """Download the structure file of a ligand.
+
+        The file is streamed, gzip encoded if the client accepts it and single byte ranges are
+        supported.
+        """
+        ligand = get_object_or_404(annotate_compressed_sizes(
+            Ligand.objects.only('id', 'name', 'file_type'), 'file_string'), pk=pk)
+        return compressed_file_response(
+            request, CompressedContent.from_object(ligand, 'file_string'),
+            f'{ligand.name}.{ligand.file_type}', get_content_type(ligand.file_type))
 
 
-class ProteinSiteViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class ProteinSiteViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all ProteinSite"""
     queryset = ProteinSite.objects.all()
     serializer_class = ProteinSiteSerializer
+    etag_fields = ['id', 'content_hash']
 
 
-class ElectronDensityMapViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class ElectronDensityMapViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all electron density maps"""
     queryset = ElectronDensityMap.objects.all()
     serializer_class = ElectronDensityMapSerializer
+    etag_fields = ['id', 'content_hash', 'date_last_accessed']
 
 
-class PreprocessorJobDataViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class PreprocessorJobDataViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve the specific or list of all the preprocessor job input data"""
     queryset = PreprocessorJobData.objects.all()
     serializer_class = PreprocessorJobDataSerializer
+    heavy_fields = {
+        'input_protein_string': ['input_protein_string'],
+        'input_ligand_string': ['input_ligand_string'],
+    }
+    etag_fields = ['id']
+    immutable = True
 
 
-class PreprocessorJobViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class PreprocessorJobViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all preprocessor jobs"""
     queryset = PreprocessorJob.objects.all()
     serializer_class = PreprocessorJobSerializer
+    expandable_fields = {
+        'input_data': (PreprocessorJobDataSerializer, ['input_data']),
+        'output_protein': (
+            ProteinSerializer, ['output_protein__file_blob', 'output_protein__ligand_set']),
+    }
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poseview', '0002_job_timings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='poseviewjob',
+            index=models.Index(fields=['date_created', 'id'], name='poseview_po_date_cr_4d6054_idx'),
+        ),
+    ]
@@ -5,6 +5,7 @@ import subprocess
 from tempfile import NamedTemporaryFile
 
 from proteins_plus import settings
+from proteins_plus.job_handler import Phase, record_phase, run_subprocess
 
 logger = logging.getLogger(__name__)
 
@@ -19,8 +20,10 @@ class PoseviewWrapper:
         :param job: Poseview job
         :type job: PoseviewJob
         """
-        image = PoseviewWrapper.execute_poseview(job)
-        job.image.save(os.path.basename(image.name), image)
+        with record_phase(job, Phase.INPUT_STAGING):
+            image = PoseviewWrapper.execute_poseview(job)
+        with record_phase(job, Phase.RESULT_LOADING):
+            job.image.save(os.path.basename(image.name), image)
 
     @staticmethod
     def execute_poseview(job):
@@ -43,7 +46,6 @@ class PoseviewWrapper:
                     '-t', '',  # don't write text to the image
                     '-o', image.name
                 ]
-                logger.info('Executing command line call: %s', " ".join(args))
                 poseview_directory = os.path.dirname(settings.BINARIES['poseview'])
-                subprocess.check_call(args, stdout=subprocess.DEVNULL, cwd=poseview_directory)
+                run_subprocess(job, args, stdout=subprocess.DEVNULL, cwd=poseview_directory)
         return image
@@ -13,7 +13,7 @@ def poseview_task(job_id):
     :param job_id: id of the job to execute
     :type job_id: uuid
     """
-    execute_job(poseview, job_id, PoseviewJob, 'Poseview')
+    execute_job(poseview, job_id, PoseviewJob, 'Poseview', binary='poseview')
 
 
 def poseview(job):
@@ -1,13 +1,13 @@
 """Poseview Views"""
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema
 
 from proteins_plus.serializers import ProteinsPlusJobResponseSerializer
 from proteins_plus.job_handler import submit_task
+from proteins_plus.views import ProteinsPlusReadOnlyViewSet
 from molecule_handler.models import Protein, Ligand
 
 from .models import PoseviewJob
@@ -74,7 +74,7 @@ class PoseviewView(APIView):
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class PoseviewJobViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class PoseviewJobViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all PoseView jobs"""
     queryset = PoseviewJob.objects.all()
     serializer_class = PoseviewJobSerializer
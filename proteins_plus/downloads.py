@@ -0,0 +1,426 @@
+"""Streaming downloads of compressed database contents
+
+Contents of compressed fields are sent without loading them into memory as a whole. The compressed
+content is read in chunks with substring queries and decompressed chunk by chunk, or sent as it is
+if the client accepts gzip encoded responses.
+"""
+import re
+import struct
+import tarfile
+from urllib.parse import quote
+import zlib
+from django.db.models import BigIntegerField, BinaryField, F, Value
+from django.db.models.functions import Cast, Length, Substr
+from django.http import HttpResponse, StreamingHttpResponse
+
+CHUNK_SIZE = 64 * 1024
+# compressed bytes read by each substring query
+QUERY_CHUNK_SIZE = 1024 * 1024
+FILE_CONTENT_TYPES = {
+    'pdb': 'chemical/x-pdb',
+    'cif': 'chemical/x-cif',
+    'sdf': 'chemical/x-mdl-sdfile',
+    'mol': 'chemical/x-mdl-molfile',
+    'mol2': 'chemical/x-mol2',
+}
+# gzip member header without file name and modification time
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+# zlib wraps the deflate stream in a 2 byte header and a 4 byte checksum
+ZLIB_HEADER_SIZE = 2
+ZLIB_TRAILER_SIZE = 4
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)')
+UNSAFE_FILENAME_PATTERN = re.compile(r'[^\x20-\x7e]|["\\]')
+
+
+def get_content_type(file_type):
+    """Get the content type of a structure file type
+
+    :param file_type: file type like pdb or sdf
+    :type file_type: str
+    :return: content type
+    :rtype: str
+    """
+    return FILE_CONTENT_TYPES.get(file_type, 'text/plain')
+
+
+def get_content_disposition(filename):
+    """Build the Content-Disposition header of a download
+
+    The file name is sent RFC 5987 encoded with a sanitized ASCII fallback for old clients, so names
+    with quotes, line breaks or non-ASCII characters cannot break the header.
+
+    :param filename: file name suggested to the client
+    :type filename: str
+    :return: header value
+    :rtype: str
+    """
+    fallback = UNSAFE_FILENAME_PATTERN.sub('_', filename)
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename, safe="")}'
+
+
+def annotate_compressed_sizes(queryset, field_name, size_field=None):
+    """Annotate a queryset with the sizes of a compressed field without loading its content
+
+    The compressed size is available as "compressed_size", the decompressed size as
+    "content_size" if it is stored in size_field and None otherwise. Read the content with
+    CompressedContent.from_object.
+
+    :param queryset: queryset of the model with the compressed field
+    :type queryset: django.db.models.QuerySet
+    :param field_name: name of or lookup to the compressed field
+    :type field_name: str
+    :param size_field: name of or lookup to the field storing the decompressed size
+    :type size_field: str or None
+    :return: annotated queryset
+    :rtype: django.db.models.QuerySet
+    """
+    return queryset.annotate(
+        compressed_size=Length(Cast(field_name, output_field=BinaryField())),
+        content_size=F(size_field) if size_field is not None
+        else Value(None, output_field=BigIntegerField()))
+
+
+def _decompress(decompressor, data):
+    """Feed data to a decompressor and get its output in chunks of at most CHUNK_SIZE bytes
+
+    :param decompressor: zlib decompressor
+    :type decompressor: zlib.Decompress
+    :param data: compressed data
+    :type data: bytes
+    :return: decompressed chunks
+    :rtype: generator
+    """
+    while data:
+        chunk = decompressor.decompress(data, CHUNK_SIZE)
+        data = decompressor.unconsumed_tail
+        if chunk:
+            yield chunk
+
+
+def decompressed_chunks(compressed_chunks):
+    """Decompress a zlib compressed content chunk by chunk
+
+    :param compressed_chunks: chunks of the compressed content
+    :type compressed_chunks: iterable of bytes
+    :return: decompressed chunks of at most CHUNK_SIZE bytes
+    :rtype: generator
+    """
+    decompressor = zlib.decompressobj()
+    for compressed in compressed_chunks:
+        yield from _decompress(decompressor, compressed)
+    chunk = decompressor.flush()
+    if chunk:
+        yield chunk
+
+
+def gzip_chunks(deflate_chunks):
+    """Wrap a deflate stream in gzip without compressing it again
+
+    zlib and gzip wrap the same deflate stream, only the header and the checksum differ. The
+    checksum of gzip is computed while the stream is sent.
+
+    :param deflate_chunks: chunks of the deflate stream of a zlib compressed content
+    :type deflate_chunks: iterable of bytes
+    :return: chunks of the gzip encoded content
+    :rtype: generator
+    """
+    yield GZIP_HEADER
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    checksum = 0
+    size = 0
+    for compressed in deflate_chunks:
+        yield compressed
+        for chunk in _decompress(decompressor, compressed):
+            checksum = zlib.crc32(chunk, checksum)
+            size += len(chunk)
+    chunk = decompressor.flush()
+    yield struct.pack('<II', zlib.crc32(chunk, checksum), (size + len(chunk)) & 0xffffffff)
+
+
+class CompressedContent:
+    """zlib compressed content of a field of a database object
+
+    The content is read with one substring query per QUERY_CHUNK_SIZE compressed bytes, so memory
+    use does not depend on its size.
+    """
+
+    def __init__(self, queryset, field_name, compressed_size, size=None):
+        """Construct a new content
+
+        :param queryset: queryset selecting the object with the content
+        :type queryset: django.db.models.QuerySet
+        :param field_name: name of or lookup to the compressed field
+        :type field_name: str
+        :param compressed_size: size of the compressed content in bytes
+        :type compressed_size: int
+        :param size: size of the decompressed content in bytes, None if it is not stored
+        :type size: int or None
+        """
+        self.queryset = queryset
+        self.field_name = field_name
+        self.compressed_size = compressed_size or 0
+        self.size = size
+
+    @staticmethod
+    def from_object(obj, field_name):
+        """Get the content of an object loaded with annotate_compressed_sizes
+
+        :param obj: object with annotated sizes
+        :type obj: django.db.models.Model
+        :param field_name: name of or lookup to the compressed field
+        :type field_name: str
+        :return: content of the object
+        :rtype: CompressedContent
+        """
+        return CompressedContent(type(obj).objects.filter(pk=obj.pk), field_name,
+                                 obj.compressed_size, obj.content_size)
+
+    def compressed_chunks(self, start=0, end=None):
+        """Read the compressed content chunk by chunk
+
+        :param start: first byte to read
+        :type start: int
+        :param end: end of the bytes to read, exclusive, the end of the content if None
+        :type end: int or None
+        :return: chunks of the compressed content
+        :rtype: generator
+        """
+        end = self.compressed_size if end is None else end
+        field = Cast(self.field_name, output_field=BinaryField())
+        for offset in range(start, end, QUERY_CHUNK_SIZE):
+            # substring positions start at 1
+            chunk = Substr(field, offset + 1, min(QUERY_CHUNK_SIZE, end - offset),
+                           output_field=BinaryField())
+            yield bytes(self.queryset.annotate(chunk=chunk).values_list('chunk', flat=True).get())
+
+    def chunks(self):
+        """Read and decompress the content chunk by chunk
+
+        :return: decompressed chunks of at most CHUNK_SIZE bytes
+        :rtype: generator
+        """
+        return decompressed_chunks(self.compressed_chunks())
+
+    def gzip_chunks(self):
+        """Read the content chunk by chunk as gzip without compressing it again
+
+        :return: chunks of the gzip encoded content
+        :rtype: generator
+        """
+        return gzip_chunks(self.compressed_chunks(
+            ZLIB_HEADER_SIZE, self.compressed_size - ZLIB_TRAILER_SIZE))
+
+    def get_size(self):
+        """Get the size of the decompressed content
+
+        Contents without a stored size are decompressed once chunk by chunk to count it.
+
+        :return: size in bytes
+        :rtype: int
+        """
+        if self.size is None:
+            self.size = sum(len(chunk) for chunk in self.chunks())
+        return self.size
+
+
+def sliced_chunks(chunks, start, end):
+    """Restrict chunks of a content to a byte range
+
+    :param chunks: chunks of the content
+    :type chunks: iterable
+    :param start: first byte of the range
+    :type start: int
+    :param end: end of the range, exclusive
+    :type end: int
+    :return: chunks of the byte range
+    :rtype: generator
+    """
+    offset = 0
+    for chunk in chunks:
+        if offset >= end:
+            return
+        if offset + len(chunk) > start:
+            yield chunk[max(start - offset, 0):end - offset]
+        offset += len(chunk)
+
+
+def parse_range(header, size):
+    """Parse a single byte range of a Range header
+
+    Multiple ranges are not supported, the complete content is sent instead.
+
+    :param header: value of the Range header
+    :type header: str
+    :param size: size of the content in bytes
+    :type size: int
+    :return: start and exclusive end of the range, None if the header is not supported and
+        (size, size) if the range cannot be satisfied
+    :rtype: tuple(int, int) or None
+    """
+    match = RANGE_PATTERN.fullmatch(header.strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # suffix range of the last bytes
+        if int(last) == 0:
+            return size, size
+        return max(size - int(last), 0), size
+    if last and int(last) < int(first):
+        return None
+    start = min(int(first), size)
+    end = min(int(last) + 1, size) if last else size
+    return start, end
+
+
+def accepts_gzip(request):
+    """Check whether a client accepts gzip encoded responses
+
+    :param request: client request
+    :type request: django.http.HttpRequest
+    :return: Whether gzip is accepted
+    :rtype: bool
+    """
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+def compressed_file_response(request, content, filename, content_type):
+    """Stream a zlib compressed content as file download
+
+    Single byte ranges are supported. Clients accepting gzip get the compressed content as is,
+    other clients get it decompressed chunk by chunk.
+
+    :param request: client request
+    :type request: django.http.HttpRequest
+    :param content: zlib compressed content
+    :type content: CompressedContent
+    :param filename: file name suggested to the client
+    :type filename: str
+    :param content_type: content type of the decompressed content
+    :type content_type: str
+    :return: streaming response
+    :rtype: django.http.HttpResponse
+    """
+    range_header = request.META.get('HTTP_RANGE')
+    size = content.get_size() if range_header else 0
+    byte_range = parse_range(range_header, size) if range_header else None
+    if byte_range is not None:
+        start, end = byte_range
+        if start >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        response = StreamingHttpResponse(
+            sliced_chunks(content.chunks(), start, end),
+            status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        response['Content-Length'] = end - start
+    elif accepts_gzip(request):
+        response = StreamingHttpResponse(content.gzip_chunks(), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(content.chunks(), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    response['Vary'] = 'Accept-Encoding'
+    response['Content-Disposition'] = get_content_disposition(filename)
+    return response
+
+
+class _ChunkReader:
+    """Minimal file object reading from an iterable of chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        """Read up to size bytes, all remaining bytes if size is negative
+
+        :param size: maximum number of bytes to read
+        :type size: int
+        :return: read bytes
+        :rtype: bytes
+        """
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class _StreamBuffer:
+    """Write only file object collecting written data until it is taken"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        """Collect data
+
+        :param data: written data
+        :type data: bytes
+        """
+        self.chunks.append(bytes(data))
+
+    def take(self):
+        """Take the data written since the last call
+
+        :return: written data
+        :rtype: bytes
+        """
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def tar_chunks(members, compress=False):
+    """Write compressed contents into a tar stream
+
+    The members are read and decompressed chunk by chunk.
+
+    :param members: file names and zlib compressed contents
+    :type members: iterable of tuple(str, CompressedContent)
+    :param compress: Whether the tar stream should be gzip compressed
+    :type compress: bool
+    :return: chunks of the tar stream
+    :rtype: generator
+    """
+    buffer = _StreamBuffer()
+    with tarfile.open(fileobj=buffer, mode='w|gz' if compress else 'w|',
+                      bufsize=CHUNK_SIZE) as archive:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = content.get_size()
+            archive.addfile(info, _ChunkReader(content.chunks()))
+            data = buffer.take()
+            if data:
+                yield data
+    yield buffer.take()
+
+
+def tar_response(request, members, filename):
+    """Stream compressed contents as tar archive download
+
+    Clients accepting gzip get a gzip compressed archive.
+
+    :param request: client request
+    :type request: django.http.HttpRequest
+    :param members: file names and zlib compressed contents
+    :type members: iterable of tuple(str, CompressedContent)
+    :param filename: file name of the archive suggested to the client
+    :type filename: str
+    :return: streaming response
+    :rtype: django.http.StreamingHttpResponse
+    """
+    compress = accepts_gzip(request)
+    response = StreamingHttpResponse(
+        tar_chunks(members, compress=compress), content_type='application/x-tar')
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    response['Vary'] = 'Accept-Encoding'
+    response['Content-Disposition'] = get_content_disposition(filename)
+    return response
@@ -0,0 +1,97 @@
+"""Custom model fields for proteins_plus models"""
+import zlib
+from django.db import migrations, models
+
+COMPRESSION_LEVEL = 6
+MIGRATION_BATCH_SIZE = 100
+
+
+class CompressedFieldMixin:
+    """Store the text representation of a field compressed in a binary column
+
+    The value of the field on a model instance is unchanged, it is only compressed when it is
+    written to the database and decompressed when it is read. Lookups on compressed fields are not
+    supported, neither exact ones nor lookups inside the content (contains, JSON keys, ...). Look
+    objects up by the content_hash of their content instead.
+    """
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        return connection.Database.Binary(zlib.compress(value.encode('utf-8'), COMPRESSION_LEVEL))
+
+    def from_db_value(self, value, expression, connection):
+        """Decompress a value read from the database
+
+        :param value: compressed value
+        :type value: bytes or memoryview
+        :param expression: expression the value was selected with
+        :param connection: database connection
+        :return: decompressed value
+        """
+        if value is None:
+            return None
+        value = zlib.decompress(bytes(value)).decode('utf-8')
+        from_db_value = getattr(super(), 'from_db_value', None)
+        if from_db_value is not None:
+            return from_db_value(value, expression, connection)
+        return value
+
+
+class CompressedTextField(CompressedFieldMixin, models.TextField):
+    """TextField that is stored compressed"""
+
+
+class CompressedJSONField(CompressedFieldMixin, models.JSONField):
+    """JSONField that is stored compressed"""
+
+
+def copy_field_values(model, source, target):
+    """Copy the values of a field into another field in batches
+
+    :param model: historical model
+    :param source: name of the field to copy from
+    :param target: name of the field to copy to
+    """
+    batch = []
+    for instance in model.objects.only('id', source).iterator(chunk_size=MIGRATION_BATCH_SIZE):
+        setattr(instance, target, getattr(instance, source))
+        batch.append(instance)
+        if len(batch) == MIGRATION_BATCH_SIZE:
+            model.objects.bulk_update(batch, [target])
+            batch = []
+    model.objects.bulk_update(batch, [target])
+
+
+def compress_field_values(app_label, fields):
+    """Create the migration operation copying plain values into their compressed fields
+
+    The compressed field of a plain field is expected to be named <field>_compressed. Migrating
+    backwards copies the compressed values back into the plain fields.
+
+    :param app_label: label of the app of the models
+    :type app_label: str
+    :param fields: pairs of model name and plain field name
+    :type fields: list[tuple[str, str]]
+    :return: migration operation
+    :rtype: django.db.migrations.RunPython
+    """
+
+    def compress(apps, schema_editor):
+        """Copy the plain values into the compressed fields"""
+        for model_name, field_name in fields:
+            copy_field_values(
+                apps.get_model(app_label, model_name), field_name, f'{field_name}_compressed')
+
+    def decompress(apps, schema_editor):
+        """Copy the compressed values back into the plain fields"""
+        for model_name, field_name in fields:
+            copy_field_values(
+                apps.get_model(app_label, model_name), f'{field_name}_compressed', field_name)
+
+    return migrations.RunPython(compress, decompress)
@@ -1,11 +1,33 @@
 """Common classes and functions for all apps"""
+from contextlib import contextmanager
 import logging
+import os
+import resource
+import signal
+import subprocess
+import tempfile
+import time
 import traceback
+import redis
+from celery import current_task
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
 from rest_framework import serializers
 from drf_spectacular.utils import extend_schema_field, OpenApiTypes
+from .metrics import JOB_DURATION, JOB_SUBMISSIONS, RESOURCE_REQUEUES, SUBPROCESS_EXITS
+from .resource_budget import release, try_reserve
 
 logger = logging.getLogger(__name__)
 
+_redis_client = None
+
+CANCELLED_ERROR = 'The job was cancelled.'
+# error output of binaries that failed to allocate memory, e.g. with ENOMEM at the address space
+# limit
+MEMORY_ERROR_MARKERS = ('std::bad_alloc', 'Cannot allocate memory', 'MemoryError',
+                        'out of memory', 'Out of memory')
+
 
 class Status:  # pylint: disable=too-few-public-methods
     """Class wrapping a status enum"""
@@ -14,6 +36,8 @@ class Status:  # pylint: disable=too-few-public-methods
     SUCCESS = 's'
     FAILURE = 'f'
 
+    FINISHED = (SUCCESS, FAILURE)
+
     DETAILED = {PENDING: 'pending', RUNNING: 'running', SUCCESS: 'success', FAILURE: 'failure'}
 
     choices = [
@@ -35,6 +59,310 @@ class Status:  # pylint: disable=too-few-public-methods
         return Status.DETAILED[status]
 
 
+class JobTimeoutError(RuntimeError):
+    """Raised if a binary exceeds its time limit"""
+
+
+class JobCancelledError(RuntimeError):
+    """Raised if a job is cancelled while its binary is running"""
+
+
+class ResourceLimitError(RuntimeError):
+    """Raised if a binary failed after exceeding its memory, CPU time or open file limit"""
+
+
+class Phase:  # pylint: disable=too-few-public-methods
+    """Class wrapping the phases of a job execution that are timed"""
+    QUEUE_WAIT = 'queue_wait'
+    INPUT_STAGING = 'input_staging'
+    EXTERNAL_FETCH = 'external_fetch'
+    SUBPROCESS = 'subprocess'
+    SUBPROCESS_CPU = 'subprocess_cpu'
+    RESULT_LOADING = 'result_loading'
+    DATABASE = 'database'
+    TOTAL = 'total'
+
+
+class PhaseTimer:
+    """Accumulates the time spent in each phase of a job execution
+
+    Phases can be nested. The time of a nested phase is only counted for the nested phase, e.g.
+    the time of database queries during result loading is not counted as result loading.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._nested_times = []
+
+    @contextmanager
+    def phase(self, name):
+        """Time a phase
+
+        :param name: name of the phase
+        :type name: str
+        """
+        start = time.perf_counter()
+        self._nested_times.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add(name, elapsed - self._nested_times.pop())
+            if self._nested_times:
+                self._nested_times[-1] += elapsed
+
+    def add(self, name, seconds):
+        """Add time to a phase
+
+        :param name: name of the phase
+        :type name: str
+        :param seconds: time to add
+        :type seconds: float
+        """
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def time_query(self, execute, sql, params, many, context):
+        """Database execute wrapper timing all queries as database phase"""
+        with self.phase(Phase.DATABASE):
+            return execute(sql, params, many, context)
+
+    def rounded_timings(self):
+        """Get the timings rounded to milliseconds
+
+        :return: seconds per phase
+        :rtype: dict
+        """
+        return {name: round(seconds, 3) for name, seconds in self.timings.items()}
+
+
+@contextmanager
+def record_phase(job, name):
+    """Time a phase of a job execution
+
+    Does nothing if the job is not executed by execute_job.
+
+    :param job: job that is executed
+    :type job: ProteinsPlusJob
+    :param name: name of the phase, see Phase
+    :type name: str
+    """
+    timer = getattr(job, 'phase_timer', None)
+    if timer is None:
+        yield
+    else:
+        with timer.phase(name):
+            yield
+
+
+def is_cancelled(job):
+    """Check whether a job has been cancelled since it was started
+
+    :param job: running job
+    :type job: ProteinsPlusJob
+    :return: Whether the job has been cancelled
+    :rtype: bool
+    """
+    return type(job).objects.filter(id=job.id, status=Status.FAILURE).exists()
+
+
+def cancel_job(job_type, job_id):
+    """Cancel a pending or running job
+
+    The job is marked as failed right away. A worker running the job kills its binary within
+    settings.SUBPROCESS_POLL_INTERVAL and a pending job is skipped by the worker.
+
+    :param job_type: Database table in which to find the job object
+    :type job_type: django.db.models.Model
+    :param job_id: Id of the job object
+    :type job_id: uuid.UUID
+    :return: Whether the job was cancelled, False if it had already finished
+    :rtype: bool
+    """
+    cancelled = job_type.objects.filter(
+        id=job_id, status__in=(Status.PENDING, Status.RUNNING)
+    ).update(status=Status.FAILURE, hash_value=None, error=CANCELLED_ERROR)
+    if cancelled:
+        publish_status(job_type.objects.get(id=job_id))
+    return bool(cancelled)
+
+
+def _kill_process_group(process):
+    """Terminate a process and all its children, kill them if they do not exit in time
+
+    :param process: process started in its own session
+    :type process: subprocess.Popen
+    """
+    for kill_signal in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, kill_signal)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(timeout=settings.SUBPROCESS_KILL_GRACE_PERIOD)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def _wait_for_process(job, process, timeout):
+    """Wait for a process while checking whether the job has been cancelled
+
+    :param job: job the process runs for
+    :type job: ProteinsPlusJob
+    :param process: running process
+    :type process: subprocess.Popen
+    :param timeout: time limit in seconds
+    :type timeout: float
+    :raises JobTimeoutError: If the process exceeds the time limit
+    :raises JobCancelledError: If the job is cancelled
+    :return: exit code and resource usage of the process
+    :rtype: tuple(int, resource.struct_rusage)
+    """
+    deadline = time.monotonic() + timeout
+    next_cancel_check = time.monotonic() + settings.SUBPROCESS_POLL_INTERVAL
+    delay = 0.0005
+    while True:
+        pid, wait_status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid == process.pid:
+            process.returncode = os.waitstatus_to_exitcode(wait_status)
+            return process.returncode, usage
+        now = time.monotonic()
+        if now >= deadline:
+            raise JobTimeoutError(
+                f'{os.path.basename(process.args[0])} exceeded the time limit of '
+                f'{timeout} seconds.')
+        if now >= next_cancel_check:
+            next_cancel_check = now + settings.SUBPROCESS_POLL_INTERVAL
+            if job.id is not None and is_cancelled(job):
+                raise JobCancelledError(CANCELLED_ERROR)
+        # back off like subprocess.Popen.wait to keep short runs responsive
+        delay = min(delay * 2, deadline - now, 0.05)
+        time.sleep(delay)
+
+
+def _set_resource_limits(limits):
+    """Build a function limiting the resources of a process before its binary is executed
+
+    :param limits: address space in MB, CPU time in seconds and number of open files, a limit of
+        None is not applied
+    :type limits: dict
+    :return: function to be run in the child process
+    :rtype: function
+    """
+    rlimits = []
+    if limits.get('memory') is not None:
+        address_space = limits['memory'] * 2**20
+        rlimits.append((resource.RLIMIT_AS, (address_space, address_space)))
+    if limits.get('cpu_time') is not None:
+        # SIGXCPU is sent at the soft limit, SIGKILL at the hard limit
+        rlimits.append((resource.RLIMIT_CPU, (limits['cpu_time'], limits['cpu_time'] + 5)))
+    if limits.get('open_files') is not None:
+        hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[1]
+        open_files = limits['open_files'] if hard_limit == resource.RLIM_INFINITY \
+            else min(limits['open_files'], hard_limit)
+        rlimits.append((resource.RLIMIT_NOFILE, (open_files, open_files)))
+
+    def set_limits():
+        for rlimit, values in rlimits:
+            resource.setrlimit(rlimit, values)
+    return set_limits
+
+
+def _get_exceeded_limit(limits, exit_code, usage, error_output):
+    """Find the resource limit a failed process has exceeded
+
+    The CPU time limit is detected by its signal. The address space limit makes allocations fail,
+    which is only certain if the binary reports it. Binaries crashing with a signal that failed
+    allocations typically cause may have exceeded it, which is reported as probable. The resident
+    memory is not compared with the address space limit, these are different quantities.
+
+    :param limits: limits of the process
+    :type limits: dict
+    :param exit_code: exit code of the process, negative if it was killed by a signal
+    :type exit_code: int
+    :param usage: resource usage of the process
+    :type usage: resource.struct_rusage
+    :param error_output: end of the error output of the process
+    :type error_output: str
+    :return: description of the exceeded limit or None
+    :rtype: str
+    """
+    cpu_time = usage.ru_utime + usage.ru_stime
+    if limits.get('cpu_time') is not None and (
+            exit_code == -signal.SIGXCPU
+            or (exit_code == -signal.SIGKILL and cpu_time >= limits['cpu_time'])):
+        return f'exceeded the CPU time limit of {limits["cpu_time"]} seconds'
+    if limits.get('memory') is not None:
+        if any(marker in error_output for marker in MEMORY_ERROR_MARKERS):
+            return f'exceeded the memory limit of {limits["memory"]} MB'
+        if exit_code in (-signal.SIGSEGV, -signal.SIGABRT, -signal.SIGBUS):
+            return (f'was killed by {signal.Signals(-exit_code).name} and probably exceeded '
+                    f'the memory limit of {limits["memory"]} MB')
+    if limits.get('open_files') is not None and 'Too many open files' in error_output:
+        return f'exceeded the limit of {limits["open_files"]} open files'
+    return None
+
+
+def run_subprocess(job, args, **kwargs):
+    """Run a binary for a job and record its wall and CPU time
+
+    The binary runs in its own process group with the address space, CPU time and open file limits
+    of the job. The whole group is killed if the binary exceeds the time limit of the job or if
+    the job is cancelled.
+
+    :param job: job the binary is run for
+    :type job: ProteinsPlusJob
+    :param args: command line arguments
+    :type args: list
+    :param kwargs: further arguments of subprocess.Popen
+    :raises CalledProcessError: If the binary exits with a non-zero exit code
+    :raises ResourceLimitError: If the binary failed after exceeding one of its resource limits
+    :raises JobTimeoutError: If the binary exceeds the time limit
+    :raises JobCancelledError: If the job is cancelled
+    :return: exit code
+    :rtype: int
+    """
+    logger.info('Executing command line call: %s', " ".join(args))
+    timeout = getattr(job, 'subprocess_timeout', settings.DEFAULT_BINARY_TIMEOUT)
+    limits = getattr(job, 'subprocess_limits', settings.DEFAULT_BINARY_LIMITS)
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    exit_code = 'none'
+    try:
+        with record_phase(job, Phase.SUBPROCESS), tempfile.TemporaryFile() as error_file:
+            kwargs.setdefault('stderr', error_file)
+            with subprocess.Popen(args, start_new_session=True,
+                                  preexec_fn=_set_resource_limits(limits), **kwargs) as process:
+                try:
+                    exit_code, usage = _wait_for_process(job, process, timeout)
+                except BaseException:
+                    _kill_process_group(process)
+                    raise
+            error_file.seek(-min(os.fstat(error_file.fileno()).st_size, 2**16), os.SEEK_END)
+            error_output = error_file.read().decode(errors='replace')
+        if error_output:
+            logger.info('Error output of %s:\n%s', args[0], error_output)
+        if exit_code != 0:
+            exceeded_limit = _get_exceeded_limit(limits, exit_code, usage, error_output)
+            if exceeded_limit is not None:
+                raise ResourceLimitError(f'{os.path.basename(args[0])} {exceeded_limit}.')
+            raise subprocess.CalledProcessError(exit_code, args)
+        return exit_code
+    except JobTimeoutError:
+        exit_code = 'timeout'
+        raise
+    except JobCancelledError:
+        exit_code = 'cancelled'
+        raise
+    finally:
+        SUBPROCESS_EXITS.inc(binary=os.path.basename(args[0]), exit_code=exit_code)
+        usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        timer = getattr(job, 'phase_timer', None)
+        if timer is not None:
+            timer.add(Phase.SUBPROCESS_CPU,
+                      usage_after.ru_utime - usage_before.ru_utime
+                      + usage_after.ru_stime - usage_before.ru_stime)
+
+
 @extend_schema_field(OpenApiTypes.STR)
 class StatusField(serializers.Field):  # pylint: disable=abstract-method
     """Custom serializer field for status"""
@@ -43,31 +371,133 @@ class StatusField(serializers.Field):  # pylint: disable=abstract-method
         return Status.to_string(value)
 
 
-def execute_job(task, job_id, job_type, tool_name):
+def execute_job(task, job_id, job_type, tool_name, binary=None):
     """Execute Job as a celery task following a centralized workflow
 
+    The time spent in each phase of the execution is stored in the timings of the job. If the
+    resource budget of the binary is exhausted on this node, the job is put back into its queue
+    with its priority. The delay doubles with every requeue up to settings.RESOURCE_RETRY_MAX_DELAY
+    and the job fails after settings.RESOURCE_MAX_REQUEUES requeues.
+
     :param task: task to be executed
     :type task: function
     :param job_id: Id of the job object
     :type job_id: int
     :param job_type: Database table in which to find the job object
     :type job_type: django.db.models.Model
+    :param tool_name: name of the tool used in error messages
+    :type tool_name: str
+    :param binary: name of the binary in settings.BINARY_RESOURCES, None for no budget
+    :type binary: str
     :raises error: If an error occurs during job execution
+    :raises celery.exceptions.Retry: If the job is put back into its queue
     """
+    if binary is not None and not try_reserve(binary):
+        celery_task = current_task
+        if celery_task is not None and not celery_task.request.called_directly \
+                and not celery_task.request.is_eager:
+            requeues = celery_task.request.retries
+            if requeues >= settings.RESOURCE_MAX_REQUEUES:
+                logger.warning('Resource budget of %s exhausted %s times. Failing %s with id %s.',
+                               binary, requeues, job_type, job_id)
+                _fail_pending_job(job_type, job_id, f'The execution of {tool_name} was aborted. '
+                                  'The server is busy, please try again later.')
+                return
+            delay = min(settings.RESOURCE_RETRY_DELAY * 2 ** requeues,
+                        settings.RESOURCE_RETRY_MAX_DELAY)
+            logger.info('Resource budget of %s exhausted. Requeueing %s with id %s in %s '
+                        'seconds (requeue %s).', binary, job_type, job_id, delay, requeues + 1)
+            RESOURCE_REQUEUES.inc(binary=binary)
+            # retry keeps the queue and priority of the task and counts the requeues
+            raise celery_task.retry(countdown=delay, max_retries=None)
+        while not try_reserve(binary):
+            time.sleep(settings.RESOURCE_RETRY_DELAY)
+    try:
+        _execute_job(task, job_id, job_type, tool_name, binary)
+    finally:
+        if binary is not None:
+            release(binary)
+
 
+def _fail_pending_job(job_type, job_id, error):
+    """Mark a job that has not been started as failed
+
+    :param job_type: Database table in which to find the job object
+    :type job_type: django.db.models.Model
+    :param job_id: Id of the job object
+    :type job_id: uuid.UUID
+    :param error: error message of the job
+    :type error: str
+    """
+    failed = job_type.objects.filter(id=job_id, status=Status.PENDING).update(
+        status=Status.FAILURE, hash_value=None, error=error)
+    if failed:
+        publish_status(job_type.objects.get(id=job_id))
+
+
+def _execute_job(task, job_id, job_type, tool_name, binary):
+    """Execute Job within the resource budget
+
+    :param task: task to be executed
+    :type task: function
+    :param job_id: Id of the job object
+    :type job_id: int
+    :param job_type: Database table in which to find the job object
+    :type job_type: django.db.models.Model
+    :param tool_name: name of the tool used in error messages
+    :type tool_name: str
+    :param binary: name of the binary in settings.BINARY_TIMEOUTS and settings.BINARY_LIMITS
+    :type binary: str
+    :raises error: If an error occurs during job execution
+    """
     logger.info('Started task. Executing %s on %s with id %s.', task, job_type, job_id)
     job = job_type.objects.get(id=job_id)
+    if job.status in Status.FINISHED:
+        logger.info('Skipping %s with id %s, it has been cancelled.', job_type, job_id)
+        return
+    timer = PhaseTimer()
+    if job.date_submitted is not None:
+        timer.add(Phase.QUEUE_WAIT, (timezone.now() - job.date_submitted).total_seconds())
+    job.phase_timer = timer
+    job.subprocess_timeout = settings.BINARY_TIMEOUTS.get(binary, settings.DEFAULT_BINARY_TIMEOUT)
+    job.subprocess_limits = settings.BINARY_LIMITS.get(binary, settings.DEFAULT_BINARY_LIMITS)
     try:
         job.status = Status.RUNNING
         job.save()
+        publish_status(job)
 
-        task(job)
+        # from now on every save checks that the job has not been cancelled
+        job.is_executing = True
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timer.time_query):
+                task(job)
+        finally:
+            timer.add(Phase.TOTAL, time.perf_counter() - start)
+        job.status = Status.SUCCESS
+        job.timings = timer.rounded_timings()
+        job.save()
+    except JobCancelledError:
+        # the cancellation already marked the job as failed
+        job_type.objects.filter(id=job_id).update(timings=timer.rounded_timings())
+        logger.info('Cancelled executing %s on %s with id %s.', task, job_type, job_id)
     except Exception as error:
+        JOB_DURATION.observe(timer.timings.get(Phase.TOTAL, 0.0), tool=job._meta.app_label,
+                             status=Status.to_string(Status.FAILURE))
         job.status = Status.FAILURE
         job.hash_value = None
-        job.error = f'An error occurred during the execution of {tool_name}.'
+        if isinstance(error, (JobTimeoutError, ResourceLimitError)):
+            job.error = f'The execution of {tool_name} was aborted. {error}'
+        else:
+            job.error = f'An error occurred during the execution of {tool_name}.'
         job.error_detailed = traceback.format_exc()
-        job.save()
+        job.timings = timer.rounded_timings()
+        try:
+            job.save()
+        except JobCancelledError:
+            logger.info('Cancelled executing %s on %s with id %s.', task, job_type, job_id)
+            return
+        publish_status(job)
 
         logger.error(
             'Error occurred during execution of task %s on %s with id %s.\n'
@@ -75,14 +505,23 @@ def execute_job(task, job_id, job_type, tool_name):
         )
         raise error
     else:
-        job.status = Status.SUCCESS
-        job.save()
+        JOB_DURATION.observe(timer.timings.get(Phase.TOTAL, 0.0), tool=job._meta.app_label,
+                             status=Status.to_string(Status.SUCCESS))
+        publish_status(job)
         logger.info('Successfully finished executing %s on %s with id %s.', task, job_type, job_id)
+    finally:
+        job.is_executing = False
 
 
 def submit_task(job, task, use_cache, immediate=False):
     """Retrieve an existing job from cache or start its execution
 
+    Identical submissions are executed only once. If an identical job is saved by another process
+    between the cache lookup and saving this job, the unique hash value makes saving fail and the
+    concurrently saved job is returned instead, whatever its status. Jobs that were saved before
+    they were submitted, e.g. to reference their input data, are deleted again if an identical job
+    is returned instead, so they are not left pending without a task.
+
     :param job: Job to be executed or retrieved from cache
     :type job: ProteinsPlusJob
     :param task: The task function to be called if no caching occurrs
@@ -99,10 +538,102 @@ def submit_task(job, task, use_cache, immediate=False):
     if use_cache and len(job.hash_attributes) != 0:
         cached_job = job.retrieve_job_from_cache()
     if cached_job is None:
-        job.save()
+        job.date_submitted = timezone.now()
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            if job.hash_value is None:
+                raise
+            # an identical job was submitted concurrently, attach to it
+            cached_job = job.__class__.objects.get(hash_value=job.hash_value)
+            logger.info('Attaching %s to identical in-flight job %s', job, cached_job)
+    if cached_job is None:
         task(job.id) if immediate else task.delay(job.id)
     else:
+        if not job._state.adding:
+            # the duplicate was saved by the caller before it was submitted
+            job.delete()
         job = cached_job
         retrieved = True
 
+    JOB_SUBMISSIONS.inc(tool=job._meta.app_label, retrieved=str(retrieved).lower())
     return job.id, retrieved
+
+
+def _get_redis_client():
+    """Get the redis client of this process used for job status notifications
+
+    :return: redis client
+    :rtype: redis.Redis
+    """
+    global _redis_client  # pylint: disable=global-statement
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.JOB_STATUS_REDIS_URL)
+    return _redis_client
+
+
+def _status_channel(job_id):
+    return f'job_status:{job_id}'
+
+
+def publish_status(job):
+    """Notify clients waiting on the job that its status changed
+
+    Notifications are best effort. Waiting clients always read the status from the database, so a
+    lost notification only delays them until their timeout.
+
+    :param job: Job whose status changed
+    :type job: ProteinsPlusJob
+    """
+    try:
+        _get_redis_client().publish(_status_channel(job.id), job.status)
+    except redis.RedisError as error:
+        logger.warning('Could not publish status of %s: %s', job, error)
+
+
+def wait_for_status_change(job_type, job_id, status, timeout):
+    """Wait until the status of a job differs from the given status or the timeout expires
+
+    Waiting is backed by the notifications of publish_status. If redis is not available, the
+    database is polled instead.
+
+    :param job_type: Database table in which to find the job object
+    :type job_type: django.db.models.Model
+    :param job_id: Id of the job object
+    :type job_id: uuid.UUID
+    :param status: status abbreviation known to the client
+    :type status: str
+    :param timeout: maximum time to wait in seconds
+    :type timeout: float
+    :raises job_type.DoesNotExist: If the job does not exist (anymore)
+    :return: current status abbreviation
+    :rtype: str
+    """
+    deadline = time.monotonic() + timeout
+    pubsub = None
+    try:
+        pubsub = _get_redis_client().pubsub(ignore_subscribe_messages=True)
+        # subscribe before reading the status to not miss a notification in between
+        pubsub.subscribe(_status_channel(job_id))
+    except redis.RedisError as error:
+        logger.debug('Falling back to polling the status of job %s: %s', job_id, error)
+        pubsub = None
+    try:
+        while True:
+            current_status = job_type.objects.values_list('status', flat=True).get(id=job_id)
+            remaining = deadline - time.monotonic()
+            if current_status != status or remaining <= 0:
+                return current_status
+            if pubsub is None:
+                time.sleep(min(settings.JOB_STATUS_POLL_INTERVAL, remaining))
+                continue
+            try:
+                pubsub.get_message(timeout=remaining)
+            except redis.RedisError as error:
+                logger.debug('Falling back to polling the status of job %s: %s', job_id, error)
+                pubsub.close()
+                pubsub = None
+    finally:
+        if pubsub is not None:
+            pubsub.close()
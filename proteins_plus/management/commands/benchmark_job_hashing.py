@@ -0,0 +1,105 @@
+"""Benchmark memory usage of hashing a job and its inputs"""
+import multiprocessing
+import os
+import resource
+import time
+from hashlib import blake2b
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from molecule_handler.models import Protein, ElectronDensityMap
+from ediascorer.models import EdiaJob
+
+MEGABYTE = 1024 * 1024
+
+
+def hash_materialized(job):
+    """Hash a job after building the whole hashable string of each content hashed input
+
+    :param job: job to hash
+    :type job: ProteinsPlusJob
+    :return: hex digest
+    :rtype: str
+    """
+    for value in (job.input_protein, job.electron_density_map):
+        value.set_content_hash(blake2b(value.generate_hashable_string()).hexdigest())
+    job.set_hash_value()
+    return job.hash_value
+
+
+def hash_streamed(job):
+    """Hash a job after feeding the content of each content hashed input piece by piece
+
+    :param job: job to hash
+    :type job: ProteinsPlusJob
+    :return: hex digest
+    :rtype: str
+    """
+    for value in (job.input_protein, job.electron_density_map):
+        value.set_content_hash()
+    job.set_hash_value()
+    return job.hash_value
+
+
+def measure(hash_function, job, results):
+    """Run a hash function in a child process and report its peak RSS increase
+
+    :param hash_function: function hashing the job
+    :type hash_function: function
+    :param job: job to hash
+    :type job: ProteinsPlusJob
+    :param results: queue to put (digest, peak RSS increase in MB, seconds) on
+    :type results: multiprocessing.Queue
+    """
+    # ru_maxrss is reported in KB on Linux
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    digest = hash_function(job)
+    seconds = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((digest, (rss_after - rss_before) / 1024, seconds))
+
+
+class Command(BaseCommand):
+    """Benchmark memory usage of hashing a job and its inputs"""
+    help = 'Compares peak memory of materialized and streamed content hashing of a synthetic ' \
+           'protein and electron density map, followed by hashing an EDIA job of both.'
+
+    def add_arguments(self, parser):
+        """Add commandline arguments
+
+        :param parser: The argument parser
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument('--protein_size', type=int, default=20,
+                            help='Size of the synthetic protein file string in MB.')
+        parser.add_argument('--density_size', type=int, default=200,
+                            help='Size of the synthetic density map in MB.')
+
+    def handle(self, *args, **options):
+        """Handle command line call"""
+        context = multiprocessing.get_context('fork')
+        with TemporaryDirectory() as directory:
+            density_path = Path(directory) / 'density.ccp4'
+            with density_path.open('wb') as density_file:
+                for _ in range(options['density_size']):
+                    density_file.write(os.urandom(MEGABYTE))
+
+            protein = Protein(
+                name='benchmark', file_string='A' * (options['protein_size'] * MEGABYTE))
+            for name, hash_function in (('materialized', hash_materialized),
+                                        ('streamed', hash_streamed)):
+                with density_path.open('rb') as density_file:
+                    density_map = ElectronDensityMap(
+                        file=File(density_file, name=density_path.name))
+                    job = EdiaJob(input_protein=protein, electron_density_map=density_map)
+                    results = context.Queue()
+                    process = context.Process(target=measure, args=(hash_function, job, results))
+                    process.start()
+                    digest, peak_rss, seconds = results.get()
+                    process.join()
+                self.stdout.write(
+                    f'{name:>12}: peak RSS +{peak_rss:.1f} MB, {seconds:.2f} s, {digest[:16]}')
@@ -0,0 +1,94 @@
+"""Benchmark canonicalization of JSON for hashing"""
+from copy import deepcopy
+import json
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from proteins_plus.utils import json_to_sorted_string, sort_json_lists
+
+
+def json_to_sorted_string_in_place(obj):
+    """Canonicalize JSON by deep-copying and sorting it with the JSON comparator
+
+    :param obj: the object
+    :type obj: object
+    :return: A unique string
+    :rtype: str
+    """
+    this_obj = deepcopy(obj)
+    sort_json_lists(this_obj)
+    return json.dumps(this_obj, sort_keys=True, separators=(',', ':'))
+
+
+def generate_residue_list(nof_residues):
+    """Generate a protein site description with a shuffled residue list
+
+    :param nof_residues: number of residues
+    :type nof_residues: int
+    :return: protein site description
+    :rtype: dict
+    """
+    residue_ids = [
+        {'name': random.choice(['ALA', 'GLY', 'HIS', 'THR']), 'position': str(position),
+         'chain': random.choice(['A', 'B'])}
+        for position in range(nof_residues)]
+    random.shuffle(residue_ids)
+    return {'residue_ids': residue_ids}
+
+
+def generate_nested_json(nof_entries, depth):
+    """Generate a list of nested dicts holding dicts and lists of scalars
+
+    :param nof_entries: number of list entries
+    :type nof_entries: int
+    :param depth: nesting depth of the dicts
+    :type depth: int
+    :return: nested JSON
+    :rtype: list
+    """
+
+    def generate_dict(current_depth):
+        entry = {
+            'name': random.choice(['ALA', 'GLY', 'HIS', 'THR']),
+            'tags': random.sample(['a', 'b', 'c', 'd', 'e', 'f'], 3),
+        }
+        if current_depth > 0:
+            entry['child'] = generate_dict(current_depth - 1)
+        return entry
+
+    return [generate_dict(depth) for _ in range(nof_entries)]
+
+
+class Command(BaseCommand):
+    """Benchmark canonicalization of JSON for hashing"""
+    help = 'Compares canonicalizing JSON with deepcopy and the JSON comparator to the sort key ' \
+           'based canonicalization used for hashing.'
+
+    def add_arguments(self, parser):
+        """Add commandline arguments
+
+        :param parser: The argument parser
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument('--nof_residues', type=int, default=10000,
+                            help='Number of entries in the synthetic residue list and nested JSON.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Number of timed runs per canonicalization.')
+
+    def handle(self, *args, **options):
+        """Handle command line call"""
+        random.seed(42)
+        inputs = (
+            ('residue list', generate_residue_list(options['nof_residues'])),
+            ('nested json', generate_nested_json(options['nof_residues'], 3)),
+        )
+        for input_name, obj in inputs:
+            assert json_to_sorted_string(obj) == json_to_sorted_string_in_place(obj)
+            for name, function in (('comparator', json_to_sorted_string_in_place),
+                                   ('sort keys', json_to_sorted_string)):
+                seconds = min(timeit.repeat(
+                    lambda obj=obj, function=function: function(obj),
+                    number=1, repeat=options['repeat']))
+                self.stdout.write(f'{input_name:>12} {name:>10}: {seconds * 1000:.1f} ms')
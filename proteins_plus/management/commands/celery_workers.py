@@ -0,0 +1,85 @@
+"""Start and stop the celery worker pools"""
+import os
+import subprocess
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Start and stop the celery worker pools"""
+    help = 'Starts or stops one celery worker per pool configured in WORKER_POOLS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', type=str, choices=['start', 'stop'],
+                            help='Whether to start or stop the worker pools')
+        parser.add_argument('--pools', type=str, nargs='+', choices=list(settings.WORKER_POOLS),
+                            default=list(settings.WORKER_POOLS), help='Pools to start or stop')
+        parser.add_argument('--directory', type=str, default='celery',
+                            help='Directory containing the run/ and log/ directories')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only print the celery command line')
+
+    @staticmethod
+    def is_running(pid_file):
+        """Check whether the worker of a PID file is running and remove dead PID files
+
+        :param pid_file: path to the PID file
+        :type pid_file: pathlib.Path
+        :return: Whether the worker is running
+        :rtype: bool
+        """
+        if not pid_file.is_file():
+            return False
+        try:
+            os.kill(int(pid_file.read_text().strip()), 0)
+        except (ValueError, ProcessLookupError):
+            pid_file.unlink()
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def build_command(action, pools, directory):
+        """Build the celery multi command line for the given pools
+
+        :param action: start or stop
+        :type action: str
+        :param pools: names of the pools
+        :type pools: list[str]
+        :param directory: directory containing the run/ and log/ directories
+        :type directory: pathlib.Path
+        :return: command line
+        :rtype: list[str]
+        """
+        args = ['celery', '-A', 'proteins_plus', 'multi', action, *pools]
+        if action == 'start':
+            for pool in pools:
+                config = settings.WORKER_POOLS[pool]
+                args.extend([f'-Q:{pool}', ','.join(config['queues']),
+                             f'-c:{pool}', str(config['concurrency'])])
+            args.extend(['-O', 'fair'])
+        args.extend([
+            f'--pidfile={directory / "run" / "%n.pid"}',
+            f'--logfile={directory / "log" / "%n%I.log"}',
+            '--loglevel=INFO',
+        ])
+        return args
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory']).resolve()
+        pools = []
+        for pool in options['pools']:
+            running = self.is_running(directory / 'run' / f'{pool}.pid')
+            if running == (options['action'] == 'stop'):
+                pools.append(pool)
+            else:
+                self.stdout.write(f'Pool {pool} is {"already" if running else "not"} running')
+        if not pools:
+            return
+
+        command = self.build_command(options['action'], pools, directory)
+        self.stdout.write(' '.join(command))
+        if not options['dry_run']:
+            subprocess.check_call(command)
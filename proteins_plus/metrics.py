@@ -0,0 +1,300 @@
+"""Metrics shared by all server and worker processes
+
+Metric values are accumulated in redis, so they are aggregated over all gunicorn and celery
+processes. They are exported in the Prometheus text format.
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import logging
+import time
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, float('inf'))
+
+_redis_client = None
+_unavailable_until = 0.0
+REGISTRY = []
+
+
+def _get_redis_client():
+    """Get the redis client of this process used for metrics
+
+    :return: redis client
+    :rtype: redis.Redis
+    """
+    global _redis_client  # pylint: disable=global-statement
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            settings.METRICS_REDIS_URL, socket_timeout=settings.METRICS_REDIS_TIMEOUT,
+            socket_connect_timeout=settings.METRICS_REDIS_TIMEOUT)
+    return _redis_client
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """Base class of metrics stored as a redis hash with one field per label combination"""
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """Construct and register a new metric
+
+        :param name: metric name
+        :type name: str
+        :param documentation: help text
+        :type documentation: str
+        :param labelnames: names of the labels
+        :type labelnames: tuple
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    @property
+    def key(self):
+        """redis key of this metric"""
+        return f'metrics:{self.name}'
+
+    def label_string(self, labels):
+        """Format labels in the Prometheus text format
+
+        :param labels: label values by label name
+        :type labels: dict
+        :raises ValueError: If the labels do not match the label names of the metric
+        :return: formatted labels
+        :rtype: str
+        """
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}')
+        label_values = []
+        for name in self.labelnames:
+            value = str(labels[name]).replace('\\', '\\\\').replace('"', '\\"') \
+                .replace('\n', '\\n')
+            label_values.append(f'{name}="{value}"')
+        return ','.join(label_values)
+
+    def increment(self, increments):
+        """Increment fields of the metric
+
+        Metrics are best effort and never raise if redis is not available. After a failure
+        increments are dropped without contacting redis for METRICS_RETRY_INTERVAL seconds, so an
+        unreachable redis does not add its timeout to every request or job.
+
+        :param increments: increment by field
+        :type increments: dict
+        """
+        global _unavailable_until  # pylint: disable=global-statement
+        if time.monotonic() < _unavailable_until:
+            return
+        try:
+            pipeline = _get_redis_client().pipeline(transaction=False)
+            for field, amount in increments.items():
+                pipeline.hincrbyfloat(self.key, field, amount)
+            pipeline.execute()
+        except redis.RedisError as error:
+            _unavailable_until = time.monotonic() + settings.METRICS_RETRY_INTERVAL
+            logger.warning('Could not update metric %s: %s', self.name, error)
+
+    def render(self, values):
+        """Render the metric in the Prometheus text format
+
+        :param values: stored value by field
+        :type values: dict
+        :return: lines of the exposition
+        :rtype: list[str]
+        """
+        return [f'# HELP {self.name} {self.documentation}',
+                f'# TYPE {self.name} {self.metric_type}'] + self.render_samples(values)
+
+    @abstractmethod
+    def render_samples(self, values):
+        """Render the samples of the metric
+
+        :param values: stored value by field
+        :type values: dict
+        :return: lines of the exposition
+        :rtype: list[str]
+        """
+
+
+class Counter(Metric):
+    """Monotonically increasing counter"""
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter
+
+        :param amount: amount to increase the counter by
+        :type amount: float
+        :param labels: label values by label name
+        """
+        self.increment({self.label_string(labels): amount})
+
+    def render_samples(self, values):
+        return [f'{self.name}{{{labels}}} {_format_value(value)}'
+                for labels, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in buckets"""
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Construct and register a new histogram
+
+        :param name: metric name
+        :type name: str
+        :param documentation: help text
+        :type documentation: str
+        :param labelnames: names of the labels
+        :type labelnames: tuple
+        :param buckets: upper bounds of the buckets ending with infinity
+        :type buckets: tuple
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """Observe a value
+
+        :param value: observed value
+        :type value: float
+        :param labels: label values by label name
+        """
+        label_string = self.label_string(labels)
+        bucket = next(bound for bound in self.buckets if value <= bound)
+        self.increment({
+            f'{label_string}|bucket|{_format_value(bucket)}': 1,
+            f'{label_string}|sum': value,
+            f'{label_string}|count': 1,
+        })
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block
+
+        Labels can still be changed within the block, e.g. to record the outcome.
+
+        :param labels: label values by label name
+        :return: the labels
+        :rtype: dict
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render_samples(self, values):
+        series = {}
+        for field, value in values.items():
+            label_string, kind = field.rsplit('|', 1)
+            if kind in ('sum', 'count'):
+                series.setdefault(label_string, {'bucket': {}})[kind] = value
+            else:
+                label_string = label_string.rsplit('|', 1)[0]
+                series.setdefault(label_string, {'bucket': {}})['bucket'][kind] = value
+
+        lines = []
+        for label_string, samples in sorted(series.items()):
+            separator = ',' if label_string else ''
+            cumulative = 0.0
+            for bound in self.buckets:
+                cumulative += samples['bucket'].get(_format_value(bound), 0.0)
+                lines.append(f'{self.name}_bucket{{{label_string}{separator}'
+                             f'le="{_format_value(bound)}"}} {_format_value(cumulative)}')
+            lines.append(
+                f'{self.name}_sum{{{label_string}}} {_format_value(samples.get("sum", 0.0))}')
+            lines.append(
+                f'{self.name}_count{{{label_string}}} {_format_value(samples.get("count", 0.0))}')
+        return lines
+
+
+def get_queue_lengths():
+    """Get the number of waiting messages in every celery queue
+
+    :return: queue length by queue name, empty if the broker is not redis
+    :rtype: dict
+    """
+    from proteins_plus.celery import app  # pylint: disable=import-outside-toplevel
+    if not settings.CELERY_BROKER_URL.startswith('redis://'):
+        return {}
+    queue_names = sorted(app.amqp.queues.keys())
+    # kombu stores prioritized messages of a queue in separate redis lists
+    priority_steps = settings.CELERY_BROKER_TRANSPORT_OPTIONS.get('priority_steps', [0, 3, 6, 9])
+    client = redis.Redis.from_url(
+        settings.CELERY_BROKER_URL, socket_timeout=settings.METRICS_REDIS_TIMEOUT,
+        socket_connect_timeout=settings.METRICS_REDIS_TIMEOUT)
+    try:
+        pipeline = client.pipeline(transaction=False)
+        for queue_name in queue_names:
+            for priority in priority_steps:
+                pipeline.llen(queue_name if priority == 0 else f'{queue_name}\x06\x16{priority}')
+        lengths = pipeline.execute()
+    finally:
+        client.close()
+    nof_steps = len(priority_steps)
+    return {queue_name: sum(lengths[index * nof_steps:(index + 1) * nof_steps])
+            for index, queue_name in enumerate(queue_names)}
+
+
+def render_metrics():
+    """Render all registered metrics and the celery queue lengths in the Prometheus text format
+
+    :return: exposition
+    :rtype: str
+    """
+    lines = []
+    try:
+        pipeline = _get_redis_client().pipeline(transaction=False)
+        for metric in REGISTRY:
+            pipeline.hgetall(metric.key)
+        all_values = pipeline.execute()
+    except redis.RedisError as error:
+        logger.warning('Could not read metrics: %s', error)
+        all_values = [{} for _ in REGISTRY]
+    for metric, values in zip(REGISTRY, all_values):
+        lines.extend(metric.render(
+            {field.decode(): float(value) for field, value in values.items()}))
+
+    try:
+        queue_lengths = get_queue_lengths()
+    except redis.RedisError as error:
+        logger.warning('Could not read celery queue lengths: %s', error)
+        queue_lengths = {}
+    lines.append('# HELP pplus_celery_queue_length Messages waiting in the celery queue')
+    lines.append('# TYPE pplus_celery_queue_length gauge')
+    for queue_name, length in queue_lengths.items():
+        lines.append(f'pplus_celery_queue_length{{queue="{queue_name}"}} {length}')
+    return '\n'.join(lines) + '\n'
+
+
+JOB_SUBMISSIONS = Counter(
+    'pplus_job_submissions_total', 'Submitted jobs by tool and whether they were retrieved from '
+    'cache', ('tool', 'retrieved'))
+JOB_DURATION = Histogram(
+    'pplus_job_duration_seconds', 'Execution time of jobs by tool and final status',
+    ('tool', 'status'))
+RESOURCE_REQUEUES = Counter(
+    'pplus_resource_requeues_total', 'Jobs put back into their queue because the resource budget '
+    'of their binary was exhausted', ('binary',))
+SUBPROCESS_EXITS = Counter(
+    'pplus_subprocess_exits_total', 'Finished binaries by exit code', ('binary', 'exit_code'))
+EXTERNAL_FETCH_DURATION = Histogram(
+    'pplus_external_fetch_duration_seconds', 'Fetch time of external resources by source and '
+    'outcome', ('resource', 'source', 'outcome'),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, float('inf')))
+FETCH_CACHE_LOOKUPS = Counter(
+    'pplus_fetch_cache_lookups_total', 'Lookups in the disk cache of fetched files by resource and '
+    'result', ('resource', 'result'))
+FETCH_CACHE_EVICTIONS = Counter(
+    'pplus_fetch_cache_evictions_total', 'Entries evicted from the disk cache of fetched files by '
+    'resource', ('resource',))
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.7 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proteins_plus', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mockjob',
+            name='date_submitted',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='mockjob',
+            name='timings',
+            field=models.JSONField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proteins_plus', '0002_job_timings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mockjob',
+            index=models.Index(fields=['date_created', 'id'], name='proteins_pl_date_cr_e1e69b_idx'),
+        ),
+    ]
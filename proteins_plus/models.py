@@ -1,16 +1,38 @@
 """Base models for ProteinsPlus objects"""
+import copy
 from datetime import date, timedelta
 from hashlib import blake2b
 import logging
 import uuid
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 
-from .job_handler import Status
+from .job_handler import CANCELLED_ERROR, JobCancelledError, Status
 from .utils import json_to_sorted_string
 
 
+def update_hasher_from_file(hasher, field_file):
+    """Feed the content of a file field into a hash function chunk by chunk
+
+    Closed files are read through a separate handle from storage, open files are rewound
+    afterwards. The state of the field file is left unchanged either way.
+
+    :param hasher: hash object, e.g. a hashlib.blake2b instance
+    :type hasher: object with an update(bytes) method
+    :param field_file: file to hash
+    :type field_file: django.db.models.fields.files.FieldFile
+    """
+    if field_file.closed:
+        with field_file.storage.open(field_file.name, 'rb') as file:
+            for chunk in file.chunks():
+                hasher.update(chunk)
+    else:
+        for chunk in field_file.chunks():
+            hasher.update(chunk)
+        field_file.seek(0)
+
+
 class ProteinsPlusBaseModel(models.Model):
     """Abstract base model for all objects"""
 
@@ -28,30 +50,164 @@ class ProteinsPlusHashableModel(ProteinsPlusBaseModel):
 
     hash_attributes = []
 
-    def generate_hashable_string(self):
-        """Recursively generate string from attributes that can be used as input for a hash
-        function
+    def update_hasher(self, hasher):
+        """Recursively feed the attributes of this object into a hash function
 
-        :return: hashable string
-        :rtype: str
+        The hasher is fed piece by piece in the same order and with the same separators as the
+        string built by generate_hashable_string. File fields are read in chunks, so hashing never
+        holds a whole input in memory.
+
+        :param hasher: hash object, e.g. a hashlib.blake2b instance
+        :type hasher: object with an update(bytes) method
         """
-        hashable_substrings = []
-        for attribute in self.hash_attributes:
+        for index, attribute in enumerate(self.hash_attributes):
+            if index > 0:
+                hasher.update(b'_')
             value = getattr(self, attribute)
-            if isinstance(value, ProteinsPlusHashableModel):
-                hashable_substrings.append(value.generate_hashable_string())
+            if isinstance(value, ProteinsPlusContentHashedModel):
+                # content hashed models contribute their stored digest instead of their content
+                hasher.update(value.get_content_hash().encode('utf-8'))
+            elif isinstance(value, ProteinsPlusHashableModel):
+                value.update_hasher(hasher)
             elif isinstance(value, models.fields.files.FieldFile):
-                hashable_substrings.append(value.read())
+                update_hasher_from_file(hasher, value)
             elif isinstance(value, dict):
                 # all hashable dicts are expected to be JSON-like objects.
                 # A unique string representation of the intrinsically unordered
                 # dict is generated.
-                hashable_substrings.append(json_to_sorted_string(value, copy=True).encode('utf-8'))
+                hasher.update(json_to_sorted_string(value, copy=True).encode('utf-8'))
             # add other unique field handlings here if str() is insufficient
             else:
-                hashable_substrings.append(str(value).encode('utf-8'))
-        hashable_string = b'_'.join(hashable_substrings)
-        return hashable_string
+                hasher.update(str(value).encode('utf-8'))
+
+    def generate_hashable_string(self):
+        """Recursively generate string from attributes that can be used as input for a hash
+        function
+
+        :note: this materializes all inputs in memory. Prefer update_hasher for hashing.
+        :return: hashable string
+        :rtype: bytes
+        """
+        collector = _HashableStringCollector()
+        self.update_hasher(collector)
+        return collector.join()
+
+
+class _HashableStringCollector:
+    """Hasher stand-in collecting all fed substrings into a single byte string"""
+
+    def __init__(self):
+        self.substrings = []
+
+    def update(self, data):
+        """Collect data
+
+        :param data: next piece of the hashable string
+        :type data: bytes
+        """
+        self.substrings.append(bytes(data))
+
+    def join(self):
+        """Join the collected pieces
+
+        :return: hashable string
+        :rtype: bytes
+        """
+        return b''.join(self.substrings)
+
+
+class ProteinsPlusContentHashedModel(ProteinsPlusHashableModel):
+    """Abstract base model for hashable objects that store their content hash
+
+    The content hash is computed when the object is saved for the first time and again whenever
+    one of its hashed fields changed. Objects referencing a content hashed model hash its digest
+    instead of its content, so hashing a job is independent of the size of its inputs.
+    """
+
+    class Meta:
+        abstract = True
+
+    content_hash = models.CharField(
+        max_length=128, null=True, default=None, db_index=True, editable=False)
+
+    # fields the hash attributes are stored in, None if these are the hash attributes themselves
+    hashed_fields = None
+    # values of the hashed fields the content hash was generated from
+    _hashed_state = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._hashed_state = instance.get_hashed_state()
+        return instance
+
+    def get_hashed_state(self):
+        """Get the current values of the hashed fields without loading deferred fields
+
+        :return: field values, files are represented by their names
+        :rtype: list
+        """
+        deferred_fields = self.get_deferred_fields()
+        state = []
+        for name in self.hashed_fields or self.hash_attributes:
+            field = self._meta.get_field(name)
+            if field.attname in deferred_fields:
+                state.append(models.DEFERRED)
+                continue
+            value = field.value_from_object(self)
+            if isinstance(value, models.fields.files.FieldFile):
+                value = value.name
+            # mutable values like JSON dicts are copied, so changes in place are detected
+            state.append(copy.deepcopy(value))
+        return state
+
+    def set_content_hash(self, content_hash=None):
+        """Generate and set the content hash
+
+        :param content_hash: content hash computed elsewhere, e.g. while the content was
+            fetched, None to generate it
+        :type content_hash: str
+        """
+        if content_hash is None:
+            hasher = blake2b()
+            self.update_hasher(hasher)
+            content_hash = hasher.hexdigest()
+        self.content_hash = content_hash
+        self._hashed_state = self.get_hashed_state()
+
+    def get_content_hash(self):
+        """Get the content hash, generating and storing it if it is missing
+
+        :return: content hash
+        :rtype: str
+        """
+        if self.content_hash is None:
+            self.set_content_hash()
+            if self.pk is not None and not self._state.adding:
+                self.__class__.objects.filter(pk=self.pk).update(content_hash=self.content_hash)
+        return self.content_hash
+
+    def save(self, *args, **kwargs):  # pylint: disable=signature-differs
+        """Generate the content hash before saving if it is missing or a hashed field changed"""
+        if self.content_hash is None or self._hashed_state != self.get_hashed_state():
+            self.set_content_hash()
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def bulk_create(cls, objects):
+        """Insert many new objects with a constant number of queries
+
+        The content hashes are generated like in save, but save itself is not called.
+
+        :param objects: new objects of this model
+        :type objects: iterable
+        :return: inserted objects
+        :rtype: list
+        """
+        objects = list(objects)
+        for obj in objects:
+            obj.set_content_hash()
+        return cls.objects.bulk_create(objects)
 
 
 class ProteinsPlusJob(ProteinsPlusHashableModel):
@@ -59,18 +215,43 @@ class ProteinsPlusJob(ProteinsPlusHashableModel):
 
     class Meta:
         abstract = True
+        indexes = [models.Index(fields=['time_created', 'id'])]
 
     status = models.CharField(max_length=1, choices=Status.choices, default=Status.PENDING)
     error = models.TextField(null=True)
     error_detailed = models.TextField(null=True)
     date_created = models.DateField(auto_now_add=True)
+    # exact creation time, orders the jobs of a day in lists
+    time_created = models.DateTimeField(auto_now_add=True)
     date_last_accessed = models.DateField(auto_now=True)
     hash_value = models.CharField(max_length=256, null=True, default=None, unique=True)
+    date_submitted = models.DateTimeField(null=True, default=None)
+    # seconds spent in each phase of the execution, see job_handler.Phase
+    timings = models.JSONField(null=True, default=None)
+    # set while the job is executed by job_handler.execute_job
+    is_executing = False
+
+    def save(self, *args, **kwargs):  # pylint: disable=signature-differs
+        """Save the job, refuse to save an executed job once it has been cancelled
+
+        Cancelling updates the database row only. Saving the job object of the worker afterwards
+        would silently undo the cancellation, so the row is locked and checked first.
+
+        :raises JobCancelledError: If the job is executed and is not running any more
+        """
+        if not self.is_executing:
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic():
+            if not self.__class__.objects.select_for_update().filter(
+                    id=self.id, status=Status.RUNNING).exists():
+                raise JobCancelledError(CANCELLED_ERROR)
+            super().save(*args, **kwargs)
 
     def set_hash_value(self):
         """Generate and set hash value for caching"""
         hasher = blake2b()
-        hasher.update(self.generate_hashable_string())
+        self.update_hasher(hasher)
         self.hash_value = hasher.hexdigest()
 
     def retrieve_job_from_cache(self):
@@ -87,6 +268,21 @@ class ProteinsPlusJob(ProteinsPlusHashableModel):
         except self.__class__.DoesNotExist:
             return None
 
+    @classmethod
+    def get_stale_jobs(cls, cache_time=None):
+        """Get all jobs that clean_up would remove
+
+        :param cache_time: time to keep job after last access
+        :type cache_time: int
+        :return: stale jobs
+        :rtype: django.db.models.QuerySet
+        """
+        if not cache_time:
+            cache_time = settings.DEFAULT_JOB_CACHE_TIME
+        # same condition as in clean_up: date_last_accessed - today > caching_time
+        return cls.objects.filter(
+            date_last_accessed__gt=date.today() + timedelta(days=cache_time))
+
     def clean_up(self, cache_time=None):
         """Clean up if the job has not been accessed for longer than the cache time
 
@@ -121,3 +317,8 @@ class MockJob(ProteinsPlusJob):
         """Mock jobs are always stale"""
         super().clean_up(cache_time=-1)
         return True
+
+    @classmethod
+    def get_stale_jobs(cls, cache_time=-1):
+        """Mock jobs are always stale"""
+        return super().get_stale_jobs(cache_time=-1)
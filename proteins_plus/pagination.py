@@ -0,0 +1,233 @@
+"""Keyset pagination for list endpoints"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections, models
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginate lists newest first by their creation time and id
+
+    Pages are selected by the keys of the last object of the previous page instead of an offset,
+    so every page is a single index range scan no matter how deep it is. Models without a creation
+    time are ordered by their id only. The count of large unfiltered tables is estimated from the
+    database statistics instead of counted.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    max_limit = 100
+    # date time fields holding the creation time, the first one a model has is used
+    ordering_fields = ['time_created', 'date_created']
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.request = None
+        self.limit = None
+        self.keys = None
+        self.count = None
+        self.next_position = None
+        self.previous_position = None
+
+    def get_keys(self, queryset):
+        """Get the fields ordering the objects, the last one is unique
+
+        :param queryset: paginated queryset
+        :type queryset: django.db.models.QuerySet
+        :return: field names
+        :rtype: list[str]
+        """
+        fields = {field.name: field for field in queryset.model._meta.concrete_fields}
+        for name in self.ordering_fields:
+            # dates alone would leave the order within a day to the random ids
+            if isinstance(fields.get(name), models.DateTimeField):
+                return [name, 'id']
+        return ['id']
+
+    def get_limit(self, request):
+        """Get the page size of a request
+
+        :param request: client request
+        :type request: rest_framework.request.Request
+        :return: page size
+        :rtype: int
+        """
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return settings.REST_FRAMEWORK['PAGE_SIZE']
+        if limit <= 0:
+            return settings.REST_FRAMEWORK['PAGE_SIZE']
+        return min(limit, self.max_limit)
+
+    def decode_cursor(self, request, model):
+        """Decode the cursor of a request
+
+        :param request: client request
+        :type request: rest_framework.request.Request
+        :param model: paginated model
+        :type model: django.db.models.Model
+        :raises NotFound: If the cursor is invalid
+        :return: key values of the position and whether to page backwards or None without cursor
+        :rtype: tuple(list, bool) or None
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if len(cursor['position']) != len(self.keys):
+                raise ValueError('Cursor does not match the ordering')
+            values = [model._meta.get_field(key).to_python(value)
+                      for key, value in zip(self.keys, cursor['position'])]
+            return values, bool(cursor['reverse'])
+        except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError,
+                DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message) from None
+
+    @staticmethod
+    def encode_cursor(position, reverse):
+        """Encode a cursor
+
+        :param position: key values of the position
+        :type position: list
+        :param reverse: Whether to page backwards from the position
+        :type reverse: bool
+        :return: encoded cursor
+        :rtype: str
+        """
+        cursor = {'position': [str(value) for value in position], 'reverse': reverse}
+        return urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+
+    def filter_position(self, queryset, position, reverse):
+        """Restrict a queryset to the objects behind a position
+
+        :param queryset: paginated queryset
+        :type queryset: django.db.models.QuerySet
+        :param position: key values of the position
+        :type position: list
+        :param reverse: Whether to select the objects before instead of behind the position
+        :type reverse: bool
+        :return: filtered queryset
+        :rtype: django.db.models.QuerySet
+        """
+        lookup = 'gt' if reverse else 'lt'
+        condition = Q()
+        equal = {}
+        for key, value in zip(self.keys, position):
+            condition |= Q(**equal, **{f'{key}__{lookup}': value})
+            equal[key] = value
+        return queryset.filter(condition)
+
+    def get_count(self, queryset):
+        """Count the objects of a queryset
+
+        For unfiltered tables with more than settings.PAGINATION_EXACT_COUNT_LIMIT rows the
+        estimate of the PostgreSQL statistics is used.
+
+        :param queryset: paginated queryset
+        :type queryset: django.db.models.QuerySet
+        :return: exact or estimated count
+        :rtype: int
+        """
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row is not None and row[0] > settings.PAGINATION_EXACT_COUNT_LIMIT:
+                return int(row[0])
+        return queryset.count()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.keys = self.get_keys(queryset)
+        self.count = self.get_count(queryset)
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = cursor is not None and cursor[1]
+        if cursor is not None:
+            queryset = self.filter_position(queryset, *cursor)
+        ordering = self.keys if reverse else [f'-{key}' for key in self.keys]
+        page = list(queryset.order_by(*ordering)[:self.limit + 1])
+        has_more = len(page) > self.limit
+        page = page[:self.limit]
+        if reverse:
+            page.reverse()
+
+        first = [getattr(page[0], key) for key in self.keys] if page else None
+        last = [getattr(page[-1], key) for key in self.keys] if page else None
+        self.next_position = None
+        self.previous_position = None
+        if reverse:
+            self.previous_position = first if has_more else None
+            self.next_position = last if page else cursor[0]
+        else:
+            self.next_position = last if has_more else None
+            if cursor is not None:
+                self.previous_position = first if page else cursor[0]
+        return page
+
+    def get_link(self, position, reverse):
+        """Build the link to the page next to a position
+
+        :param position: key values of the position or None
+        :type position: list
+        :param reverse: Whether the page is before the position
+        :type reverse: bool
+        :return: absolute url or None if there is no position
+        :rtype: str
+        """
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_link(self.next_position, False),
+            'previous': self.get_link(self.previous_position, True),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {
+                    'type': 'integer',
+                    'example': 123,
+                    'description': 'Number of objects, estimated for very large tables',
+                },
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.limit_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,117 @@
+"""Resource budgets of binaries shared by all worker processes of a node
+
+Reservations are kept in a state file on the node that is locked while it is changed. Reservations
+of processes that no longer exist are dropped, so crashed workers do not leak their budget.
+"""
+import fcntl
+import json
+import logging
+import os
+from pathlib import Path
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _LockedState:
+    """Exclusive access to the reservations in the state file"""
+
+    def __init__(self):
+        self.path = Path(settings.RESOURCE_STATE_FILE)
+        self.file = None
+        self.reservations = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'a+', encoding='utf8')  # pylint: disable=consider-using-with
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        self.file.seek(0)
+        content = self.file.read()
+        self.reservations = [
+            reservation for reservation in (json.loads(content) if content else [])
+            if _is_alive(reservation['pid'])
+        ]
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        try:
+            if exc_type is None:
+                self.file.seek(0)
+                self.file.truncate()
+                json.dump(self.reservations, self.file)
+                self.file.flush()
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+
+
+def _is_alive(pid):
+    """Check whether a process exists
+
+    :param pid: process id
+    :type pid: int
+    :return: Whether the process exists
+    :rtype: bool
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def get_usage(reservations):
+    """Sum up the resources of reservations
+
+    :param reservations: reservations of the node
+    :type reservations: list[dict]
+    :return: number of runs by binary, memory in MB and cpus in use
+    :rtype: tuple(dict, int, int)
+    """
+    runs = {}
+    memory = 0
+    cpus = 0
+    for reservation in reservations:
+        budget = settings.BINARY_RESOURCES[reservation['binary']]
+        runs[reservation['binary']] = runs.get(reservation['binary'], 0) + 1
+        memory += budget['memory']
+        cpus += budget['cpus']
+    return runs, memory, cpus
+
+
+def try_reserve(binary):
+    """Reserve the resources of one run of a binary if they fit into the budget of the node
+
+    A run is always granted if nothing else is running, even if it exceeds the node resources.
+
+    :param binary: name of the binary in settings.BINARY_RESOURCES
+    :type binary: str
+    :return: Whether the resources have been reserved
+    :rtype: bool
+    """
+    budget = settings.BINARY_RESOURCES[binary]
+    with _LockedState() as state:
+        if state.reservations:
+            runs, memory, cpus = get_usage(state.reservations)
+            if runs.get(binary, 0) >= budget['max_concurrent'] \
+                    or memory + budget['memory'] > settings.NODE_RESOURCES['memory'] \
+                    or cpus + budget['cpus'] > settings.NODE_RESOURCES['cpus']:
+                logger.debug('Resource budget of %s exhausted: %s runs, %s MB, %s cpus',
+                             binary, runs, memory, cpus)
+                return False
+        state.reservations.append({'pid': os.getpid(), 'binary': binary})
+    return True
+
+
+def release(binary):
+    """Release the resources of one run of a binary reserved by this process
+
+    :param binary: name of the binary in settings.BINARY_RESOURCES
+    :type binary: str
+    """
+    with _LockedState() as state:
+        reservation = {'pid': os.getpid(), 'binary': binary}
+        if reservation in state.reservations:
+            state.reservations.remove(reservation)
@@ -1,6 +1,7 @@
 """Base serializers for ProteinsPlus objects"""
+from django.conf import settings
 from rest_framework import serializers
-from proteins_plus.job_handler import StatusField
+from proteins_plus.job_handler import Status, StatusField
 
 
 class ProteinsPlusJobSerializer(serializers.ModelSerializer):
@@ -8,7 +9,7 @@ class ProteinsPlusJobSerializer(serializers.ModelSerializer):
     status = StatusField()
 
     class Meta:
-        fields = ['id', 'status', 'date_created', 'date_last_accessed', 'error']
+        fields = ['id', 'status', 'date_created', 'date_last_accessed', 'error', 'timings']
 
 
 class ProteinsPlusJobSubmitSerializer(serializers.Serializer):  # pylint: disable=abstract-method
@@ -20,3 +21,44 @@ class ProteinsPlusJobResponseSerializer(serializers.Serializer):  # pylint: disa
     """Job submission response data"""
     job_id = serializers.UUIDField(required=True)
     retrieved_from_cache = serializers.BooleanField(default=False)
+
+
+class JobStatusQuerySerializer(serializers.Serializer):  # pylint: disable=abstract-method
+    """Query parameters for waiting on a job status change"""
+    status = serializers.ChoiceField(
+        choices=list(Status.DETAILED.values()), default=None)
+    wait = serializers.FloatField(
+        min_value=0, max_value=settings.JOB_STATUS_MAX_WAIT, default=0)
+
+
+class FieldNamesField(serializers.CharField):
+    """Comma separated list of field names"""
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsetQuerySerializer(serializers.Serializer):  # pylint: disable=abstract-method
+    """Query parameters for selecting the fields of a response"""
+    fields = FieldNamesField(
+        required=False, allow_blank=True,
+        help_text='Comma separated names of the fields to return. Large fields are only part of '
+                  'list responses if they are selected here.')
+    omit = FieldNamesField(
+        required=False, allow_blank=True,
+        help_text='Comma separated names of the fields to leave out.')
+
+
+class ExpandQuerySerializer(serializers.Serializer):  # pylint: disable=abstract-method
+    """Query parameters for expanding related objects of a response"""
+    expand = FieldNamesField(
+        required=False, allow_blank=True,
+        help_text='Comma separated names of related fields to return as nested objects instead '
+                  'of ids, e.g. output_proteins.ligand_set. Only available for job results.')
+
+
+class JobStatusSerializer(serializers.Serializer):  # pylint: disable=abstract-method
+    """Status of a job"""
+    job_id = serializers.UUIDField(required=True)
+    status = StatusField()
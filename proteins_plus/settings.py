@@ -1,8 +1,10 @@
 """Django settings for proteins_plus project."""
 from pathlib import Path
 import os
+import tempfile
 import json
 from datetime import datetime
+from kombu import Queue
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -131,12 +133,131 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CELERY_BROKER_URL = 'redis://localhost:6378'
 CELERY_RESULT_BACKEND = 'redis://localhost:6378'
 
+# Every tool has its own queue. Workers consuming several queues process messages with a lower
+# priority (0-9) first.
+TOOL_QUEUE_PRIORITIES = {
+    'molecule_handler': 0,
+    'poseview': 0,
+    'protoss': 2,
+    'metalizer': 2,
+    'ediascorer': 4,
+    'structureprofiler': 4,
+    'geomine': 6,
+    'dogsite': 6,
+    'siena': 8,
+}
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_QUEUES = [Queue(name, routing_key=name)
+                      for name in [CELERY_TASK_DEFAULT_QUEUE, *TOOL_QUEUE_PRIORITIES]]
+CELERY_TASK_ROUTES = {
+    f'{tool}.tasks.*': {'queue': tool, 'priority': priority}
+    for tool, priority in TOOL_QUEUE_PRIORITIES.items()
+}
+CELERY_BROKER_TRANSPORT_OPTIONS = {'priority_steps': list(range(10))}
+# long jobs must not hold back messages of higher priority
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Worker pools started by the celery_workers command. The interactive pool reserves slots for
+# short jobs, the general pool works on all queues by priority.
+WORKER_POOLS = {
+    'interactive': {
+        'queues': [CELERY_TASK_DEFAULT_QUEUE, 'molecule_handler', 'poseview', 'protoss',
+                   'metalizer'],
+        'concurrency': 4 if 'PPLUS_INTERACTIVE_WORKERS' not in os.environ else int(
+            os.environ['PPLUS_INTERACTIVE_WORKERS']),
+    },
+    'general': {
+        'queues': [CELERY_TASK_DEFAULT_QUEUE, *TOOL_QUEUE_PRIORITIES],
+        'concurrency': 12 if 'PPLUS_GENERAL_WORKERS' not in os.environ else int(
+            os.environ['PPLUS_GENERAL_WORKERS']),
+    },
+}
+
+# Resource budget of every binary (memory in MB) enforced across all worker processes of a node.
+# Jobs over budget are put back into their queue.
+BINARY_RESOURCES = {
+    'preprocessor': {'max_concurrent': 8, 'memory': 500, 'cpus': 1},
+    'protoss': {'max_concurrent': 8, 'memory': 500, 'cpus': 1},
+    'ediascorer': {'max_concurrent': 4, 'memory': 4000, 'cpus': 1},
+    'metalizer': {'max_concurrent': 8, 'memory': 500, 'cpus': 1},
+    'poseview': {'max_concurrent': 4, 'memory': 500, 'cpus': 1},  # shares the X display
+    'siena': {'max_concurrent': 4, 'memory': 2000, 'cpus': 1},  # I/O heavy on its database
+    'dogsite': {'max_concurrent': 4, 'memory': 4000, 'cpus': 2},
+    'structureprofiler': {'max_concurrent': 8, 'memory': 500, 'cpus': 1},
+    'geomine': {'max_concurrent': 4, 'memory': 1000, 'cpus': 1},  # I/O heavy on its database
+}
+NODE_RESOURCES = {
+    'memory': os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2**20
+    if 'PPLUS_NODE_MEMORY' not in os.environ else int(os.environ['PPLUS_NODE_MEMORY']),
+    'cpus': os.cpu_count() if 'PPLUS_NODE_CPUS' not in os.environ else int(
+        os.environ['PPLUS_NODE_CPUS']),
+}
+RESOURCE_STATE_FILE = os.path.join(BASE_DIR, 'celery', 'run', 'resources.json') \
+    if 'RESOURCE_STATE_FILE' not in os.environ else os.environ['RESOURCE_STATE_FILE']
+# jobs over budget are requeued with a delay doubling from RESOURCE_RETRY_DELAY up to
+# RESOURCE_RETRY_MAX_DELAY and fail after RESOURCE_MAX_REQUEUES requeues
+RESOURCE_RETRY_DELAY = 5  # seconds
+RESOURCE_RETRY_MAX_DELAY = 300  # seconds
+RESOURCE_MAX_REQUEUES = 30
+
+# Wall-clock limit of a single run of every binary in seconds
+BINARY_TIMEOUTS = {
+    'preprocessor': 600,
+    'protoss': 600,
+    'ediascorer': 1800,
+    'metalizer': 600,
+    'poseview': 300,
+    'siena': 3600,
+    'dogsite': 1800,
+    'structureprofiler': 600,
+    'geomine': 3600,
+}
+DEFAULT_BINARY_TIMEOUT = 3600  # seconds
+SUBPROCESS_POLL_INTERVAL = 1  # seconds, how fast running jobs are cancelled
+SUBPROCESS_KILL_GRACE_PERIOD = 5  # seconds between SIGTERM and SIGKILL
+
+# Limits of a single run of every binary: address space in MB, CPU time in seconds and number of
+# open files. A limit of None is not applied.
+BINARY_LIMITS = {
+    'preprocessor': {'memory': 4000, 'cpu_time': 600, 'open_files': 1024},
+    'protoss': {'memory': 4000, 'cpu_time': 600, 'open_files': 1024},
+    'ediascorer': {'memory': 16000, 'cpu_time': 1800, 'open_files': 1024},
+    'metalizer': {'memory': 4000, 'cpu_time': 600, 'open_files': 1024},
+    'poseview': {'memory': 4000, 'cpu_time': 300, 'open_files': 1024},
+    'siena': {'memory': 8000, 'cpu_time': 3600, 'open_files': 4096},
+    'dogsite': {'memory': 16000, 'cpu_time': 3600, 'open_files': 1024},
+    'structureprofiler': {'memory': 4000, 'cpu_time': 600, 'open_files': 1024},
+    'geomine': {'memory': 8000, 'cpu_time': 3600, 'open_files': 4096},
+}
+DEFAULT_BINARY_LIMITS = {'memory': 8000, 'cpu_time': 3600, 'open_files': 1024}
+
+# Job status notifications
+JOB_STATUS_REDIS_URL = 'redis://localhost:6378' \
+    if 'JOB_STATUS_REDIS_URL' not in os.environ else os.environ['JOB_STATUS_REDIS_URL']
+JOB_STATUS_MAX_WAIT = 25  # seconds, stay below the gunicorn timeout
+JOB_STATUS_STREAM_TIME = 300  # seconds
+JOB_STATUS_POLL_INTERVAL = 1  # seconds, only used if redis is not available
+# waiting clients per server process, keep below the gunicorn threads to leave room for requests
+JOB_STATUS_MAX_WAITERS = 8
+JOB_STATUS_BUSY_RETRY = 5  # seconds until event stream clients reconnect if too many are waiting
+
+# Metrics shared by all server and worker processes
+METRICS_REDIS_URL = 'redis://localhost:6378' \
+    if 'METRICS_REDIS_URL' not in os.environ else os.environ['METRICS_REDIS_URL']
+METRICS_REDIS_TIMEOUT = 0.5  # seconds, recording a metric must not stall a request or job
+METRICS_RETRY_INTERVAL = 30  # seconds to drop metrics after redis was not available
+# bearer token scrapers have to send to read /metrics, the metrics are not exported without it
+METRICS_TOKEN = None if 'METRICS_TOKEN' not in os.environ else os.environ['METRICS_TOKEN']
+
 # Swagger Config
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'proteins_plus.pagination.KeysetPagination',
     'PAGE_SIZE': 10
 }
+# tables with more rows are not counted for list responses, the count is estimated instead
+PAGINATION_EXACT_COUNT_LIMIT = 100000 if 'PPLUS_PAGINATION_EXACT_COUNT_LIMIT' not in os.environ \
+    else int(os.environ['PPLUS_PAGINATION_EXACT_COUNT_LIMIT'])
 SPECTACULAR_SETTINGS = {
     'TITLE': 'ProteinsPlus Swagger',
     'DESCRIPTION': 'Software tools for protein analysis',
@@ -173,6 +294,22 @@ URLS = {
     'alphafold_files': 'https://alphafold.ebi.ac.uk/api/prediction/',
     'density_files': 'https://www.ebi.ac.uk/pdbe/entry-files/',
 }
+# pooled connections to the external resources, every process keeps its own pool
+EXTERNAL_REQUESTS = {
+    'connect_timeout': 5 if 'PPLUS_EXTERNAL_CONNECT_TIMEOUT' not in os.environ else float(
+        os.environ['PPLUS_EXTERNAL_CONNECT_TIMEOUT']),  # seconds
+    'read_timeout': 60 if 'PPLUS_EXTERNAL_READ_TIMEOUT' not in os.environ else float(
+        os.environ['PPLUS_EXTERNAL_READ_TIMEOUT']),  # seconds
+    # retries of server errors, connection errors and timeouts
+    'retries': 3 if 'PPLUS_EXTERNAL_RETRIES' not in os.environ else int(
+        os.environ['PPLUS_EXTERNAL_RETRIES']),
+    # seconds, the backoff doubles with every retry and is randomized between zero and its value
+    'backoff_factor': 0.5,
+    # number of hosts and connections per host kept alive
+    'pool_connections': 4,
+    'pool_maxsize': 10 if 'PPLUS_EXTERNAL_POOL_SIZE' not in os.environ else int(
+        os.environ['PPLUS_EXTERNAL_POOL_SIZE']),
+}
 
 # local data mirrors
 LOCAL_PDB_MIRROR_DIR = Path('/data/pdb/current/data/structures/all/pdb/') \
@@ -182,6 +319,18 @@ LOCAL_DENSITY_MIRROR_DIR = Path('') \
     os.environ['LOCAL_DENSITY_MIRROR_DIR'])
 LOCAL_AFDB_MIRROR_DIR = Path('') if 'LOCAL_AFDB_MIRROR_DIR' not in os.environ else Path(
     os.environ['LOCAL_AFDB_MIRROR_DIR'])
+# node local disk cache of files fetched from external resources, a max_size of 0 disables it
+FETCH_CACHE = {
+    'directory': Path(tempfile.gettempdir()) / 'pplus_fetch_cache'
+    if 'PPLUS_FETCH_CACHE_DIR' not in os.environ else Path(os.environ['PPLUS_FETCH_CACHE_DIR']),
+    'max_size': 2 * 1024 ** 3 if 'PPLUS_FETCH_CACHE_SIZE' not in os.environ else int(
+        os.environ['PPLUS_FETCH_CACHE_SIZE']),  # bytes
+    # failed fetches are not repeated for this time, 0 disables remembering failures
+    'failure_ttl': 300 if 'PPLUS_FETCH_FAILURE_TTL' not in os.environ else int(
+        os.environ['PPLUS_FETCH_FAILURE_TTL']),  # seconds
+    # maximum time to wait for an identical fetch of another process
+    'lock_timeout': 600,  # seconds
+}
 
 # Configuration of logging module
 LOGGING = {
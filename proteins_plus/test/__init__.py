@@ -1,3 +1,9 @@
 """Necessary file for testing"""
 from .utils_tests import UtilTests
 from .commands_tests import CommandsTests
+from .job_handler_tests import JobHandlerTests, ConcurrentSubmissionTests, \
+    StatusNotificationTests
+from .view_tests import ViewTests
+from .metrics_tests import MetricsTests
+from .downloads_tests import DownloadsTests
+from .pagination_tests import PaginationTests
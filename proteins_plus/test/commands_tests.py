@@ -1,11 +1,17 @@
 """Test for custom proteins plus commands"""
+from io import StringIO
 from pathlib import Path
+from tempfile import TemporaryDirectory
+from django.conf import settings
 from django.core.management import call_command
 from django.contrib.staticfiles.testing import LiveServerTestCase
+from django.test import override_settings
 from molecule_handler.tasks import preprocess_molecule_task
 from molecule_handler.test.utils import create_test_preprocessor_job
+from proteins_plus.test.utils import TEST_RUN_DIRECTORY
 
 
+@override_settings(RESOURCE_STATE_FILE=str(Path(TEST_RUN_DIRECTORY.name) / 'resources.json'))
 class CommandsTests(LiveServerTestCase):
     """Test for custom proteins plus commands"""
 
@@ -28,3 +34,20 @@ class CommandsTests(LiveServerTestCase):
             call_command('spectacular', '--file', 'schema.yml')
 
         call_command('check_server', self.live_server_url)
+
+    def test_celery_workers(self):
+        """Test building the command line of the celery worker pools"""
+        with TemporaryDirectory() as directory:
+            output = StringIO()
+            call_command('celery_workers', 'start', '--dry-run', '--directory', directory,
+                         stdout=output)
+            command = output.getvalue()
+            for pool, config in settings.WORKER_POOLS.items():
+                self.assertIn(f'-Q:{pool} {",".join(config["queues"])}', command)
+                self.assertIn(f'-c:{pool} {config["concurrency"]}', command)
+
+            # stopping only considers running pools
+            output = StringIO()
+            call_command('celery_workers', 'stop', '--dry-run', '--directory', directory,
+                         stdout=output)
+            self.assertNotIn('celery -A', output.getvalue())
@@ -0,0 +1,106 @@
+"""tests for streaming downloads of compressed contents"""
+import gzip
+import io
+import tarfile
+from unittest.mock import patch
+import zlib
+
+from molecule_handler.models import Ligand, Protein
+from molecule_handler.test.utils import create_test_protein, create_multiple_test_ligands
+from proteins_plus.test.utils import PPlusTestCase
+from ..downloads import CHUNK_SIZE, CompressedContent, annotate_compressed_sizes, \
+    decompressed_chunks, get_content_disposition, gzip_chunks, parse_range, sliced_chunks, \
+    tar_chunks
+
+
+class DownloadsTests(PPlusTestCase):
+    """Testcases for the streaming downloads"""
+
+    content = b''.join(f'ATOM {i:6d} CA\n'.encode() for i in range(30000))
+
+    def test_decompressed_chunks(self):
+        """Test decompressing in chunks of bounded size"""
+        compressed = zlib.compress(self.content)
+        chunks = list(decompressed_chunks([compressed[:100], compressed[100:]]))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= CHUNK_SIZE for chunk in chunks))
+        self.assertEqual(b''.join(chunks), self.content)
+        self.assertEqual(b''.join(decompressed_chunks([zlib.compress(b'')])), b'')
+
+    def test_gzip_chunks(self):
+        """Test converting zlib compressed contents to gzip"""
+        for content in (self.content, b'', b'x'):
+            deflate = zlib.compress(content)[2:-4]
+            converted = b''.join(gzip_chunks([deflate[:10], deflate[10:]]))
+            self.assertEqual(gzip.decompress(converted), content)
+
+    def test_ranges(self):
+        """Test parsing ranges and slicing chunks"""
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 10))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 100))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 100))
+        self.assertEqual(parse_range('bytes=50-1000', 100), (50, 100))
+        self.assertEqual(parse_range('bytes=100-', 100), (100, 100))
+        self.assertEqual(parse_range('bytes=-0', 100), (100, 100))
+        self.assertIsNone(parse_range('bytes=10-5', 100))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('lines=0-1', 100))
+
+        chunks = list(decompressed_chunks([zlib.compress(self.content)]))
+        for start, end in ((0, 10), (CHUNK_SIZE - 5, CHUNK_SIZE + 5), (1000, len(self.content))):
+            self.assertEqual(b''.join(sliced_chunks(chunks, start, end)), self.content[start:end])
+
+    def test_compressed_content(self):
+        """Test reading compressed contents from the database in chunks"""
+        protein = create_test_protein()
+        protein.file_string = self.content.decode()
+        protein.save()
+        protein = annotate_compressed_sizes(
+            Protein.objects.only('id'), 'file_blob__content', 'file_blob__size').get(pk=protein.pk)
+        self.assertEqual(protein.content_size, len(self.content))
+        content = CompressedContent.from_object(protein, 'file_blob__content')
+        self.assertEqual(b''.join(content.compressed_chunks()), zlib.compress(self.content, 6))
+
+        with patch('proteins_plus.downloads.QUERY_CHUNK_SIZE', 1000), \
+                self.assertNumQueries(-(-content.compressed_size // 1000)):
+            self.assertEqual(b''.join(content.chunks()), self.content)
+        # the stored size is used without reading the content
+        with self.assertNumQueries(0):
+            self.assertEqual(content.get_size(), len(self.content))
+        self.assertEqual(gzip.decompress(b''.join(content.gzip_chunks())), self.content)
+
+        ligand, _ = create_multiple_test_ligands(protein)
+        ligand = annotate_compressed_sizes(Ligand.objects.only('id'), 'file_string').get(
+            pk=ligand.pk)
+        self.assertIsNone(ligand.content_size)
+        content = CompressedContent.from_object(ligand, 'file_string')
+        self.assertEqual(content.get_size(), len(ligand.file_string.encode()))
+
+    def test_content_disposition(self):
+        """Test suggesting file names that would break the header"""
+        self.assertEqual(get_content_disposition('1abc.pdb'),
+                         'attachment; filename="1abc.pdb"; filename*=UTF-8\'\'1abc.pdb')
+        self.assertEqual(get_content_disposition('a"b\r\nc\u00e4.pdb'),
+                         'attachment; filename="a_b__c_.pdb"; '
+                         'filename*=UTF-8\'\'a%22b%0D%0Ac%C3%A4.pdb')
+
+    def test_tar_chunks(self):
+        """Test streaming compressed contents as tar archive"""
+        protein = create_test_protein()
+        protein.file_string = self.content.decode()
+        protein.save()
+        ligand, _ = create_multiple_test_ligands(protein)
+        members = [
+            ('a.pdb', CompressedContent.from_object(annotate_compressed_sizes(
+                Protein.objects.all(), 'file_blob__content', 'file_blob__size').get(
+                    pk=protein.pk), 'file_blob__content')),
+            ('b.sdf', CompressedContent.from_object(annotate_compressed_sizes(
+                Ligand.objects.all(), 'file_string').get(pk=ligand.pk), 'file_string')),
+        ]
+        for compress in (False, True):
+            content = io.BytesIO(b''.join(tar_chunks(members, compress=compress)))
+            with tarfile.open(fileobj=content, mode='r:gz' if compress else 'r:') as archive:
+                self.assertEqual(archive.getnames(), ['a.pdb', 'b.sdf'])
+                self.assertEqual(archive.extractfile('a.pdb').read(), self.content)
+                self.assertEqual(archive.extractfile('b.sdf').read().decode(),
+                                 ligand.file_string)
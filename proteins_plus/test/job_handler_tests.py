@@ -0,0 +1,415 @@
+"""tests for proteins_plus job handling"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from celery.exceptions import Retry
+from django.conf import settings
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+
+from molecule_handler.models import PreprocessorJob
+from molecule_handler.test.config import TestConfig
+from proteins_plus.test.utils import PPlusTestCase
+from ..job_handler import CANCELLED_ERROR, JobTimeoutError, Phase, ResourceLimitError, Status, \
+    cancel_job, execute_job, record_phase, run_subprocess, submit_task, wait_for_status_change
+from ..resource_budget import release, try_reserve
+
+
+class JobHandlerTests(PPlusTestCase):
+    """Job handler tests"""
+
+    def test_submit_task_attaches_to_in_flight_job(self):
+        """Test a job missing the cache attaches to an identical job saved in the meantime"""
+        in_flight_job = PreprocessorJob(pdb_code=TestConfig.protein)
+        in_flight_job.set_hash_value()
+        in_flight_job.save()
+
+        task = MagicMock()
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        # simulate the identical job being saved right after the cache lookup
+        with patch.object(PreprocessorJob, 'retrieve_job_from_cache', autospec=True,
+                          side_effect=lambda job: job.set_hash_value()):
+            job_id, retrieved = submit_task(job, task, True)
+        self.assertEqual(job_id, in_flight_job.id)
+        self.assertTrue(retrieved)
+        task.delay.assert_not_called()
+
+        # without cache an identical job is executed again
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job_id, retrieved = submit_task(job, task, False)
+        self.assertEqual(job_id, job.id)
+        self.assertFalse(retrieved)
+        task.delay.assert_called_once_with(job.id)
+
+    def test_submit_task_deletes_saved_duplicates(self):
+        """Test jobs saved before their submission are deleted if an identical job is returned"""
+        cached_job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(cached_job, MagicMock(), True)
+
+        task = MagicMock()
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+        job_id, retrieved = submit_task(job, task, True)
+        self.assertEqual(job_id, cached_job.id)
+        self.assertTrue(retrieved)
+        self.assertFalse(PreprocessorJob.objects.filter(id=job.id).exists())
+
+        # the same applies if the identical job is saved right after the cache lookup
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+        with patch.object(PreprocessorJob, 'retrieve_job_from_cache', autospec=True,
+                          side_effect=lambda job: job.set_hash_value()):
+            job_id, retrieved = submit_task(job, task, True)
+        self.assertEqual(job_id, cached_job.id)
+        self.assertTrue(retrieved)
+        self.assertFalse(PreprocessorJob.objects.filter(id=job.id).exists())
+        self.assertEqual(PreprocessorJob.objects.count(), 1)
+        task.delay.assert_not_called()
+
+    def test_wait_for_status_change(self):
+        """Test waiting for the status of a job to change"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+        status = wait_for_status_change(PreprocessorJob, job.id, Status.PENDING, 0.1)
+        self.assertEqual(status, Status.PENDING)
+
+        job.status = Status.SUCCESS
+        job.save()
+        status = wait_for_status_change(PreprocessorJob, job.id, Status.PENDING, 10)
+        self.assertEqual(status, Status.SUCCESS)
+
+        with self.assertRaises(PreprocessorJob.DoesNotExist):
+            wait_for_status_change(PreprocessorJob, uuid.uuid4(), Status.PENDING, 0.1)
+
+
+    def test_execute_job_timings(self):
+        """Test the phases of a job execution are timed and stored on the job"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+
+        def task(job):
+            with record_phase(job, Phase.INPUT_STAGING):
+                time.sleep(0.05)
+                run_subprocess(job, ['sleep', '0.1'])
+            with record_phase(job, Phase.RESULT_LOADING):
+                PreprocessorJob.objects.filter(id=job.id).update(pdb_code=TestConfig.protein)
+
+        execute_job(task, job.id, PreprocessorJob, 'Preprocessor')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.SUCCESS)
+        self.assertGreaterEqual(job.timings[Phase.QUEUE_WAIT], 0)
+        self.assertGreaterEqual(job.timings[Phase.SUBPROCESS], 0.1)
+        self.assertIn(Phase.SUBPROCESS_CPU, job.timings)
+        # the subprocess is not counted as staging
+        self.assertGreaterEqual(job.timings[Phase.INPUT_STAGING], 0.05)
+        self.assertLess(job.timings[Phase.INPUT_STAGING], 0.1)
+        self.assertIn(Phase.RESULT_LOADING, job.timings)
+        self.assertIn(Phase.DATABASE, job.timings)
+        self.assertGreaterEqual(job.timings[Phase.TOTAL], 0.15)
+
+        def failing_task(job):
+            run_subprocess(job, ['false'])
+
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+        with self.assertRaises(subprocess.CalledProcessError):
+            execute_job(failing_task, job.id, PreprocessorJob, 'Preprocessor')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.FAILURE)
+        self.assertIn(Phase.SUBPROCESS, job.timings)
+
+    def test_resource_budget(self):
+        """Test runs of binaries are limited by their resource budget"""
+        budgets = {
+            'small': {'max_concurrent': 2, 'memory': 100, 'cpus': 1},
+            'large': {'max_concurrent': 4, 'memory': 1000, 'cpus': 1},
+        }
+        with TemporaryDirectory() as directory, override_settings(
+                BINARY_RESOURCES=budgets, NODE_RESOURCES={'memory': 1200, 'cpus': 4},
+                RESOURCE_STATE_FILE=os.path.join(directory, 'resources.json')):
+            # a run is granted if nothing else runs even if it exceeds the node resources
+            with override_settings(NODE_RESOURCES={'memory': 10, 'cpus': 4}):
+                self.assertTrue(try_reserve('large'))
+                release('large')
+
+            self.assertTrue(try_reserve('small'))
+            self.assertTrue(try_reserve('small'))
+            # max concurrent runs
+            self.assertFalse(try_reserve('small'))
+            self.assertTrue(try_reserve('large'))
+            # memory of the node
+            self.assertFalse(try_reserve('large'))
+            release('small')
+            self.assertTrue(try_reserve('small'))
+
+            # reservations of dead processes are dropped
+            process = subprocess.Popen(['true'])
+            process.wait()
+            with open(os.path.join(directory, 'resources.json'), 'w') as state_file:
+                json.dump([{'pid': process.pid, 'binary': 'large'}], state_file)
+            self.assertTrue(try_reserve('large'))
+
+    @override_settings(SUBPROCESS_POLL_INTERVAL=0.1, SUBPROCESS_KILL_GRACE_PERIOD=1)
+    def test_run_subprocess_timeout(self):
+        """Test binaries exceeding their time limit are killed with their children"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+        job.subprocess_timeout = 0.3
+        with TemporaryDirectory() as directory:
+            child_pid_path = os.path.join(directory, 'child.pid')
+            start = time.monotonic()
+            with self.assertRaises(JobTimeoutError):
+                run_subprocess(job, ['sh', '-c', f'sleep 30 & echo $! > {child_pid_path}; wait'])
+            self.assertLess(time.monotonic() - start, 5)
+            with open(child_pid_path) as child_pid_file:
+                child_pid = int(child_pid_file.read())
+        # the child has been killed together with the binary, it may remain as a zombie
+        time.sleep(0.1)
+        try:
+            with open(f'/proc/{child_pid}/stat') as stat_file:
+                self.assertEqual(stat_file.read().split()[2], 'Z')
+        except FileNotFoundError:
+            pass
+
+        def task(job):
+            run_subprocess(job, ['sleep', '30'])
+
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+        with override_settings(BINARY_TIMEOUTS={'preprocessor': 0.3}), \
+                self.assertRaises(JobTimeoutError):
+            execute_job(task, job.id, PreprocessorJob, 'Preprocessor', binary='preprocessor')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.FAILURE)
+        self.assertIn('time limit', job.error)
+
+    def test_run_subprocess_resource_limits(self):
+        """Test binaries exceeding their resource limits fail with the exceeded limit"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+        job.subprocess_limits = {'memory': 200, 'cpu_time': 1, 'open_files': 64}
+
+        with self.assertRaisesRegex(ResourceLimitError, 'memory limit of 200 MB'):
+            run_subprocess(job, [sys.executable, '-c', 'data = bytearray(400 * 2**20)'])
+        with self.assertRaisesRegex(ResourceLimitError, 'CPU time limit of 1 seconds'):
+            run_subprocess(job, [sys.executable, '-c', 'while True: pass'])
+        with self.assertRaisesRegex(ResourceLimitError, 'limit of 64 open files'):
+            run_subprocess(job, [sys.executable, '-c',
+                                 'import sys; files = [open(sys.executable) for _ in range(100)]'])
+        with self.assertRaisesRegex(ResourceLimitError,
+                                    'killed by SIGSEGV and probably exceeded the memory limit'):
+            run_subprocess(job, [sys.executable, '-c',
+                                 'import os, signal; os.kill(os.getpid(), signal.SIGSEGV)'])
+        # failures with a large resident memory are not mistaken for the memory limit
+        job.subprocess_limits = {'memory': 300}
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_subprocess(job, [sys.executable, '-c',
+                                 'data = bytearray(270 * 2**20); data[::4096] = '
+                                 'b"x" * len(data[::4096]); raise SystemExit(3)'])
+        # failures unrelated to the limits
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_subprocess(job, [sys.executable, '-c', 'raise SystemExit(3)'])
+        self.assertEqual(run_subprocess(job, [sys.executable, '-c', 'data = bytearray(2**20)']), 0)
+
+        def task(job):
+            run_subprocess(job, [sys.executable, '-c', 'data = bytearray(400 * 2**20)'])
+
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+        with override_settings(BINARY_LIMITS={'preprocessor': {'memory': 200}}), \
+                self.assertRaises(ResourceLimitError):
+            execute_job(task, job.id, PreprocessorJob, 'Preprocessor', binary='preprocessor')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.FAILURE)
+        self.assertIn('memory limit of 200 MB', job.error)
+
+    @override_settings(SUBPROCESS_POLL_INTERVAL=0.1)
+    def test_cancel_running_job(self):
+        """Test cancelling a job kills its binary and skips pending jobs"""
+        def task(job):
+            cancel_job(PreprocessorJob, job.id)
+            run_subprocess(job, ['sleep', '30'])
+
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+        start = time.monotonic()
+        execute_job(task, job.id, PreprocessorJob, 'Preprocessor')
+        self.assertLess(time.monotonic() - start, 5)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.FAILURE)
+        self.assertEqual(job.error, CANCELLED_ERROR)
+
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+        self.assertTrue(cancel_job(PreprocessorJob, job.id))
+        self.assertFalse(cancel_job(PreprocessorJob, job.id))
+        task = MagicMock()
+        execute_job(task, job.id, PreprocessorJob, 'Preprocessor')
+        task.assert_not_called()
+
+    def test_cancel_job_outside_of_binary(self):
+        """Test a cancellation during the Python part of a task is not overwritten"""
+        def task(job):
+            cancel_job(PreprocessorJob, job.id)
+
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+        execute_job(task, job.id, PreprocessorJob, 'Preprocessor')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.FAILURE)
+        self.assertEqual(job.error, CANCELLED_ERROR)
+        self.assertIsNone(job.hash_value)
+        self.assertIsNotNone(job.timings)
+
+        # saving the job object of the worker aborts the task
+        def saving_task(job):
+            cancel_job(PreprocessorJob, job.id)
+            job.error = 'overwritten'
+            job.save()
+
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+        execute_job(saving_task, job.id, PreprocessorJob, 'Preprocessor')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.FAILURE)
+        self.assertEqual(job.error, CANCELLED_ERROR)
+
+        # failing tasks do not overwrite the cancellation either
+        def failing_task(job):
+            cancel_job(PreprocessorJob, job.id)
+            raise ValueError('failed after the cancellation')
+
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+        execute_job(failing_task, job.id, PreprocessorJob, 'Preprocessor')
+        job.refresh_from_db()
+        self.assertEqual(job.error, CANCELLED_ERROR)
+
+    def test_execute_job_over_budget(self):
+        """Test jobs over budget are put back into the queue"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        submit_task(job, MagicMock(), False)
+        task = MagicMock()
+        celery_task = MagicMock()
+        celery_task.request.called_directly = False
+        celery_task.request.is_eager = False
+        celery_task.request.args = [job.id]
+        celery_task.request.retries = 0
+        celery_task.retry.return_value = Retry()
+        with patch('proteins_plus.job_handler.try_reserve', return_value=False), \
+                patch('proteins_plus.job_handler.current_task', celery_task), \
+                override_settings(RESOURCE_RETRY_DELAY=5, RESOURCE_RETRY_MAX_DELAY=30,
+                                  RESOURCE_MAX_REQUEUES=10):
+            with self.assertRaises(Retry):
+                execute_job(task, job.id, PreprocessorJob, 'Preprocessor', binary='preprocessor')
+            celery_task.retry.assert_called_once_with(countdown=5, max_retries=None)
+            job.refresh_from_db()
+            self.assertEqual(job.status, Status.PENDING)
+
+            # the delay doubles with every requeue up to its maximum
+            celery_task.request.retries = 2
+            with self.assertRaises(Retry):
+                execute_job(task, job.id, PreprocessorJob, 'Preprocessor', binary='preprocessor')
+            self.assertEqual(celery_task.retry.call_args.kwargs['countdown'], 20)
+            celery_task.request.retries = 5
+            with self.assertRaises(Retry):
+                execute_job(task, job.id, PreprocessorJob, 'Preprocessor', binary='preprocessor')
+            self.assertEqual(celery_task.retry.call_args.kwargs['countdown'], 30)
+
+            # jobs fail after the maximum number of requeues
+            celery_task.retry.reset_mock()
+            celery_task.request.retries = 10
+            execute_job(task, job.id, PreprocessorJob, 'Preprocessor', binary='preprocessor')
+            celery_task.retry.assert_not_called()
+        task.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.FAILURE)
+        self.assertIn('busy', job.error)
+
+    def test_task_routes(self):
+        """Test every tool is routed to its own queue with its priority"""
+        from proteins_plus.celery import app  # pylint: disable=import-outside-toplevel
+        for tool, priority in settings.TOOL_QUEUE_PRIORITIES.items():
+            route = app.amqp.router.route({}, f'{tool}.tasks.some_task')
+            self.assertEqual(route['queue'].name, tool)
+            self.assertEqual(route['priority'], priority)
+        route = app.amqp.router.route({}, 'proteins_plus.celery.debug_task')
+        self.assertEqual(route['queue'].name, settings.CELERY_TASK_DEFAULT_QUEUE)
+
+        consumed_queues = set()
+        for pool in settings.WORKER_POOLS.values():
+            consumed_queues.update(pool['queues'])
+        self.assertEqual(consumed_queues, set(app.amqp.queues))
+
+class ConcurrentSubmissionTests(TransactionTestCase):
+    """Concurrent job submission tests"""
+
+    def test_concurrent_submissions(self):
+        """Test identical jobs submitted concurrently are executed only once"""
+        nof_submissions = 4
+        barrier = threading.Barrier(nof_submissions, timeout=10)
+        original_retrieve = PreprocessorJob.retrieve_job_from_cache
+
+        def retrieve_job_from_cache(job):
+            # every submission misses the cache before any of them is saved
+            cached_job = original_retrieve(job)
+            barrier.wait()
+            return cached_job
+
+        task = MagicMock()
+        results = []
+        errors = []
+
+        def submit():
+            try:
+                job = PreprocessorJob(pdb_code=TestConfig.protein)
+                results.append(submit_task(job, task, True))
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+            finally:
+                connection.close()
+
+        with patch.object(PreprocessorJob, 'retrieve_job_from_cache', autospec=True,
+                          side_effect=retrieve_job_from_cache):
+            threads = [threading.Thread(target=submit) for _ in range(nof_submissions)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), nof_submissions)
+        self.assertEqual(len({job_id for job_id, _ in results}), 1)
+        self.assertEqual(len([retrieved for _, retrieved in results if not retrieved]), 1)
+        task.delay.assert_called_once()
+
+
+class StatusNotificationTests(TransactionTestCase):
+    """Job status notification tests"""
+
+    def test_wait_for_execution(self):
+        """Test a waiting client wakes up when a job is executed"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+
+        def execute():
+            try:
+                time.sleep(0.1)
+                execute_job(MagicMock(), job.id, PreprocessorJob, 'Preprocessor')
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=execute)
+        thread.start()
+        start = time.monotonic()
+        status = wait_for_status_change(PreprocessorJob, job.id, Status.PENDING, 10)
+        thread.join()
+        self.assertIn(status, (Status.RUNNING, Status.SUCCESS))
+        self.assertLess(time.monotonic() - start, 10)
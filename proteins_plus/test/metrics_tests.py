@@ -0,0 +1,101 @@
+"""tests for the metrics shared by all server and worker processes"""
+from unittest.mock import MagicMock, patch
+import redis
+from django.test import Client, override_settings
+
+from proteins_plus.test.utils import PPlusTestCase
+from .. import metrics
+from ..metrics import Counter, Histogram, Metric, REGISTRY, JOB_SUBMISSIONS, JOB_DURATION, \
+    SUBPROCESS_EXITS
+
+
+class MetricsTests(PPlusTestCase):
+    """Testcases for the metrics"""
+
+    def tearDown(self):
+        super().tearDown()
+        metrics._unavailable_until = 0.0  # pylint: disable=protected-access
+        for metric in list(REGISTRY):
+            if metric.name.startswith('test_'):
+                REGISTRY.remove(metric)
+
+    def test_render_counter(self):
+        """Test rendering a counter in the Prometheus text format"""
+        counter = Counter('test_counter_total', 'A test counter', ('tool', 'status'))
+        label_string = counter.label_string({'status': 'success', 'tool': 'protoss'})
+        self.assertEqual(label_string, 'tool="protoss",status="success"')
+        lines = counter.render({label_string: 3.0})
+        self.assertEqual(lines, [
+            '# HELP test_counter_total A test counter',
+            '# TYPE test_counter_total counter',
+            'test_counter_total{tool="protoss",status="success"} 3.0',
+        ])
+
+    def test_render_histogram(self):
+        """Test rendering a histogram with cumulative buckets"""
+        histogram = Histogram('test_duration_seconds', 'A test histogram', ('tool',),
+                              buckets=(1, 10, float('inf')))
+        label_string = histogram.label_string({'tool': 'siena'})
+        lines = histogram.render({
+            f'{label_string}|bucket|1.0': 2.0,
+            f'{label_string}|bucket|+Inf': 1.0,
+            f'{label_string}|sum': 101.5,
+            f'{label_string}|count': 3.0,
+        })
+        self.assertEqual(lines[2:], [
+            'test_duration_seconds_bucket{tool="siena",le="1.0"} 2.0',
+            'test_duration_seconds_bucket{tool="siena",le="10.0"} 2.0',
+            'test_duration_seconds_bucket{tool="siena",le="+Inf"} 3.0',
+            'test_duration_seconds_sum{tool="siena"} 101.5',
+            'test_duration_seconds_count{tool="siena"} 3.0',
+        ])
+
+    def test_invalid_labels(self):
+        """Test recording metrics with wrong labels"""
+        with self.assertRaises(ValueError):
+            JOB_SUBMISSIONS.inc(tool='protoss')
+        with self.assertRaises(ValueError):
+            JOB_DURATION.observe(1.0, tool='protoss', status='success', binary='protoss')
+
+    def test_record_metrics(self):
+        """Test that recording metrics does not raise and they are exported"""
+        JOB_SUBMISSIONS.inc(tool='protoss', retrieved='false')
+        JOB_DURATION.observe(2.5, tool='protoss', status='success')
+        SUBPROCESS_EXITS.inc(binary='protoss', exit_code=0)
+
+        with self.settings(METRICS_TOKEN='secret'):
+            response = Client().get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        content = response.content.decode()
+        for metric in (JOB_SUBMISSIONS, JOB_DURATION, SUBPROCESS_EXITS):
+            self.assertIn(f'# TYPE {metric.name} {metric.metric_type}', content)
+        self.assertIn('# TYPE pplus_celery_queue_length gauge', content)
+
+    def test_metric_is_abstract(self):
+        """Test that metrics have to implement rendering their samples"""
+        # pylint: disable=abstract-class-instantiated
+        with self.assertRaises(TypeError):
+            Metric('test_abstract', 'An abstract metric')
+
+    def test_unavailable_redis(self):
+        """Test that metrics are dropped for a while after redis was not available"""
+        client = MagicMock()
+        client.pipeline.return_value.execute.side_effect = redis.ConnectionError('unavailable')
+        with patch('proteins_plus.metrics._get_redis_client', return_value=client):
+            JOB_SUBMISSIONS.inc(tool='protoss', retrieved='false')
+            JOB_SUBMISSIONS.inc(tool='protoss', retrieved='false')
+        self.assertEqual(client.pipeline.call_count, 1)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """Test that only requests with the metrics token can read the metrics"""
+        # requests arrive through the reverse proxy on localhost
+        proxied = Client(REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(proxied.get('/metrics').status_code, 403)
+        self.assertEqual(
+            proxied.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(
+            proxied.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(proxied.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
@@ -0,0 +1,92 @@
+"""tests for the keyset pagination of list endpoints"""
+from urllib.parse import parse_qs, urlparse
+
+from molecule_handler.models import PreprocessorJob
+from molecule_handler.test.utils import create_test_protein, create_multiple_test_ligands
+from molecule_handler.views import LigandViewSet, PreprocessorJobViewSet, ProteinViewSet
+from proteins_plus.test.utils import PPlusTestCase, call_api
+
+
+def get_cursor(url):
+    """Extract the cursor of a page link
+
+    :param url: page link
+    :type url: str
+    :return: cursor
+    :rtype: str
+    """
+    return parse_qs(urlparse(url).query)['cursor'][0]
+
+
+class PaginationTests(PPlusTestCase):
+    """Testcases for the keyset pagination"""
+
+    def walk_pages(self, viewset, limit):
+        """Follow the next links of a list endpoint to its end
+
+        :param viewset: viewset of the list endpoint
+        :type viewset: ProteinsPlusReadOnlyViewSet
+        :param limit: page size
+        :type limit: int
+        :return: ids of all listed objects and the cursor of the last page
+        :rtype: tuple(list[str], str)
+        """
+        query_params = {'limit': limit}
+        ids = []
+        cursor = None
+        while True:
+            response = call_api(viewset, 'get', viewset_actions={'get': 'list'},
+                                query_params=query_params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), limit)
+            ids.extend(result['id'] for result in response.data['results'])
+            if response.data['next'] is None:
+                return ids, cursor
+            cursor = get_cursor(response.data['next'])
+            query_params = {'limit': limit, 'cursor': cursor}
+
+    def test_pages_by_creation_date(self):
+        """Test listing objects newest first across pages"""
+        proteins = [create_test_protein() for _ in range(5)]
+        ids, cursor = self.walk_pages(ProteinViewSet, 2)
+        expected = sorted(proteins, key=lambda protein: (protein.date_created, protein.id),
+                          reverse=True)
+        self.assertEqual(ids, [str(protein.id) for protein in expected])
+
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'list'},
+                            query_params={'limit': 2, 'cursor': cursor})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 1)
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'list'},
+                            query_params={'limit': 2,
+                                          'cursor': get_cursor(response.data['previous'])})
+        self.assertEqual([result['id'] for result in response.data['results']], ids[2:4])
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'list'},
+                            query_params={'limit': 2,
+                                          'cursor': get_cursor(response.data['previous'])})
+        self.assertEqual([result['id'] for result in response.data['results']], ids[:2])
+        self.assertIsNone(response.data['previous'])
+
+    def test_pages_without_creation_date(self):
+        """Test listing objects without creation date"""
+        create_multiple_test_ligands(create_test_protein())
+        create_multiple_test_ligands(create_test_protein())
+        ids, _ = self.walk_pages(LigandViewSet, 3)
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_pages_jobs_by_creation_time(self):
+        """Test listing jobs of the same day newest first by their creation time"""
+        jobs = []
+        for _ in range(5):
+            job = PreprocessorJob()
+            job.save()
+            jobs.append(job)
+        ids, _ = self.walk_pages(PreprocessorJobViewSet, 2)
+        self.assertEqual(ids, [str(job.id) for job in reversed(jobs)])
+
+    def test_invalid_cursor(self):
+        """Test listing with an invalid cursor"""
+        response = call_api(ProteinViewSet, 'get', viewset_actions={'get': 'list'},
+                            query_params={'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
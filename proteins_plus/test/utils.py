@@ -1,15 +1,26 @@
 """Utility functions used in unit tests"""
 import subprocess
 from pathlib import Path
-from django.test import RequestFactory, TestCase
+from tempfile import TemporaryDirectory
+from django.test import RequestFactory, TestCase, override_settings
 
 from proteins_plus import settings
 
 from molecule_handler.models import Ligand, ElectronDensityMap
 
+# holds files the server writes outside of the media directory, removed when the tests end
+TEST_RUN_DIRECTORY = TemporaryDirectory()  # pylint: disable=consider-using-with
 
+
+@override_settings(
+    FETCH_CACHE=dict(settings.FETCH_CACHE, max_size=0, failure_ttl=0),
+    RESOURCE_STATE_FILE=str(Path(TEST_RUN_DIRECTORY.name) / 'resources.json'))
 class PPlusTestCase(TestCase):
-    """Global TestCase class to handle global setup and teardown"""
+    """Global TestCase class to handle global setup and teardown
+
+    The fetch cache is disabled, so fetches of one test never influence another. The resource
+    reservations of executed jobs are kept in a temporary directory instead of the checkout.
+    """
 
     def tearDown(self):
         """Make sure object associated files are deleted"""
@@ -18,7 +29,7 @@ class PPlusTestCase(TestCase):
 
 
 def call_api(view_class, method, data=None, query_params=None,
-             viewset_actions=None, **req_kwargs):
+             viewset_actions=None, headers=None, **req_kwargs):
     """Helper function for making calls to the api
 
     Examples
@@ -41,6 +52,8 @@ def call_api(view_class, method, data=None, query_params=None,
     :param viewset_actions: Dictionary specifying the viewset actions that should be used
                             for the api call. Implies that view_class is a ViewSet, defaults to None
     :type viewset_actions: dict, optional
+    :param headers: Request headers as WSGI environ keys like HTTP_RANGE, defaults to {}
+    :type headers: dict, optional
     :return: The response of the api call
     :rtype: HttpResponse
     """
@@ -54,6 +67,9 @@ def call_api(view_class, method, data=None, query_params=None,
         for key in query_params:
             req_string += key + '=' + str(query_params[key]) + '&'
 
+    if headers is not None:
+        kwargs.update(headers)
+
     request = getattr(factory, method)(req_string, **kwargs)
     if viewset_actions is None:
         response = view_class.as_view()(request, *[], **req_kwargs)
@@ -1,7 +1,16 @@
 """tests for proteins_plus utility functions"""
+from copy import deepcopy
+from datetime import date, timedelta
+import json
+import random
+
+from molecule_handler.models import Protein
+from molecule_handler.test.utils import create_test_protein
+from protoss.models import ProtossJob
+from siena.models import SienaJob
 from proteins_plus.test.utils import PPlusTestCase
 from ..models import MockJob, MockModel
-from ..utils import json_to_sorted_string, clean_up_models
+from ..utils import json_to_sorted_string, sort_json_lists, clean_up_models
 
 
 class UtilTests(PPlusTestCase):
@@ -87,6 +96,32 @@ class UtilTests(PPlusTestCase):
         # non JSON-like dict raise errors
         self.assertRaises(TypeError, json_to_sorted_string, {'key': set()})
 
+    def test_sorted_string_matches_sort_json_lists(self):
+        """Test the sorted string equals sorting with the JSON comparator and keeps the input"""
+
+        def generate_json(depth):
+            choice = random.random()
+            if depth > 3 or choice < 0.4:
+                return random.choice(['a', 'b', 'c'])
+            if choice < 0.7:
+                return {random.choice('abcd'): generate_json(depth + 1)
+                        for _ in range(random.randint(0, 3))}
+            return [generate_json(depth + 1) for _ in range(random.randint(0, 4))]
+
+        random.seed(0)
+        for _ in range(1000):
+            obj = generate_json(0)
+            original = deepcopy(obj)
+            try:
+                sorted_obj = deepcopy(obj)
+                sort_json_lists(sorted_obj)
+                expected = json.dumps(sorted_obj, sort_keys=True, separators=(',', ':'))
+            except TypeError:
+                self.assertRaises(TypeError, json_to_sorted_string, obj)
+            else:
+                self.assertEqual(json_to_sorted_string(obj), expected)
+            self.assertEqual(obj, original)
+
     def test_unify_protein_site_dicts(self):
         """Test converting site dicts to unique string for JSON"""
         # sort objects against objects
@@ -161,3 +196,36 @@ class UtilTests(PPlusTestCase):
         self.assertFalse(MockJob.objects.filter(id=other_mock_child.id).exists())
         self.assertFalse(MockJob.objects.filter(id=mock_parent.id).exists())
         self.assertFalse(MockJob.objects.filter(id=mock_model.id).exists())
+
+    def test_cleanup_batched(self):
+        """Test cleanup of proteins with stale, non-stale and shared jobs in small batches"""
+        stale_date = date.today() + timedelta(days=30)
+        orphan = create_test_protein()
+        stale_input = create_test_protein()
+        stale_output = create_test_protein()
+        stale_job = ProtossJob(input_protein=stale_input, output_protein=stale_output)
+        stale_job.save()
+        ProtossJob.objects.filter(id=stale_job.id).update(date_last_accessed=stale_date)
+
+        kept_input = create_test_protein()
+        kept_output = create_test_protein()
+        kept_job = ProtossJob(input_protein=kept_input, output_protein=kept_output)
+        kept_job.save()
+        ensemble_protein = create_test_protein()
+        ensemble_job = SienaJob(input_protein=kept_input)
+        ensemble_job.save()
+        ensemble_job.output_proteins.add(ensemble_protein, kept_output)
+        stale_ensemble_job = SienaJob(input_protein=kept_input)
+        stale_ensemble_job.save()
+        stale_ensemble_job.output_proteins.add(ensemble_protein)
+        SienaJob.objects.filter(id=stale_ensemble_job.id).update(date_last_accessed=stale_date)
+
+        self.assertEqual(clean_up_models(Protein, batch_size=1), 3)
+        self.assertEqual(
+            set(Protein.objects.values_list('id', flat=True)),
+            {kept_input.id, kept_output.id, ensemble_protein.id})
+        self.assertFalse(Protein.objects.filter(id=orphan.id).exists())
+        self.assertFalse(ProtossJob.objects.filter(id=stale_job.id).exists())
+        self.assertTrue(ProtossJob.objects.filter(id=kept_job.id).exists())
+        self.assertEqual(
+            set(SienaJob.objects.values_list('id', flat=True)), {ensemble_job.id})
@@ -0,0 +1,121 @@
+"""tests for views shared by all apps"""
+import json
+import threading
+import time
+import uuid
+from unittest.mock import patch
+
+from molecule_handler.models import PreprocessorJob
+from molecule_handler.test.config import TestConfig
+from proteins_plus.test.utils import PPlusTestCase, call_api
+from ..job_handler import CANCELLED_ERROR, Status
+from ..views import JobCancelView, JobStatusView, JobStatusEventsView, get_job_status
+
+
+class ViewTests(PPlusTestCase):
+    """Testcases for the views shared by all apps"""
+
+    def test_job_status(self):
+        """Test getting the status of a job"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+
+        response = call_api(JobStatusView, 'get', job_id=job.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['job_id'], str(job.id))
+        self.assertEqual(response.data['status'], 'pending')
+
+        response = call_api(JobStatusView, 'get', query_params={'status': 'pending', 'wait': 0.1},
+                            job_id=job.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'pending')
+
+        job.status = Status.SUCCESS
+        job.save()
+        response = call_api(JobStatusView, 'get', query_params={'status': 'pending', 'wait': 10},
+                            job_id=job.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'success')
+
+    def test_job_status_invalid(self):
+        """Test getting the status of a job with invalid input"""
+        response = call_api(JobStatusView, 'get', job_id=uuid.uuid4())
+        self.assertEqual(response.status_code, 404)
+
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+        response = call_api(JobStatusView, 'get', query_params={'wait': 3600}, job_id=job.id)
+        self.assertEqual(response.status_code, 400)
+        response = call_api(JobStatusView, 'get', query_params={'status': 'done'}, job_id=job.id)
+        self.assertEqual(response.status_code, 400)
+
+    def test_job_status_events(self):
+        """Test streaming the status of a job"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein, status=Status.FAILURE)
+        job.save()
+
+        response = call_api(JobStatusEventsView, 'get', job_id=job.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = b''.join(response.streaming_content).decode().split('\n\n')
+        self.assertEqual(events[0].split('\n')[0], 'event: status')
+        data = json.loads(events[0].split('\n')[1][len('data: '):])
+        self.assertEqual(data, {'job_id': str(job.id), 'status': 'failure'})
+        self.assertEqual(events[1:], [''])
+
+        response = call_api(JobStatusEventsView, 'get', job_id=uuid.uuid4())
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_job_status(self):
+        """Test finding a job among all job tables with a single query"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_job_status(job.id), (PreprocessorJob, Status.PENDING))
+
+    def test_job_status_too_many_waiters(self):
+        """Test that clients get the current status right away if too many are waiting"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+
+        with patch('proteins_plus.views._status_waiters', threading.BoundedSemaphore(1)) \
+                as waiters:
+            waiters.acquire()
+            start = time.monotonic()
+            response = call_api(JobStatusView, 'get',
+                                query_params={'status': 'pending', 'wait': 10}, job_id=job.id)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['status'], 'pending')
+            self.assertLess(time.monotonic() - start, 5)
+
+            response = call_api(JobStatusEventsView, 'get', job_id=job.id)
+            events = b''.join(response.streaming_content).decode().split('\n\n')
+            self.assertEqual(events[0].split('\n')[:2], ['retry: 5000', 'event: status'])
+            self.assertEqual(events[1:], [''])
+
+            # the waiting slot is given back after the stream ended
+            waiters.release()
+            with self.settings(JOB_STATUS_STREAM_TIME=0.1):
+                response = call_api(JobStatusEventsView, 'get', job_id=job.id)
+                b''.join(response.streaming_content)
+            self.assertTrue(waiters.acquire(blocking=False))
+
+    def test_cancel_job(self):
+        """Test cancelling a job"""
+        job = PreprocessorJob(pdb_code=TestConfig.protein)
+        job.save()
+
+        response = call_api(JobCancelView, 'post', job_id=job.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'failure')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.FAILURE)
+        self.assertEqual(job.error, CANCELLED_ERROR)
+
+        # finished jobs cannot be cancelled
+        response = call_api(JobCancelView, 'post', job_id=job.id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['status'], 'failure')
+
+        response = call_api(JobCancelView, 'post', job_id=uuid.uuid4())
+        self.assertEqual(response.status_code, 404)
@@ -18,12 +18,17 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from proteins_plus import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
     path('', SpectacularSwaggerView.as_view(url_name='schema'),
          name='swagger-ui'),
+    path('jobs/<uuid:job_id>/status/', views.JobStatusView.as_view()),
+    path('jobs/<uuid:job_id>/events/', views.JobStatusEventsView.as_view()),
+    path('jobs/<uuid:job_id>/cancel/', views.JobCancelView.as_view()),
+    path('metrics', views.metrics),
     path('molecule_handler/', include('molecule_handler.urls')),
     path('protoss/', include('protoss.urls')),
     path('ediascorer/', include('ediascorer.urls')),
@@ -1,10 +1,8 @@
 """utils for proteins_plus app"""
-from copy import deepcopy
 from functools import cmp_to_key
-import inspect
 import json
 import logging
-from django.db import models
+from django.db.models import Exists, OuterRef, Q
 
 
 def compare_json_dict(first, second):
@@ -79,7 +77,109 @@ def sort_json_lists(obj):
     sort_json_lists_recursive(obj)
 
 
-def json_to_sorted_string(obj, copy=True):
+_SCALAR = 0
+_DICT = 1
+_LIST = 2
+
+
+def _sort_key(value):
+    """Build a key that orders a JSON value like compare_json_value
+
+    Lists and scalars are compared as they are. Dicts get their keys sorted once here instead of
+    on every comparison.
+
+    :param value: JSON value
+    :type value: object
+    :return: category and comparable content
+    :rtype: tuple
+    """
+    if isinstance(value, list):
+        return _LIST, value
+    if isinstance(value, dict):
+        return _DICT, [(key, _sort_key(value[key])) for key in sorted(value.keys())]
+    return _SCALAR, value
+
+
+def _compare_sort_keys(first, second):
+    """Sort comparator for keys built by _sort_key, equivalent to compare_json_value
+
+    :param first: first key
+    :param second: second key
+    :return: -1, 0 or 1 meaning sort a before b, a and b are not comparable, sort b before a
+    """
+    if first[0] != second[0]:
+        return -1 if first[0] < second[0] else 1
+    if first[0] == _DICT:
+        for (a_key, a_value), (b_key, b_value) in zip(first[1], second[1]):
+            if a_key != b_key:
+                return -1 if a_key < b_key else 1
+            comparison = _compare_sort_keys(a_value, b_value)
+            if comparison != 0:
+                return comparison
+        return 0
+    if first[1] != second[1]:
+        return -1 if first[1] < second[1] else 1
+    return 0
+
+
+def _sorted_json_list(values):
+    """Sort a JSON list like sort_json_lists without modifying it
+
+    Lists of scalars and lists of dicts with the same keys and scalar values, e.g. residue lists,
+    are sorted natively. Everything else falls back to a comparator on precomputed keys.
+
+    :param values: JSON list
+    :type values: list
+    :return: sorted shallow copy of the list
+    :rtype: list
+    """
+    if len(values) < 2:
+        return list(values)
+    if not any(isinstance(value, (list, dict)) for value in values):
+        return sorted(values)
+    if all(isinstance(value, dict) for value in values):
+        keys = sorted(values[0].keys())
+        if all(value.keys() == values[0].keys() for value in values) and not any(
+                isinstance(item, (list, dict)) for value in values for item in value.values()):
+            return sorted(values, key=lambda value: tuple(value[key] for key in keys))
+    key_type = cmp_to_key(_compare_sort_keys)
+    sort_keys = [key_type(_sort_key(value)) for value in values]
+    order = sorted(range(len(values)), key=sort_keys.__getitem__)
+    return [values[index] for index in order]
+
+
+def canonicalize_json(obj):
+    """Build a canonical version of a nested JSON object
+
+    All lists are sorted in the same order as sort_json_lists would sort them. The object itself
+    is neither modified nor deep-copied, only the containers are rebuilt.
+
+    :note: circular object references are not legal in JSON and will raise a ValueError.
+    :param obj: the object
+    :type obj: object
+    :raises ValueError: If a list or dict is referenced more than once
+    :return: canonical object
+    :rtype: object
+    """
+
+    def canonicalize_recursive(current_obj):
+        if isinstance(current_obj, list):
+            if id(current_obj) in seen_objects:
+                raise ValueError('Circular reference detected')
+            seen_objects.add(id(current_obj))
+            return [canonicalize_recursive(value) for value in _sorted_json_list(current_obj)]
+        if isinstance(current_obj, dict):
+            if id(current_obj) in seen_objects:
+                raise ValueError('Circular reference detected')
+            seen_objects.add(id(current_obj))
+            return {key: canonicalize_recursive(value) for key, value in current_obj.items()}
+        return current_obj
+
+    seen_objects = set()
+    return canonicalize_recursive(obj)
+
+
+def json_to_sorted_string(obj, copy=True):  # pylint: disable=unused-argument
     """Converts nested json object to sorted string.
 
     Can be used to uniquely identify JSON files for hashing and caching. The resulting string is a
@@ -87,34 +187,92 @@ def json_to_sorted_string(obj, copy=True):
 
     :param obj: the object
     :type obj: object
-    :param copy: Whether to copy obj before sorting.
+    :param copy: Kept for compatibility, obj is never modified.
     :type copy: bool
     :return A unique string
     """
-    this_obj = obj
-    if copy:
-        this_obj = deepcopy(this_obj)
-    sort_json_lists(this_obj)
-    return json.dumps(this_obj, sort_keys=True, separators=(',', ':'))
+    return json.dumps(canonicalize_json(obj), sort_keys=True, separators=(',', ':'))
 
 
-def clean_up_models(model_type):
+def clean_up_models(model_type, batch_size=1000):
     """Perform cleanup of the passed model type
 
-    Will trigger cleanup of child and parent jobs associated with this model type.
+    Will remove stale child and parent jobs associated with this model type and then all models
+    that have no remaining jobs. Both are selected with a few queries and deleted in batches.
 
     :param model_type: type of the model to perform cleanup for
     :type model_type: Type[proteins_plus.models.ProteinsPlusBaseModel]
+    :param batch_size: maximum number of objects to delete at once
+    :type batch_size: int
+    :return: number of removed models
+    :rtype: int
+    """
+    job_relations = get_job_relations(model_type)
+    for job_type, lookups in job_relations.items():
+        is_related = Q()
+        for lookup in lookups:
+            is_related |= Q(**{f'{lookup}__isnull': False})
+        stale_jobs = job_type.get_stale_jobs().filter(is_related).distinct()
+        delete_in_batches(job_type, stale_jobs, batch_size)
+
+    orphaned_models = model_type.objects.all()
+    for job_type, lookups in job_relations.items():
+        for lookup in lookups:
+            orphaned_models = orphaned_models.filter(
+                ~Exists(job_type.objects.filter(**{lookup: OuterRef('pk')})))
+    return delete_in_batches(model_type, orphaned_models, batch_size)
+
+
+def get_job_relations(model_type):
+    """Find all job relations of a model type
+
+    :param model_type: type of the model to find the job relations of
+    :type model_type: Type[proteins_plus.models.ProteinsPlusBaseModel]
+    :return: lookups from each related job type back to the model type
+    :rtype: dict[Type[proteins_plus.models.ProteinsPlusJob], list[str]]
     """
-    for model in model_type.objects.all():
-        job_relations = [
-            member for member in inspect.getmembers(model)
-            if is_job_relation(member[0]) and member[1] is not None
-        ]
-        jobs = cleanup_job_relations(job_relations)
-        if jobs == 0:
-            logging.info('Removing %s', model)
-            model.delete()
+    from .models import ProteinsPlusJob  # pylint: disable=import-outside-toplevel
+    job_relations = {}
+    for field in model_type._meta.get_fields():
+        if not field.is_relation or not issubclass(field.related_model, ProteinsPlusJob):
+            continue
+        if field.auto_created and not field.concrete:
+            # reverse relation from a job to this model type
+            member_name = field.get_accessor_name()
+            lookup = field.field.name
+        else:
+            member_name = field.name
+            lookup = field.related_query_name()
+        if is_job_relation(member_name):
+            job_relations.setdefault(field.related_model, []).append(lookup)
+    return job_relations
+
+
+def delete_in_batches(model_type, queryset, batch_size):
+    """Delete the objects of a queryset in batches
+
+    The queryset is evaluated again for every batch, so it has to select less objects after each
+    deletion.
+
+    :param model_type: type of the objects to delete
+    :type model_type: Type[proteins_plus.models.ProteinsPlusBaseModel]
+    :param queryset: objects to delete
+    :type queryset: django.db.models.QuerySet
+    :param batch_size: maximum number of objects to delete at once
+    :type batch_size: int
+    :return: number of deleted objects
+    :rtype: int
+    """
+    total = queryset.count()
+    removed = 0
+    while removed < total:
+        batch = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if len(batch) == 0:
+            break
+        model_type.objects.filter(pk__in=batch).delete()
+        removed += len(batch)
+        logging.info('Removed %d of %d %s objects', removed, total, model_type.__name__)
+    return removed
 
 
 def is_job_relation(member_name):
@@ -131,27 +289,3 @@ def is_job_relation(member_name):
     return 'job' in member_name \
            and ('child' in member_name or 'parent' in member_name) \
            and 'id' not in member_name
-
-
-def cleanup_job_relations(job_relations):
-    """Perform cleanup of job relations
-
-    :param job_relations: job relations of jobs to clean up
-    :type job_relations:  [(models.Manager|proteins_plus.models.ProteinsPlusJob), ...]
-    :return: number of jobs that still exist after cleanup
-    :rtype: int
-    """
-    jobs = 0
-    for relation in job_relations:
-        if isinstance(relation[1], models.Manager):
-            relation_manager = relation[1]
-            jobs += relation_manager.count()
-            for model in relation_manager.all():
-                if model.clean_up():
-                    jobs -= 1
-        else:
-            model = relation[1]
-            jobs += 1
-            if model.clean_up():
-                jobs -= 1
-    return jobs
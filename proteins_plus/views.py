@@ -0,0 +1,393 @@
+"""Views shared by all apps"""
+from hashlib import blake2b
+import hmac
+import json
+import threading
+import time
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import CharField, Value
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.functional import cached_property
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import ManyRelatedField
+from rest_framework.views import APIView
+from rest_framework.viewsets import ReadOnlyModelViewSet
+from rest_framework.response import Response
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiTypes
+
+from .job_handler import Status, cancel_job, wait_for_status_change
+from .metrics import render_metrics
+from .models import ProteinsPlusJob
+from .serializers import ExpandQuerySerializer, JobStatusQuerySerializer, \
+    JobStatusSerializer, SparseFieldsetQuerySerializer
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# each waiting client holds a server thread, so only some of the threads may wait
+_status_waiters = threading.BoundedSemaphore(settings.JOB_STATUS_MAX_WAITERS)
+
+
+def get_job_status(job_id):
+    """Find a job of any app and get its status
+
+    :param job_id: Id of the job object
+    :type job_id: uuid.UUID
+    :raises Http404: If no job has the given id
+    :return: job type and status abbreviation
+    :rtype: tuple(django.db.models.Model, str)
+    """
+    job_types = {model._meta.label: model for model in apps.get_models()
+                 if issubclass(model, ProteinsPlusJob)}
+    # look in all job tables with a single query
+    querysets = [
+        job_type.objects.filter(id=job_id).annotate(
+            job_type=Value(label, output_field=CharField())).values_list('job_type', 'status')
+        for label, job_type in job_types.items()
+    ]
+    rows = list(querysets[0].union(*querysets[1:], all=True))
+    if not rows:
+        raise Http404('No job with the given id exists')
+    label, job_status = rows[0]
+    return job_types[label], job_status
+
+
+@extend_schema_view(
+    list=extend_schema(parameters=[SparseFieldsetQuerySerializer, ExpandQuerySerializer]),
+    retrieve=extend_schema(parameters=[SparseFieldsetQuerySerializer, ExpandQuerySerializer]),
+)
+class ProteinsPlusReadOnlyViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+    """Read only model viewset supporting sparse fieldsets
+
+    The "fields" and "omit" query parameters select the serializer fields of the response. Fields
+    listed in heavy_fields are left out of list responses unless they are selected explicitly and
+    their model fields are deferred whenever they are not part of the response.
+
+    The "expand" query parameter replaces the related fields listed in expandable_fields by nested
+    objects. Nested fields are given as dotted paths. The related objects are loaded with
+    select_related or prefetch_related, so the number of queries does not depend on their number.
+
+    Retrieve responses carry an ETag built from the etag_fields of the object. Requests with a
+    matching If-None-Match header are answered with 304 before the object is loaded and serialized.
+    """
+    # serializer field name -> model fields that are only loaded if the serializer field is returned
+    heavy_fields = {}
+    # model fields which change whenever the representation of an object changes
+    etag_fields = []
+    # whether objects never change after their creation, e.g. the outputs of finished jobs
+    immutable = False
+    # dotted serializer field path -> serializer of the nested objects and the lookups loading them
+    expandable_fields = {}
+
+    @cached_property
+    def selected_fields(self):
+        """Names of the serializer fields that are part of the response
+
+        :raises ValidationError: If the query parameters name unknown fields
+        :return: selected field names
+        :rtype: set(str)
+        """
+        available = set(self.get_serializer_class()().fields)
+        if getattr(self, 'swagger_fake_view', False):
+            return available
+        serializer = SparseFieldsetQuerySerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        fields = serializer.validated_data.get('fields') or None
+        omit = serializer.validated_data.get('omit') or []
+        unknown = (set(fields or []) | set(omit)) - available
+        if unknown:
+            raise ValidationError(
+                {'fields': f'Unknown fields: {", ".join(sorted(unknown))}'})
+        if fields is not None:
+            selected = set(fields)
+        elif self.action == 'list':
+            selected = available - set(self.heavy_fields)
+        else:
+            selected = available
+        return selected - set(omit)
+
+    @cached_property
+    def expanded_fields(self):
+        """Dotted paths of the expanded fields, parents come before their nested fields
+
+        :raises ValidationError: If the query parameters name fields that cannot be expanded
+        :return: expanded field paths
+        :rtype: list[str]
+        """
+        if getattr(self, 'swagger_fake_view', False):
+            return []
+        serializer = ExpandQuerySerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        expand = serializer.validated_data.get('expand') or []
+        unknown = set(expand) - set(self.expandable_fields)
+        if unknown:
+            raise ValidationError(
+                {'expand': f'Fields cannot be expanded: {", ".join(sorted(unknown))}'})
+        paths = set()
+        for path in expand:
+            parts = path.split('.')
+            paths.update('.'.join(parts[:index]) for index in range(1, len(parts) + 1))
+        return sorted(
+            (path for path in paths if path.split('.')[0] in self.selected_fields),
+            key=lambda path: (path.count('.'), path))
+
+    @staticmethod
+    def is_single_valued(model, lookup):
+        """Check whether a lookup only follows relations to single objects
+
+        :param model: model the lookup starts from
+        :type model: django.db.models.Model
+        :param lookup: related field lookup like "output_protein__file_blob"
+        :type lookup: str
+        :return: Whether the lookup can be loaded with select_related
+        :rtype: bool
+        """
+        for name in lookup.split('__'):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # reverse relations are looked up by their accessor name like "ligand_set"
+                return False
+            if not (field.many_to_one or field.one_to_one):
+                return False
+            model = field.related_model
+        return True
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for path in self.expanded_fields:
+            for lookup in self.expandable_fields[path][1]:
+                if isinstance(lookup, str) and self.is_single_valued(queryset.model, lookup):
+                    queryset = queryset.select_related(lookup)
+                else:
+                    queryset = queryset.prefetch_related(lookup)
+        deferred = [
+            model_field
+            for field, model_fields in self.heavy_fields.items()
+            if field not in self.selected_fields
+            for model_field in model_fields
+        ]
+        if deferred:
+            queryset = queryset.defer(*deferred)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        root_fields = getattr(serializer, 'child', serializer).fields
+        for name in set(root_fields) - self.selected_fields:
+            root_fields.pop(name)
+        for path in self.expanded_fields:
+            *parents, name = path.split('.')
+            fields = root_fields
+            for parent in parents:
+                fields = getattr(fields[parent], 'child', fields[parent]).fields
+            nested_serializer_class = self.expandable_fields[path][0]
+            fields[name] = nested_serializer_class(
+                many=isinstance(fields[name], ManyRelatedField), read_only=True)
+        return serializer
+
+    def get_etag(self):
+        """Build the ETag of the requested object without loading the object
+
+        :return: strong ETag or None if the viewset has no etag_fields or the object does not exist
+        :rtype: str or None
+        """
+        if not self.etag_fields:
+            return None
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        values = self.filter_queryset(super().get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        ).values_list(*self.etag_fields).first()
+        if values is None:
+            return None
+        hasher = blake2b(digest_size=16)
+        for value in values:
+            hasher.update(str(value).encode('utf-8'))
+            hasher.update(b'_')
+        hasher.update(','.join(sorted(self.selected_fields)).encode('utf-8'))
+        hasher.update(b'_')
+        hasher.update(','.join(self.expanded_fields).encode('utf-8'))
+        hasher.update(b'_')
+        hasher.update(self.request.accepted_renderer.format.encode('utf-8'))
+        return f'"{hasher.hexdigest()}"'
+
+    def retrieve(self, request, *args, **kwargs):
+        etag = self.get_etag()
+        if etag is None:
+            return super().retrieve(request, *args, **kwargs)
+        known_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        # If-None-Match uses the weak comparison
+        if '*' in known_etags or etag in [tag[2:] if tag.startswith('W/') else tag
+                                          for tag in known_etags]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Cache-Control'] = \
+            IMMUTABLE_CACHE_CONTROL if self.immutable else REVALIDATE_CACHE_CONTROL
+        return response
+
+
+class JobStatusView(APIView):
+    """View for waiting on the status of a job"""
+
+    @extend_schema(
+        parameters=[JobStatusQuerySerializer],
+        responses=JobStatusSerializer,
+    )
+    def get(self, request, job_id):
+        """Get the status of a job of any app.
+
+        To wait for a job to finish without polling, pass the last known "status" and the number
+        of seconds to "wait". The response is sent as soon as the status differs from the given
+        status or when the time is up. If too many clients are waiting already, the current status
+        is returned right away.
+        """
+        serializer = JobStatusQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+
+        job_type, job_status = get_job_status(job_id)
+        known_status = job_status
+        if query['status'] is not None:
+            known_status = next(
+                key for key, value in Status.DETAILED.items() if value == query['status'])
+        if query['wait'] > 0 and job_status == known_status \
+                and _status_waiters.acquire(blocking=False):
+            try:
+                job_status = wait_for_status_change(
+                    job_type, job_id, known_status, query['wait'])
+            except job_type.DoesNotExist:
+                raise Http404('No job with the given id exists') from None
+            finally:
+                _status_waiters.release()
+        serializer = JobStatusSerializer({'job_id': job_id, 'status': job_status})
+        return Response(serializer.data)
+
+
+class JobCancelView(APIView):
+    """View for cancelling a job"""
+
+    @extend_schema(
+        request=None,
+        responses={200: JobStatusSerializer, 409: JobStatusSerializer},
+    )
+    def post(self, request, job_id):  # pylint: disable=unused-argument
+        """Cancel a pending or running job of any app.
+
+        The job fails right away and a running binary is killed. Jobs that have already finished
+        cannot be cancelled and are answered with status code 409.
+        """
+        job_type, job_status = get_job_status(job_id)
+        if cancel_job(job_type, job_id):
+            job_status = Status.FAILURE
+            response_status = status.HTTP_200_OK
+        else:
+            response_status = status.HTTP_409_CONFLICT
+        serializer = JobStatusSerializer({'job_id': job_id, 'status': job_status})
+        return Response(serializer.data, status=response_status)
+
+
+class JobStatusEventsView(APIView):
+    """View streaming the status changes of a job as server-sent events"""
+
+    @extend_schema(
+        responses={(200, 'text/event-stream'): OpenApiTypes.STR},
+    )
+    def get(self, request, job_id):  # pylint: disable=unused-argument
+        """Stream the status changes of a job of any app as server-sent events.
+
+        Every event carries the job id and its status. The stream ends when the job has finished
+        or after a few minutes, after which clients like EventSource reconnect automatically. If too
+        many clients are waiting already, the stream ends after the current status and asks the
+        client to reconnect a few seconds later.
+        """
+        job_type, job_status = get_job_status(job_id)
+        response = StreamingHttpResponse(
+            self.stream_events(job_type, job_id, job_status),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # keep reverse proxies from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    def stream_events(job_type, job_id, job_status):
+        """Generate server-sent events for every status change of a job
+
+        :param job_type: Database table in which to find the job object
+        :type job_type: django.db.models.Model
+        :param job_id: Id of the job object
+        :type job_id: uuid.UUID
+        :param job_status: current status abbreviation of the job
+        :type job_status: str
+        :return: encoded events
+        :rtype: generator
+        """
+        data = JobStatusSerializer({'job_id': job_id, 'status': job_status}).data
+        if job_status in Status.FINISHED:
+            yield f'event: status\ndata: {json.dumps(data)}\n\n'.encode()
+            return
+        if not _status_waiters.acquire(blocking=False):
+            yield (f'retry: {settings.JOB_STATUS_BUSY_RETRY * 1000}\n'
+                   f'event: status\ndata: {json.dumps(data)}\n\n').encode()
+            return
+        try:
+            deadline = time.monotonic() + settings.JOB_STATUS_STREAM_TIME
+            while True:
+                data = JobStatusSerializer({'job_id': job_id, 'status': job_status}).data
+                yield f'event: status\ndata: {json.dumps(data)}\n\n'.encode()
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if job_status in Status.FINISHED or remaining <= 0:
+                        return
+                    try:
+                        new_status = wait_for_status_change(
+                            job_type, job_id, job_status,
+                            min(remaining, settings.JOB_STATUS_MAX_WAIT))
+                    except job_type.DoesNotExist:
+                        return
+                    if new_status != job_status:
+                        job_status = new_status
+                        break
+                    # comment lines keep idle connections from being closed
+                    yield b': keep-alive\n\n'
+        finally:
+            _status_waiters.release()
+
+
+def is_metrics_client(request):
+    """Check whether a request may read the metrics
+
+    Requests reach the server through the reverse proxy, so the client address cannot be used to
+    identify scrapers. They have to send METRICS_TOKEN as bearer token instead.
+
+    :param request: the http request
+    :type request: django.http.HttpRequest
+    :return: True if METRICS_TOKEN is set and the request carries it
+    :rtype: bool
+    """
+    if not settings.METRICS_TOKEN:
+        return False
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    return hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(), expected.encode())
+
+
+def metrics(request):
+    """Export the metrics of all server and worker processes in the Prometheus text format
+
+    Only requests carrying the METRICS_TOKEN bearer token may read the metrics.
+
+    :param request: the http request
+    :type request: django.http.HttpRequest
+    :return: the metrics or 403 if the request is not allowed
+    :rtype: django.http.HttpResponse
+    """
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protoss', '0002_job_timings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='protossjob',
+            index=models.Index(fields=['date_created', 'id'], name='protoss_pro_date_cr_7b95e2_idx'),
+        ),
+    ]
@@ -2,10 +2,11 @@
 import os
 import logging
 from pathlib import Path
-import subprocess
 from tempfile import TemporaryDirectory
 
 from django.conf import settings
+from django.db import transaction
+from proteins_plus.job_handler import Phase, record_phase, run_subprocess
 
 from molecule_handler.models import Protein
 from molecule_handler.utils import load_processed_ligands
@@ -25,8 +26,10 @@ class ProtossWrapper:
         """
         with TemporaryDirectory() as directory:
             dir_path = Path(directory)
-            ProtossWrapper.execute_protoss(job, dir_path)
-            ProtossWrapper.load_results(job, dir_path)
+            with record_phase(job, Phase.INPUT_STAGING):
+                ProtossWrapper.execute_protoss(job, dir_path)
+            with record_phase(job, Phase.RESULT_LOADING):
+                ProtossWrapper.load_results(job, dir_path)
 
     @staticmethod
     def execute_protoss(job, directory):
@@ -56,8 +59,7 @@ class ProtossWrapper:
                          '--ligand_output',
                          os.path.join(str(directory.absolute()), 'ligand_out.sdf')])
 
-        logger.info('Executing command line call: %s', " ".join(args))
-        subprocess.check_call(args)
+        run_subprocess(job, args)
 
     @staticmethod
     def load_results(job, path):
@@ -68,9 +70,10 @@ class ProtossWrapper:
         :param path: Path to the output directory
         :type path: Path
         """
-        ProtossWrapper.load_protossed_protein(job, path)
-        load_processed_ligands(path, job.output_protein)
-        job.save()
+        with transaction.atomic():
+            ProtossWrapper.load_protossed_protein(job, path)
+            load_processed_ligands(path, job.output_protein)
+            job.save()
 
     @staticmethod
     def load_protossed_protein(job, path):
@@ -12,7 +12,7 @@ def protoss_protein_task(job_id):
     :param job_id: Database id of the job object to be executed
     :type job_id: int
     """
-    execute_job(protoss_protein, job_id, ProtossJob, 'Protoss')
+    execute_job(protoss_protein, job_id, ProtossJob, 'Protoss', binary='protoss')
 
 
 def protoss_protein(job):
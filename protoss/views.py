@@ -1,14 +1,15 @@
 """protoss api views"""
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema
 
 from proteins_plus.serializers import ProteinsPlusJobResponseSerializer
 from proteins_plus.job_handler import submit_task
+from proteins_plus.views import ProteinsPlusReadOnlyViewSet
 from molecule_handler.models import Protein, Ligand
+from molecule_handler.serializers import ProteinSerializer
 from .models import ProtossJob
 from .serializers import ProtossJobSerializer, ProtossSubmitSerializer
 from .tasks import protoss_protein_task
@@ -68,7 +69,11 @@ class ProtossView(APIView):
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class ProtossJobViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class ProtossJobViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all Protoss jobs"""
     queryset = ProtossJob.objects.all()
     serializer_class = ProtossJobSerializer
+    expandable_fields = {
+        'output_protein': (
+            ProteinSerializer, ['output_protein__file_blob', 'output_protein__ligand_set']),
+    }
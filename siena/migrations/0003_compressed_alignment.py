@@ -0,0 +1,45 @@
+# Generated by Django 3.2.7 on 2026-10-17 16:10
+
+from django.db import migrations, models
+import proteins_plus.fields
+
+APP_LABEL = 'siena'
+FIELDS = [
+    ('sienainfo', 'alignment'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('siena', '0002_job_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sienainfo',
+            name='alignment_compressed',
+            field=proteins_plus.fields.CompressedTextField(null=True),
+        ),
+        proteins_plus.fields.compress_field_values(APP_LABEL, FIELDS),
+        # the defaults allow to add the plain fields again when migrating backwards
+        migrations.AlterField(
+            model_name='sienainfo',
+            name='alignment',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='sienainfo',
+            name='alignment',
+        ),
+        migrations.RenameField(
+            model_name='sienainfo',
+            old_name='alignment_compressed',
+            new_name='alignment',
+        ),
+        migrations.AlterField(
+            model_name='sienainfo',
+            name='alignment',
+            field=proteins_plus.fields.CompressedTextField(),
+        ),
+    ]
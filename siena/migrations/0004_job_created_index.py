@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('siena', '0003_compressed_alignment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sienajob',
+            index=models.Index(fields=['date_created', 'id'], name='siena_siena_date_cr_992863_idx'),
+        ),
+    ]
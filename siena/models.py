@@ -1,6 +1,7 @@
 """SIENA database models"""
 from django.db import models
 
+from proteins_plus.fields import CompressedTextField
 from proteins_plus.models import ProteinsPlusJob, ProteinsPlusBaseModel
 from molecule_handler.models import Ligand, Protein, ProteinSite
 
@@ -14,7 +15,7 @@ class SienaInfo(ProteinsPlusBaseModel):
     # holds the SIENA resultStatistic.csv as a JSON dict
     statistic = models.JSONField()
     # holds the SIENA alignment.txt file as a file_string
-    alignment = models.TextField()
+    alignment = CompressedTextField()
 
 
 class SienaJob(ProteinsPlusJob):
@@ -43,6 +44,6 @@ class SienaJob(ProteinsPlusJob):
         :return: All ligands of the binding site ensemble determined by SIENA.
         :rtype: generator yielding tuples
         """
-        for protein in self.output_proteins.all():
-            for ligand in Ligand.objects.filter(protein=protein):
+        for protein in self.output_proteins.prefetch_related('ligand_set'):
+            for ligand in protein.ligand_set.all():
                 yield ligand, protein
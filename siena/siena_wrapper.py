@@ -1,11 +1,12 @@
 """A django model friendly wrapper around SIENA binary"""
 import logging
 import csv
-import subprocess
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
 from django.conf import settings
+from django.db import transaction
+from proteins_plus.job_handler import Phase, record_phase, run_subprocess
 from molecule_handler.models import Protein, Ligand
 from siena.models import SienaInfo
 from siena.settings import SienaSettings
@@ -26,8 +27,10 @@ class SienaWrapper:
         """
         with TemporaryDirectory() as directory:
             dir_path = Path(directory)
-            SienaWrapper.execute_siena(job, dir_path)
-            SienaWrapper.load_results(job, dir_path)
+            with record_phase(job, Phase.INPUT_STAGING):
+                SienaWrapper.execute_siena(job, dir_path)
+            with record_phase(job, Phase.RESULT_LOADING):
+                SienaWrapper.load_results(job, dir_path)
 
     @staticmethod
     def execute_siena(job, directory):
@@ -65,8 +68,7 @@ class SienaWrapper:
                 raise ValueError('No valid input binding site specification')
             args.append(tmp_file.name)
 
-            logger.info('Executing command line call: %s', " ".join(args))
-            subprocess.check_call(args)
+            run_subprocess(job, args)
 
     @staticmethod
     def load_results(job, path):
@@ -85,12 +87,12 @@ class SienaWrapper:
             return
         output_info = SienaInfo(parent_siena_job=job, statistic=statistic_dict,
                                 alignment=SienaWrapper.load_result_alignment(path))
-        output_info.save()
-        job.output_info = output_info
         pdb_files, sdf_files_dict = SienaWrapper.load_result_proteins_and_ligands(path,
                                                                                   nof_siena_hits)
         # Put Siena results into Protein and Ligand models.
         # Ligand models are associated with their respective Protein model.
+        proteins = []
+        ligands = []
         for pdb_file_path in pdb_files:
             with pdb_file_path.open('r') as pdb_file:
                 pdb_string = pdb_file.read()
@@ -98,18 +100,23 @@ class SienaWrapper:
             protein = Protein(name=file_basename,
                               file_type='pdb',
                               file_string=pdb_string)
-            protein.save()
+            proteins.append(protein)
             if file_basename in sdf_files_dict:
                 ligand_file_path = sdf_files_dict[file_basename]
                 with open(ligand_file_path, 'r', encoding='utf8') as ligand_file:
-                    ligand = Ligand(protein=protein,
-                                    name=file_basename,
-                                    file_type='sdf',
-                                    file_string=ligand_file.read())
-                ligand.save()
-            job.output_proteins.add(protein)
-
-        job.save()
+                    ligands.append(Ligand(protein=protein,
+                                          name=file_basename,
+                                          file_type='sdf',
+                                          file_string=ligand_file.read()))
+
+        # the whole ensemble is inserted with a constant number of queries
+        with transaction.atomic():
+            output_info.save()
+            job.output_info = output_info
+            Protein.bulk_create(proteins)
+            Ligand.bulk_create(ligands)
+            job.output_proteins.add(*proteins)
+            job.save()
 
     @staticmethod
     def load_result_proteins_and_ligands(path, nof_results):
@@ -12,7 +12,7 @@ def siena_protein_task(job_id):
     :param job_id: Database id of the job object to be executed
     :type job_id: uuid
     """
-    execute_job(siena_protein, job_id, SienaJob, 'Siena')
+    execute_job(siena_protein, job_id, SienaJob, 'Siena', binary='siena')
 
 
 def siena_protein(job):
@@ -1,4 +1,10 @@
 """tests for siena tasks"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from molecule_handler.models import Ligand
 from molecule_handler.protein_site_handler import ProteinSiteHandler
 from molecule_handler.test.utils import create_test_protein
 from proteins_plus.job_handler import Status
@@ -8,6 +14,7 @@ from .utils import create_test_siena_job, TmpSienaDB
 from ..tasks import siena_protein_task
 from ..models import SienaJob
 from ..settings import SienaSettings
+from ..siena_wrapper import SienaWrapper
 
 
 class TaskTests(PPlusTestCase):
@@ -136,3 +143,40 @@ class TaskTests(PPlusTestCase):
         siena_job = SienaJob.objects.get(id=job.id)
         self.assertEqual(siena_job.status, Status.SUCCESS)
         self.assertIsNone(siena_job.error)
+
+    def test_load_results(self):
+        """Test loading SIENA ensembles of any size with a constant number of queries"""
+        with TestConfig.protein_file_4agm.open() as protein_file:
+            protein_string = protein_file.read()
+        with TestConfig.ligand_file_4agm.open() as ligand_file:
+            ligand_string = ligand_file.read()
+
+        query_counts = []
+        for nof_hits in (1, 5):
+            job = create_test_siena_job()
+            with TemporaryDirectory() as directory:
+                path = Path(directory)
+                (path / 'ensemble').mkdir()
+                (path / 'ligands').mkdir()
+                statistic = ['Hit;Score']
+                for index in range(nof_hits):
+                    statistic.append(f'{index};{index}')
+                    (path / 'ensemble' / f'hit_{index}.pdb').write_text(
+                        f'REMARK {index}\n{protein_string}')
+                    (path / 'ligands' / f'hit_{index}.sdf').write_text(ligand_string)
+                (path / 'resultStatistic.csv').write_text('\n'.join(statistic) + '\n')
+                (path / 'alignment.txt').write_text('Alignment')
+
+                with CaptureQueriesContext(connection) as queries:
+                    SienaWrapper.load_results(job, path)
+                query_counts.append(len(queries))
+
+            job = SienaJob.objects.get(pk=job.id)
+            self.assertEqual(job.output_info.alignment, 'Alignment')
+            self.assertEqual(job.output_proteins.count(), nof_hits)
+            self.assertEqual(Ligand.objects.filter(protein__parent_siena_job=job).count(), nof_hits)
+            for protein in job.output_proteins.all():
+                index = protein.name.split('_')[1]
+                self.assertEqual(protein.file_string, f'REMARK {index}\n{protein_string}')
+                self.assertEqual(protein.ligand_set.get().file_string, ligand_string)
+        self.assertEqual(query_counts[0], query_counts[1])
@@ -1,5 +1,9 @@
 """tests for siena views"""
+import io
 import json
+import tarfile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from proteins_plus.test.utils import PPlusTestCase, call_api
 from molecule_handler.test.utils import create_test_protein, create_test_ligand, \
@@ -149,3 +153,70 @@ class ViewTests(PPlusTestCase):
         )
         for field in fields:
             self.assertIn(field, response.data)
+
+    def test_download_ensemble(self):
+        """Test streaming the ensemble of a SIENA job as tar archive"""
+        job = create_successful_siena_job()
+        response = call_api(
+            SienaJobViewSet,
+            'get',
+            viewset_actions={'get': 'download_ensemble'},
+            headers={'HTTP_ACCEPT_ENCODING': 'gzip'},
+            pk=job.id
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = io.BytesIO(b''.join(response.streaming_content))
+        with tarfile.open(fileobj=content, mode='r:gz') as archive:
+            names = archive.getnames()
+            for protein in job.output_proteins.all():
+                name = f'{protein.name}.{protein.file_type}'
+                self.assertIn(name, names)
+                self.assertEqual(archive.extractfile(name).read().decode(), protein.file_string)
+            for ligand, protein in job.get_ensemble_ligands():
+                self.assertIn(f'{protein.name}_{ligand.name}.{ligand.file_type}', names)
+
+    def test_expand_siena_job(self):
+        """Test expanding the outputs of a SIENA job with a fixed number of queries"""
+        small_job = create_successful_siena_job()
+        large_job = create_successful_siena_job()
+        for _ in range(3):
+            protein = create_test_protein(TestConfig.protein_4agm)
+            protein.save()
+            create_test_ligand(protein).save()
+            large_job.output_proteins.add(protein)
+
+        query_params = {'expand': 'output_info,output_proteins.ligand_set'}
+        query_counts = []
+        for job in (small_job, large_job):
+            with CaptureQueriesContext(connection) as queries:
+                response = call_api(
+                    SienaJobViewSet, 'get', viewset_actions={'get': 'retrieve'},
+                    query_params=query_params, pk=job.id)
+                self.assertEqual(response.status_code, 200)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+        data = response.data
+        self.assertEqual(data['output_info']['id'], str(large_job.output_info.id))
+        self.assertEqual(data['output_info']['alignment'], 'Alignment')
+        self.assertEqual(len(data['output_proteins']), 4)
+        for protein_data in data['output_proteins']:
+            protein = large_job.output_proteins.get(id=protein_data['id'])
+            self.assertEqual(protein_data['file_string'], protein.file_string)
+            self.assertEqual(len(protein_data['ligand_set']), 1)
+            ligand = protein.ligand_set.get()
+            self.assertEqual(protein_data['ligand_set'][0]['id'], str(ligand.id))
+            self.assertEqual(protein_data['ligand_set'][0]['file_string'], ligand.file_string)
+
+        response = call_api(
+            SienaJobViewSet, 'get', viewset_actions={'get': 'list'}, query_params=query_params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        for job_data in response.data['results']:
+            self.assertIsInstance(job_data['output_info'], dict)
+
+        response = call_api(
+            SienaJobViewSet, 'get', viewset_actions={'get': 'retrieve'},
+            query_params={'expand': 'input_protein'}, pk=small_job.id)
+        self.assertEqual(response.status_code, 400)
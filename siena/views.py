@@ -1,14 +1,19 @@
 """siena api views"""
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
 from rest_framework import status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import extend_schema, OpenApiTypes
 
 from proteins_plus.serializers import ProteinsPlusJobResponseSerializer
 from proteins_plus.job_handler import submit_task
+from proteins_plus.downloads import CompressedContent, annotate_compressed_sizes, tar_response
+from proteins_plus.views import ProteinsPlusReadOnlyViewSet
 from molecule_handler.models import Protein, Ligand, ProteinSite
+from molecule_handler.serializers import LigandSerializer, ProteinSerializer
 
 from .models import SienaJob, SienaInfo
 from .tasks import siena_protein_task
@@ -86,13 +91,58 @@ class SienaView(APIView):
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class SienaJobViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class SienaJobViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all Siena job"""
     queryset = SienaJob.objects.all()
     serializer_class = SienaJobSerializer
-
-
-class SienaInfoViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+    expandable_fields = {
+        'output_info': (SienaInfoSerializer, ['output_info']),
+        'output_proteins': (ProteinSerializer, [
+            Prefetch('output_proteins', Protein.objects.select_related('file_blob')),
+            'output_proteins__ligand_set'
+        ]),
+        'output_proteins.ligand_set': (LigandSerializer, []),
+    }
+
+    @extend_schema(responses={(200, 'application/x-tar'): OpenApiTypes.BINARY})
+    @action(detail=True, url_path='ensemble')
+    def download_ensemble(self, request, pk=None):
+        """Download the ensemble proteins and their ligands as tar archive.
+
+        The archive is streamed and gzip encoded if the client accepts it.
+        """
+        job = get_object_or_404(SienaJob.objects.only('id'), pk=pk)
+        return tar_response(
+            request, self.ensemble_members(job), f'siena_ensemble_{job.id}.tar')
+
+    @staticmethod
+    def ensemble_members(job):
+        """Generate the files of the ensemble of a SIENA job one after another
+
+        :param job: SIENA job
+        :type job: SienaJob
+        :return: file names and compressed contents
+        :rtype: generator
+        """
+        proteins = annotate_compressed_sizes(
+            job.output_proteins.only('id', 'name', 'file_type'), 'file_blob__content',
+            'file_blob__size')
+        for protein in proteins.iterator(chunk_size=10):
+            yield f'{protein.name}.{protein.file_type}', \
+                CompressedContent.from_object(protein, 'file_blob__content')
+        ligands = annotate_compressed_sizes(
+            Ligand.objects.filter(protein__parent_siena_job=job).select_related('protein').only(
+                'id', 'name', 'file_type', 'protein__id', 'protein__name'),
+            'file_string')
+        for ligand in ligands.iterator(chunk_size=10):
+            yield f'{ligand.protein.name}_{ligand.name}.{ligand.file_type}', \
+                CompressedContent.from_object(ligand, 'file_string')
+
+
+class SienaInfoViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Retrieve specific or list all Siena result info objects"""
     queryset = SienaInfo.objects.all()
     serializer_class = SienaInfoSerializer
+    heavy_fields = {'alignment': ['alignment']}
+    etag_fields = ['id']
+    immutable = True
@@ -38,11 +38,8 @@ if [ ! -f ./redis/redis_6378.pid ]; then
   redis-server ./redis/redis.conf
 fi
 
-check_pid ./celery/run/proteins_plus_worker.pid
-if [ ! -f ./celery/run/proteins_plus_worker.pid ]; then
-  echo 'start celery worker'
-  celery -A proteins_plus multi start proteins_plus_worker --pidfile="$(pwd)/celery/run/%n.pid" --logfile="$(pwd)/celery/log/%n%I.log" --concurrency=16 --loglevel=INFO -O fair
-fi
+echo 'start celery workers'
+python3 manage.py celery_workers start
 
 check_pid ./gunicorn/gunicorn.pid
 if [ ! -f ./gunicorn/gunicorn.pid ]; then
@@ -6,10 +6,8 @@ if [ -f ./gunicorn/gunicorn.pid ]; then
   kill $(cat ./gunicorn/gunicorn.pid)
 fi
 
-if [ -f ./celery/run/proteins_plus_worker.pid ]; then
-  echo 'stop celery worker'
-  celery -A proteins_plus multi stop proteins_plus_worker --pidfile="$(pwd)/celery/run/%n.pid" --logfile="$(pwd)/celery/log/%n%I.log" --loglevel=INFO
-fi
+echo 'stop celery workers'
+python3 manage.py celery_workers stop
 
 if [ -f ./redis/redis_6378.pid ]; then
   echo 'stop redis'
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structureprofiler', '0002_job_timings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='structureprofilerjob',
+            index=models.Index(fields=['date_created', 'id'], name='structurepr_date_cr_6a7715_idx'),
+        ),
+    ]
@@ -1,10 +1,10 @@
 """A django model friendly wrapper around the StructureProfiler binary"""
 import logging
 import csv
-import subprocess
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from django.conf import settings
+from proteins_plus.job_handler import Phase, record_phase, run_subprocess
 from structureprofiler.models import StructureProfilerOutput
 logger = logging.getLogger(__name__)
 
@@ -74,8 +74,10 @@ class StructureProfilerWrapper:
         """
         with TemporaryDirectory() as directory:
             dir_path = Path(directory)
-            StructureProfilerWrapper.execute_structureprofiler(job, dir_path)
-            StructureProfilerWrapper.load_results(job, dir_path)
+            with record_phase(job, Phase.INPUT_STAGING):
+                StructureProfilerWrapper.execute_structureprofiler(job, dir_path)
+            with record_phase(job, Phase.RESULT_LOADING):
+                StructureProfilerWrapper.load_results(job, dir_path)
 
     @staticmethod
     def execute_structureprofiler(job, dir_path):
@@ -105,8 +107,7 @@ class StructureProfilerWrapper:
         if ligand_file:
             args.extend(['--ligand', ligand_file.name])
 
-        logger.debug('Executing command line call: %s', " ".join(args))
-        subprocess.check_call(args)
+        run_subprocess(job, args)
 
     @staticmethod
     def data_collection(cast_to, key, data, row):
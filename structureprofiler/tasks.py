@@ -1,6 +1,6 @@
 """Structureprofiler celery tasks"""
 from celery import shared_task
-from proteins_plus.job_handler import execute_job
+from proteins_plus.job_handler import Phase, execute_job, record_phase
 from molecule_handler.models import ElectronDensityMap
 from .models import StructureProfilerJob
 from .structureprofiler_wrapper import StructureProfilerWrapper
@@ -12,7 +12,8 @@ def structureprofiler_protein_task(job_id):
     :param job_id: Database id of the job object to be executed
     :type job_id: int
     """
-    execute_job(structureprofiler_protein, job_id, StructureProfilerJob, 'StructureProfiler')
+    execute_job(structureprofiler_protein, job_id, StructureProfilerJob, 'StructureProfiler',
+                binary='structureprofiler')
 
 
 def structureprofiler_protein(job):
@@ -23,7 +24,9 @@ def structureprofiler_protein(job):
     :type job: StructureProfilerjob
     """
     if job.electron_density_map is None and job.density_file_pdb_code:
-        job.electron_density_map = ElectronDensityMap.from_pdb_code(job.density_file_pdb_code)
+        with record_phase(job, Phase.EXTERNAL_FETCH):
+            job.electron_density_map = ElectronDensityMap.from_pdb_code(
+                job.density_file_pdb_code)
         if not job.electron_density_map:
             raise RuntimeError(
                 f"Error while retrieving density file with pdb code {job.density_file_pdb_code}\n"
@@ -1,13 +1,13 @@
 """structureprofiler api views"""
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema
 
 from proteins_plus.serializers import ProteinsPlusJobResponseSerializer
 from proteins_plus.job_handler import submit_task
+from proteins_plus.views import ProteinsPlusReadOnlyViewSet
 from molecule_handler.models import Protein, ElectronDensityMap, Ligand
 
 from .models import StructureProfilerOutput, StructureProfilerJob
@@ -89,13 +89,18 @@ class StructureProfilerView(APIView):
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class StructureProfilerJobViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class StructureProfilerJobViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Viewset for retrieving specific or listing all StructureProfiler objects"""
     queryset = StructureProfilerJob.objects.all()
     serializer_class = StructureProfilerJobSerializer
+    expandable_fields = {
+        'output_data': (StructureProfilerOutputSerializer, ['output_data']),
+    }
 
 
-class StructureProfilerOutputViewSet(ReadOnlyModelViewSet):  # pylint: disable=too-many-ancestors
+class StructureProfilerOutputViewSet(ProteinsPlusReadOnlyViewSet):  # pylint: disable=too-many-ancestors
     """Viewset for retrieving specific or listing all StructureProfilerOutput objects"""
     queryset = StructureProfilerOutput.objects.all()
     serializer_class = StructureProfilerOutputSerializer
+    etag_fields = ['id']
+    immutable = True